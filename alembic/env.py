@@ -7,6 +7,9 @@ from alembic import context
 from wg_backend.db.registry import mapper_registry  # noqa
 from wg_backend.models.peer import Peer  # noqa
 from wg_backend.models.user import User  # noqa
+from wg_backend.models.ip_pool import IPFree, IPPool  # noqa
+from wg_backend.models.traffic import PeerTraffic  # noqa
+from wg_backend.models.state import StateVersion  # noqa
 from wg_backend.core.settings import get_settings
 settings = get_settings()
 # this is the Alembic Config object, which provides
@@ -16,8 +19,9 @@ config = context.config
 # This line sets up loggers basically.
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
+""" the ini file interpolates %, passwords of a DATABASE_URL may contain it """
 config.set_section_option(
-    config.config_ini_section, "sqlalchemy.url", str(settings.sqlalchemy_database_uri)
+    config.config_ini_section, "sqlalchemy.url", str(settings.sqlalchemy_database_uri).replace("%", "%%")
 )
 # add your model's MetaData object here
 # add your model's MetaData object here
@@ -50,6 +54,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=settings.database_is_sqlite,
     )
 
     with context.begin_transaction():
@@ -70,7 +75,12 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        """ sqlite can't alter columns in place, batch mode recreates the table there """
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,37 @@
+"""adding peer traffic
+
+Revision ID: 3f7b2c9d1a60
+Revises: 9d4a6f1c2e85
+Create Date: 2026-10-18 15:20:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7b2c9d1a60'
+down_revision: Union[str, None] = '9d4a6f1c2e85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('peertraffic',
+    sa.Column('peer_id', sa.Uuid(), nullable=False),
+    sa.Column('step', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), nullable=False),
+    sa.Column('rx', sa.BigInteger(), nullable=False),
+    sa.Column('tx', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['peer_id'], ['peer.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('peer_id', 'step', 'bucket'),
+    sqlite_with_rowid=False
+    )
+    op.create_index('ix_peertraffic_step_bucket', 'peertraffic', ['step', 'bucket'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_peertraffic_step_bucket', table_name='peertraffic')
+    op.drop_table('peertraffic')
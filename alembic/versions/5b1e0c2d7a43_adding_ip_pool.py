@@ -0,0 +1,54 @@
+"""adding ip pool
+
+Revision ID: 5b1e0c2d7a43
+Revises: c076e73dc4c1
+Create Date: 2026-10-18 13:10:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e0c2d7a43'
+down_revision: Union[str, None] = 'c076e73dc4c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ippool',
+    sa.Column('interface_id', sa.Integer(), nullable=False),
+    sa.Column('subnet', sa.String(length=64), nullable=False),
+    sa.Column('next_offset', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.ForeignKeyConstraint(['interface_id'], ['wginterface.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ippool_created_at'), 'ippool', ['created_at'], unique=False)
+    op.create_index(op.f('ix_ippool_id'), 'ippool', ['id'], unique=True)
+    op.create_index(op.f('ix_ippool_interface_id'), 'ippool', ['interface_id'], unique=True)
+    op.create_index(op.f('ix_ippool_updated_at'), 'ippool', ['updated_at'], unique=False)
+    op.create_table('ipfree',
+    sa.Column('interface_id', sa.Integer(), nullable=False),
+    sa.Column('offset', sa.BigInteger(), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.ForeignKeyConstraint(['interface_id'], ['wginterface.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('interface_id', 'offset')
+    )
+    op.create_index(op.f('ix_ipfree_id'), 'ipfree', ['id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ipfree_id'), table_name='ipfree')
+    op.drop_table('ipfree')
+    op.drop_index(op.f('ix_ippool_updated_at'), table_name='ippool')
+    op.drop_index(op.f('ix_ippool_interface_id'), table_name='ippool')
+    op.drop_index(op.f('ix_ippool_id'), table_name='ippool')
+    op.drop_index(op.f('ix_ippool_created_at'), table_name='ippool')
+    op.drop_table('ippool')
@@ -0,0 +1,30 @@
+"""adding state version
+
+Revision ID: 7c2e4a9b5d13
+Revises: 3f7b2c9d1a60
+Create Date: 2026-10-18 17:40:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e4a9b5d13'
+down_revision: Union[str, None] = '3f7b2c9d1a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stateversion',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stateversion')
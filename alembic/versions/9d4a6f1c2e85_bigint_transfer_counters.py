@@ -0,0 +1,31 @@
+"""bigint transfer counters
+
+Revision ID: 9d4a6f1c2e85
+Revises: 5b1e0c2d7a43
+Create Date: 2026-10-18 14:05:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4a6f1c2e85'
+down_revision: Union[str, None] = '5b1e0c2d7a43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # sqlite integers are 64 bit already, a postgresql INTEGER overflows after 2 GiB of traffic
+    with op.batch_alter_table('peer') as batch_op:
+        batch_op.alter_column('transfer_rx', existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False)
+        batch_op.alter_column('transfer_tx', existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('peer') as batch_op:
+        batch_op.alter_column('transfer_tx', existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False)
+        batch_op.alter_column('transfer_rx', existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False)
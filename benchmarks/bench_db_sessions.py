@@ -0,0 +1,161 @@
+"""
+Latency of the `GET /peers` and `GET /users/` database work under concurrent requests, served through a sync
+`Session` on the event loop (the old `SessionDep`) and through an `AsyncSession` (`AsyncSessionDep`).
+`probe p99` is the latency of a request without database work sent alongside, it shows how long the loop stalls.
+
+    python -m benchmarks.bench_db_sessions [concurrency] [requests]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Annotated
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from wg_backend.db import base  # noqa
+from wg_backend.db.registry import mapper_registry
+from wg_backend.models.peer import Peer
+from wg_backend.models.user import User
+from wg_backend.models.wg_interface import WGInterface
+
+PEERS = 5_000
+USERS = 200
+PAGE = 100
+
+PEERS_PAGE = (
+    select(Peer.id, Peer.public_key, Peer.name, Peer.enabled, Peer.created_at, Peer.updated_at)
+    .order_by(Peer.created_at, Peer.id)
+    .limit(PAGE)
+)
+USERS_PAGE = select(User).offset(0).limit(PAGE)
+
+
+def seed(url: str) -> None:
+    engine = create_engine(url)
+    mapper_registry.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(WGInterface(id = 1, private_key = "x", public_key = "y", address = "10.0.0.1", port = 51820,
+                                interface = "wg0"))
+        session.add_all(
+            Peer(name = f"peer-{i}", enabled = True, interface_id = 1, private_key = "x", public_key = f"pk-{i}",
+                 address = f"10.0.{i // 256}.{i % 256}")
+            for i in range(PEERS)
+        )
+        session.add_all(User(username = f"user-{i}", hashed_password = "x") for i in range(USERS))
+        session.commit()
+    engine.dispose()
+
+
+def sync_app(url: str, concurrency: int) -> FastAPI:
+    """ sessions are closed from the threadpool, a pool smaller than the load would starve the blocked loop """
+    engine = create_engine(url, pool_size = concurrency, max_overflow = 0)
+    session_factory = sessionmaker(bind = engine, expire_on_commit = False)
+
+    def get_session():
+        with session_factory() as session:
+            yield session
+
+    app = FastAPI()
+    session_dep = Annotated[Session, Depends(get_session)]
+
+    @app.get("/peers")
+    async def peers(session: session_dep):
+        return [row.name for row in session.execute(PEERS_PAGE).fetchall()]
+
+    @app.get("/users/")
+    async def users(session: session_dep):
+        return [user.username for user in session.scalars(USERS_PAGE).all()]
+
+    @app.get("/probe")
+    async def probe():
+        return None
+
+    return app
+
+
+def async_app(url: str, concurrency: int) -> FastAPI:
+    engine = create_async_engine(url, pool_size = concurrency, max_overflow = 0)
+    session_factory = async_sessionmaker(bind = engine, expire_on_commit = False)
+
+    async def get_session():
+        async with session_factory() as session:
+            yield session
+
+    app = FastAPI()
+    session_dep = Annotated[AsyncSession, Depends(get_session)]
+
+    @app.get("/peers")
+    async def peers(session: session_dep):
+        return [row.name for row in (await session.execute(PEERS_PAGE)).fetchall()]
+
+    @app.get("/users/")
+    async def users(session: session_dep):
+        return [user.username for user in (await session.scalars(USERS_PAGE)).all()]
+
+    @app.get("/probe")
+    async def probe():
+        return None
+
+    return app
+
+
+async def load(app: FastAPI, path: str, concurrency: int, requests: int) -> tuple[list[float], list[float]]:
+    latencies: list[float] = []
+    probe_latencies: list[float] = []
+    queue = iter(range(requests))
+    transport = httpx.ASGITransport(app = app)
+    async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as client:
+        async def worker() -> None:
+            for _ in queue:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+
+        async def prober() -> None:
+            while True:
+                started = time.perf_counter()
+                await client.get("/probe")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.005)
+
+        probe_task = asyncio.create_task(prober())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        probe_task.cancel()
+    return latencies, probe_latencies
+
+
+def percentile(latencies: list[float], q: int) -> float:
+    return statistics.quantiles(latencies, n = 100)[q - 1] * 1000
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed(f"sqlite:///{db_file}")
+    apps = {
+        "sync": sync_app(f"sqlite:///{db_file}", concurrency),
+        "async": async_app(f"sqlite+aiosqlite:///{db_file}", concurrency),
+    }
+    print(f"{concurrency} concurrent clients, {requests} requests per run, {PEERS} peers, {USERS} users")
+    for path in ("/peers", "/users/"):
+        for name, app in apps.items():
+            asyncio.run(load(app, path, concurrency, min(requests, 100)))
+            started = time.perf_counter()
+            latencies, probe_latencies = asyncio.run(load(app, path, concurrency, requests))
+            elapsed = time.perf_counter() - started
+            print(
+                f"{path:<8} {name:<5}  p50 {percentile(latencies, 50):7.2f} ms  p99 {percentile(latencies, 99):7.2f} ms"
+                f"  {requests / elapsed:6.0f} req/s  probe p99 {percentile(probe_latencies, 99):7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Merge of db rows and interface dump done by `GET /peers`.
+
+    python -m benchmarks.bench_full_config
+"""
+import base64
+import datetime
+import os
+import time
+import uuid
+from collections import namedtuple
+
+from wg_backend.api.utils import get_full_config
+from wg_backend.wireguard.base import WGPeerDump
+
+PeerRow = namedtuple("PeerRow", ["id", "public_key", "name", "enabled", "created_at", "updated_at"])
+
+
+def make_data(peers_count: int) -> tuple[list[PeerRow], dict[str, WGPeerDump]]:
+    now = datetime.datetime.now(datetime.UTC)
+    rows = []
+    dump_peers = []
+    for i in range(peers_count):
+        public_key = base64.b64encode(os.urandom(32)).decode()
+        rows.append(PeerRow(uuid.uuid4(), public_key, f"peer-{i}", True, now, None))
+        dump_peers.append(
+            WGPeerDump(
+                public_key = public_key,
+                allowed_ips = f"10.0.{i // 256}.{i % 256}/32",
+                latest_handshake = int(now.timestamp()),
+                transfer_rx = i * 1024,
+                transfer_tx = i * 2048,
+                persistent_keepalive = 25,
+            )
+        )
+    """ the kernel does not return peers in db order """
+    dump_peers.reverse()
+    return rows, {dump_peer.public_key: dump_peer for dump_peer in dump_peers}
+
+
+def main() -> None:
+    for peers_count in (1_000, 10_000, 50_000):
+        rows, dump_index = make_data(peers_count)
+        started = time.perf_counter()
+        full_config = get_full_config(peers_db_data = rows, dump_index = dump_index)
+        elapsed = time.perf_counter() - started
+        assert len(full_config) == peers_count
+        print(f"{peers_count:>6} peers: {elapsed * 1000:9.1f} ms  ({elapsed / peers_count * 1e6:.1f} us/peer)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Several worker processes writing peers into one SQLite file while others page through them, like gunicorn
+workers sharing the database. `default` is a plain engine (rollback journal, deferred transactions, the
+driver's 5s timeout), `tuned` is the storage profile of `wg_backend.db.sqlite`: WAL, a writer taking its
+lock on BEGIN IMMEDIATE and read only connections. `wal` is the same profile with plain (deferred) BEGIN.
+Every write transaction reads before it inserts, as the peer creation does with the IP pool. The driver of
+`default` only opens the transaction at the insert, so its read is not isolated from the other writers.
+
+    python -m benchmarks.bench_sqlite_contention [writers] [readers] [seconds]
+"""
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from wg_backend.db import base  # noqa
+from wg_backend.db.registry import mapper_registry
+from wg_backend.db.sqlite import configure_sqlite_engine
+from wg_backend.models.peer import Peer
+from wg_backend.models.wg_interface import WGInterface
+
+SEED_PEERS = 2_000
+PAGE = 100
+
+PEERS_PAGE = (
+    select(Peer.id, Peer.public_key, Peer.name, Peer.enabled, Peer.created_at, Peer.updated_at)
+    .order_by(Peer.created_at.desc(), Peer.id)
+    .limit(PAGE)
+)
+
+
+def seed(db_file: str) -> None:
+    engine = create_engine(f"sqlite:///{db_file}")
+    mapper_registry.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(WGInterface(id = 1, private_key = "x", public_key = "y", address = "10.0.0.1", port = 51820,
+                                interface = "wg0"))
+        session.add_all(
+            Peer(name = f"peer-{i}", enabled = True, interface_id = 1, private_key = "x", public_key = f"pk-{i}",
+                 address = f"10.0.{i // 256}.{i % 256}")
+            for i in range(SEED_PEERS)
+        )
+        session.commit()
+    engine.dispose()
+
+
+def deferred_transactions(engine):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record) -> None:
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection) -> None:
+        connection.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def make_engine(profile: str, db_file: str, read_only: bool):
+    if profile == "default":
+        return create_engine(f"sqlite:///{db_file}")
+    if read_only:
+        return configure_sqlite_engine(create_engine(f"sqlite:///file:{db_file}?mode=ro&uri=true"), read_only = True)
+    if profile == "wal":
+        return deferred_transactions(configure_sqlite_engine(create_engine(f"sqlite:///{db_file}")))
+    return configure_sqlite_engine(create_engine(f"sqlite:///{db_file}"), begin_immediate = True)
+
+
+def writer(profile: str, db_file: str, deadline: float, results: multiprocessing.Queue) -> None:
+    engine = make_engine(profile, db_file, read_only = False)
+    latencies, errors, i = [], 0, 0
+    while time.time() < deadline:
+        i += 1
+        started = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                count = session.scalar(select(func.count(Peer.id)).where(Peer.interface_id == 1))
+                session.add(Peer(name = f"w{os.getpid()}-{i}", enabled = True, interface_id = 1, private_key = "x",
+                                 public_key = f"pk-{os.getpid()}-{i}", address = f"10.1.0.{count % 256}"))
+                session.commit()
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(("write", latencies, errors))
+
+
+def reader(profile: str, db_file: str, deadline: float, results: multiprocessing.Queue) -> None:
+    engine = make_engine(profile, db_file, read_only = True)
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.execute(PEERS_PAGE).fetchall()
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(("read", latencies, errors))
+
+
+def percentile(latencies: list[float], q: int) -> float:
+    if len(latencies) < 2:
+        return float("nan")
+    return statistics.quantiles(latencies, n = 100)[q - 1] * 1000
+
+
+def run(profile: str, writers: int, readers: int, seconds: float) -> None:
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+    seed(db_file)
+    """ the tuned profile switches the file to WAL once, before the readers open it read only """
+    make_engine(profile, db_file, read_only = False).connect().close()
+    results = multiprocessing.Queue()
+    deadline = time.time() + seconds
+    processes = [
+        multiprocessing.Process(target = target, args = (profile, db_file, deadline, results))
+        for target, count in ((writer, writers), (reader, readers))
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    collected = {"write": ([], 0), "read": ([], 0)}
+    for _ in processes:
+        kind, latencies, errors = results.get()
+        all_latencies, all_errors = collected[kind]
+        collected[kind] = (all_latencies + latencies, all_errors + errors)
+    for process in processes:
+        process.join()
+    for kind, (latencies, errors) in collected.items():
+        print(
+            f"{profile:<8} {kind:<5}  {len(latencies) / seconds:7.0f} ops/s  p50 {percentile(latencies, 50):7.2f} ms"
+            f"  p99 {percentile(latencies, 99):8.2f} ms  locked errors {errors}"
+        )
+
+
+def main() -> None:
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    print(f"{writers} writer and {readers} reader processes, {seconds:.0f}s per profile, {SEED_PEERS} seeded peers")
+    for profile in ("default", "wal", "tuned"):
+        run(profile, writers, readers, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session, exc as sqlalchemy_exceptions
 from tenacity import after_log, before_log, retry, stop_after_attempt, wait_fixed
 from uvicorn import run as uvicorn_run
+from wg_backend.core.metrics import reset_multiprocess_dir
 from wg_backend.core.settings import execute, get_settings
 from wg_backend.crud.crud_user_fn import authenticate, create_user
 from wg_backend.crud.crud_wgserver import crud_wg_interface
@@ -95,6 +96,8 @@ def create_necessary_dirs_with():
         settings.wg_config_dir_path.mkdir(exist_ok = True, mode = settings.app_umask_dirs_oct, parents = True)
         settings.sqlite_dir_path.mkdir(exist_ok = True, mode = settings.app_umask_dirs_oct, parents = True)
         settings.pid_file_dir_path.mkdir(exist_ok = True, mode = settings.app_umask_dirs_oct, parents = True)
+        """ the metrics of the workers of the last run are gone with them """
+        reset_multiprocess_dir()
         if not settings.DEBUG:
             settings.gunicorn_logs_dir_path.mkdir(exist_ok = True, mode = settings.app_umask_dirs_oct, parents = True)
             settings.run_dir_path.mkdir(exist_ok = True, mode = settings.app_umask_dirs_oct, parents = True)
@@ -104,7 +107,8 @@ def create_necessary_dirs_with():
 
 def create_necessary_files():
     try:
-        (settings.sqlite_dir_path / settings.SQLITE_FILE_NAME).touch(exist_ok = True, mode = settings.app_umask_oct)
+        if settings.DATABASE_URL is None:
+            (settings.sqlite_dir_path / settings.SQLITE_FILE_NAME).touch(exist_ok = True, mode = settings.app_umask_oct)
         # settings.gunicorn_pid_file.touch(exist_ok = True, mode = settings.app_umask_oct)
         settings.wg_if_config_file_path.touch(exist_ok = True, mode = settings.app_umask_oct)
         settings.wg_if_peers_config_file_path.touch(exist_ok = True, mode = settings.app_umask_oct)
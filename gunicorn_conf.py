@@ -1,4 +1,3 @@
-import multiprocessing
 import os
 
 from gunicorn.config import (
@@ -17,6 +16,7 @@ from gunicorn.config import (
     WorkerExit,
     WorkerInt,
 )
+from wg_backend.core.metrics import mark_process_dead
 from wg_backend.core.settings import get_settings
 
 settings = get_settings()
@@ -122,18 +122,9 @@ backlog = 2048
 #
 
 """ Worker processes """
-cores = multiprocessing.cpu_count()
-workers_per_core = settings.WORKERS_PER_CORE
-default_web_concurrency = workers_per_core * cores + 1
-
-use_max_workers = settings.MAX_WORKERS if settings.MAX_WORKERS else None
-if settings.WEB_CONCURRENCY:
-    web_concurrency = settings.WEB_CONCURRENCY
-    assert web_concurrency > 0
-else:
-    web_concurrency = max(int(default_web_concurrency), 2)
-    if use_max_workers:
-        web_concurrency = min(web_concurrency, use_max_workers)
+""" the database pools are sized from the same number """
+web_concurrency = settings.web_concurrency
+assert web_concurrency > 0
 
 
 worker_class = 'uvicorn.workers.UvicornH11Worker'
@@ -226,6 +217,8 @@ def post_request(worker, req, environ, resp):
 
 def child_exit(server, worker):
     ChildExit.child_exit(server, worker)
+    """ in progress gauges of the worker stop counting """
+    mark_process_dead(worker.pid)
     # worker.log.debug("%s %s", )
 
 
@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy import select
+from wg_backend.crud import crud_state
+from wg_backend.crud.crud_ip_pool import allocate_addresses
+from wg_backend.crud.crud_peer import crud_peer
+from wg_backend.models.ip_pool import IPFree
+from wg_backend.models.peer import Peer
+
+from tests.conftest import INTERFACE_ID
+
+pytestmark = pytest.mark.anyio
+
+
+def peer_dict(name: str, address: str) -> dict:
+    """ every row of a multi row insert has the same keys """
+    return {
+        "name": name,
+        "enabled": True,
+        "interface_id": INTERFACE_ID,
+        "private_key": f"{name}-private",
+        "public_key": f"{name}-public",
+        "preshared_key": None,
+        "address": address,
+    }
+
+
+async def create_peers(session, names: list[str]) -> list[Peer]:
+    """ what `POST /peers/bulk` does before the interface is touched """
+    addresses = await session.run_sync(allocate_addresses, interface_id = INTERFACE_ID, count = len(names))
+    peers = await crud_peer.create_many(
+        session, objs_in = [peer_dict(name, address) for name, address in zip(names, addresses)]
+    )
+    await session.commit()
+    return peers
+
+
+async def test_create_many_returns_rows_in_input_order(async_session_factory):
+    names = [f"peer-{i:03}" for i in reversed(range(50))]
+    async with async_session_factory() as session:
+        peers = await create_peers(session, names)
+        assert [peer.name for peer in peers] == names
+        assert [peer.public_key for peer in peers] == [f"{name}-public" for name in names]
+        assert len({peer.address for peer in peers}) == len(names)
+        assert all(peer.created_at is not None for peer in peers)
+        assert await crud_state.get_version(session, name = crud_state.PEERS) == 1
+
+
+async def test_discard_many_removes_refused_peers_and_frees_their_addresses(async_session_factory):
+    async with async_session_factory() as session:
+        peers = await create_peers(session, ["a", "b", "c"])
+        refused = peers[1]
+        await crud_peer.discard_many(session, peers = [refused])
+        await session.commit()
+        assert list(await session.scalars(select(Peer.name).order_by(Peer.name))) == ["a", "c"]
+        assert await crud_state.get_version(session, name = crud_state.PEERS) == 2
+        address, = await session.run_sync(allocate_addresses, interface_id = INTERFACE_ID)
+        assert address == refused.address
+
+
+async def test_discard_many_without_peers_changes_nothing(async_session_factory):
+    async with async_session_factory() as session:
+        await create_peers(session, ["a"])
+        await crud_peer.discard_many(session, peers = [])
+        await session.commit()
+        assert await crud_state.get_version(session, name = crud_state.PEERS) == 1
+
+
+async def test_set_enabled_many_returns_only_changed_rows(async_session_factory):
+    async with async_session_factory() as session:
+        peers = await create_peers(session, ["x-1", "x-2", "y-1"])
+        disabled = await crud_peer.set_enabled_many(session, enabled = False, name_prefix = "x-")
+        assert sorted(peer.name for peer in disabled) == ["x-1", "x-2"]
+        assert await crud_peer.set_enabled_many(session, enabled = False, name_prefix = "x-") == []
+        enabled = await crud_peer.set_enabled_many(session, enabled = True, ids = [peers[0].id])
+        assert [peer.name for peer in enabled] == ["x-1"]
+        assert await crud_state.get_version(session, name = crud_state.PEERS) == 3
+
+
+async def test_set_enabled_many_with_a_selector_in_the_target_state_changes_nothing(async_session_factory):
+    async with async_session_factory() as session:
+        await create_peers(session, ["a", "b"])
+        await crud_peer.set_enabled_many(session, enabled = False, name_prefix = "b")
+        assert await crud_peer.set_enabled_many(session, enabled = True, selected_enabled = True) == []
+        assert await crud_peer.set_enabled_many(session, enabled = False, selected_enabled = False) == []
+        assert list(await session.scalars(select(Peer.name).where(Peer.enabled == True))) == ["a"]  # noqa: E712
+        disabled = await crud_peer.set_enabled_many(session, enabled = False, selected_enabled = True)
+        assert [peer.name for peer in disabled] == ["a"]
+
+
+async def test_remove_many_frees_addresses(async_session_factory):
+    async with async_session_factory() as session:
+        peers = await create_peers(session, ["x-1", "x-2", "y-1"])
+        rows = await crud_peer.remove_many(session, name_prefix = "x-")
+        assert sorted(row.public_key for row in rows) == ["x-1-public", "x-2-public"]
+        assert list(await session.scalars(select(Peer.name))) == ["y-1"]
+        freed = set(await session.scalars(select(IPFree.offset)))
+        assert len(freed) == 2
+        addresses = await session.run_sync(allocate_addresses, interface_id = INTERFACE_ID, count = 2)
+        assert set(addresses) == {peer.address for peer in peers[:2]}
+
+
+async def test_remove_many_with_a_selector_matching_nothing(async_session_factory):
+    async with async_session_factory() as session:
+        await create_peers(session, ["a"])
+        assert await crud_peer.remove_many(session, name_prefix = "missing") == []
+        assert await crud_state.get_version(session, name = crud_state.PEERS) == 1
+
+
+async def test_get_page_walks_every_peer_once(async_session_factory):
+    async with async_session_factory() as session:
+        peers = await create_peers(session, [f"peer-{i}" for i in range(25)])
+        seen = []
+        after = None
+        while page := await crud_peer.get_page(session, limit = 10, after = after):
+            seen.extend(row.id for row in page)
+            after = (page[-1].created_at, page[-1].id)
+        assert sorted(seen) == sorted(peer.id for peer in peers)
+        assert len(seen) == len(set(seen))
+
+
+async def test_count_by_interface(async_session_factory):
+    async with async_session_factory() as session:
+        await create_peers(session, ["a", "b", "c"])
+        await crud_peer.set_enabled_many(session, enabled = False, name_prefix = "a")
+        assert await crud_peer.count_by_interface(session) == [("wg0", 3, 2)]
@@ -0,0 +1,120 @@
+import threading
+from ipaddress import ip_interface
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from wg_backend.core.settings import get_settings
+from wg_backend.crud.crud_ip_pool import allocate_addresses, release_addresses
+from wg_backend.models.ip_pool import IPPool
+from wg_backend.models.peer import Peer
+
+from tests.conftest import INTERFACE_ID
+
+
+@pytest.fixture(autouse = True)
+def subnet(monkeypatch):
+    """ 10.9.0.0/28, .0 and .15 are never handed out and .1 is the interface own address """
+    monkeypatch.setattr(get_settings(), "WG_SUBNET", ip_interface("10.9.0.1/28"))
+
+
+def allocate(session_factory, count: int = 1) -> list[str]:
+    with session_factory() as session:
+        addresses = allocate_addresses(session, interface_id = INTERFACE_ID, count = count)
+        session.commit()
+    return addresses
+
+
+def usable_addresses() -> list[str]:
+    return [f"10.9.0.{host}" for host in range(2, 15)]
+
+
+def release(session_factory, addresses: list[str]) -> None:
+    with session_factory() as session:
+        release_addresses(session, interface_id = INTERFACE_ID, addresses = addresses)
+        session.commit()
+
+
+def test_allocates_in_order_and_skips_reserved_addresses(session_factory):
+    assert allocate(session_factory) == ["10.9.0.2"]
+    assert allocate(session_factory, 3) == ["10.9.0.3", "10.9.0.4", "10.9.0.5"]
+    with session_factory() as session:
+        pool = session.execute(select(IPPool)).scalar_one()
+        assert (pool.subnet, pool.next_offset) == ("10.9.0.0/28", 6)
+
+
+def test_first_allocation_seeds_the_pool_from_existing_peers(session_factory):
+    with session_factory() as session:
+        session.add_all(
+            Peer(
+                name = address,
+                enabled = True,
+                interface_id = INTERFACE_ID,
+                private_key = "private",
+                public_key = address,
+                address = address,
+            )
+            for address in ["10.9.0.2", "10.9.0.4", "192.168.1.10"]
+        )
+        session.commit()
+    assert allocate(session_factory, 3) == ["10.9.0.3", "10.9.0.5", "10.9.0.6"]
+
+
+def test_exhausted_pool_refuses_allocations(session_factory):
+    assert allocate(session_factory, 12) == usable_addresses()[:12]
+    """ a batch larger than what is left takes nothing """
+    with pytest.raises(HTTPException) as e:
+        allocate(session_factory, 2)
+    assert e.value.detail == "Maximum number of peers reached."
+    assert allocate(session_factory) == usable_addresses()[12:]
+    with pytest.raises(HTTPException):
+        allocate(session_factory)
+
+
+def test_released_addresses_are_reused_first(session_factory):
+    allocate(session_factory, 5)
+    release(session_factory, ["10.9.0.4", "10.9.0.2"])
+    assert allocate(session_factory, 3) == ["10.9.0.2", "10.9.0.4", "10.9.0.7"]
+
+
+def test_release_ignores_addresses_the_pool_never_handed_out(session_factory):
+    allocate(session_factory, 2)
+    release(session_factory, ["10.9.0.1", "10.9.0.9", "192.168.1.10", "not an address"])
+    assert allocate(session_factory) == ["10.9.0.4"]
+
+
+def test_released_addresses_keep_an_exhausted_pool_usable(session_factory):
+    allocate(session_factory, 13)
+    release(session_factory, ["10.9.0.8"])
+    assert allocate(session_factory) == ["10.9.0.8"]
+
+
+def test_concurrent_allocations_never_share_an_address(session_factory, monkeypatch):
+    monkeypatch.setattr(get_settings(), "WG_SUBNET", ip_interface("10.9.0.1/24"))
+    """ the pool is seeded first, a seeding race is retried by design and only slows the test down """
+    allocate(session_factory)
+    release(session_factory, ["10.9.0.2"])
+    workers = 4
+    rounds = 10
+    barrier = threading.Barrier(workers)
+    allocated: list[list[str]] = [[] for _ in range(workers)]
+    errors = []
+
+    def worker(index: int) -> None:
+        try:
+            barrier.wait()
+            for _ in range(rounds):
+                allocated[index].extend(allocate(session_factory, 2))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target = worker, args = (index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    addresses = [address for worker_addresses in allocated for address in worker_addresses]
+    assert len(addresses) == workers * rounds * 2
+    assert len(set(addresses)) == len(addresses)
+    assert "10.9.0.2" in addresses
@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+
+import anyio
+import pytest
+from wg_backend.wireguard.keypool import KeyPool
+from wg_backend.wireguard.keys import KeyProvider
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingKeyProvider(KeyProvider):
+    """ every key is unique and tells in which order it was generated """
+    name = "counting"
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def private_key(self) -> str:
+        return f"private-{next(self._counter)}"
+
+    def public_key(self, private_key: str) -> str:
+        return private_key.replace("private", "public")
+
+    def preshared_key(self) -> str:
+        return f"psk-{next(self._counter)}"
+
+
+async def wait_for_depth(pool: KeyPool, depth: int) -> None:
+    with anyio.fail_after(5):
+        while pool.depth != depth:
+            await asyncio.sleep(0.01)
+
+
+async def test_take_drains_the_pool_and_a_refill_starts_below_the_low_watermark():
+    pool = KeyPool(CountingKeyProvider(), watermark = 8, low_watermark = 3)
+    task = asyncio.create_task(pool.run())
+    try:
+        await wait_for_depth(pool, 8)
+        for _ in range(5):
+            pool.take()
+        await asyncio.sleep(0.05)
+        """ 3 left, not below the low watermark yet """
+        assert pool.depth == 3
+        pool.take()
+        await wait_for_depth(pool, 8)
+        assert (pool.hits, pool.misses, pool.generated) == (6, 0, 14)
+    finally:
+        task.cancel()
+
+
+async def test_empty_pool_generates_keys_directly():
+    pool = KeyPool(CountingKeyProvider(), watermark = 8, low_watermark = 3)
+    """ the refill task isn't running, take neither waits for it nor fills the pool """
+    keys = pool.take()
+    assert (keys.private_key, keys.public_key) == ("private-0", "public-0")
+    assert keys.preshared_key == "psk-1"
+    assert (pool.depth, pool.hits, pool.misses) == (0, 0, 1)
+
+
+async def test_no_key_is_handed_out_twice():
+    pool = KeyPool(CountingKeyProvider(), watermark = 8, low_watermark = 3)
+    task = asyncio.create_task(pool.run())
+    try:
+        await wait_for_depth(pool, 8)
+        taken = []
+        for round_ in range(20):
+            taken.extend(pool.take() for _ in range(round_ % 12))
+            await asyncio.sleep(0)
+        assert pool.hits and pool.misses
+        private_keys = [keys.private_key for keys in taken]
+        assert len(set(private_keys)) == len(private_keys)
+    finally:
+        task.cancel()
+
+
+async def test_zero_watermark_disables_the_pool():
+    pool = KeyPool(CountingKeyProvider(), watermark = 0, low_watermark = 64)
+    with anyio.fail_after(1):
+        await pool.run()
+    assert await pool.fill() == 0
+    for _ in range(3):
+        pool.take()
+    assert (pool.depth, pool.low_watermark, pool.hits, pool.misses) == (0, 0, 0, 3)
@@ -0,0 +1,45 @@
+from base64 import b64decode
+
+import pytest
+from wg_backend.wireguard.keys import PythonKeyProvider
+
+""" alice's key pair of RFC 7748, section 6.1 """
+RFC7748_PRIVATE_KEY = "dwdtCnMYpX08FsFyUbJmRd9ML4frwJkqsXf7pR25LCo="
+RFC7748_PUBLIC_KEY = "hSDwCYkwp1R0i33ctD73Wg2/Og0mOBr066SpjqqbTmo="
+
+
+@pytest.fixture
+def provider() -> PythonKeyProvider:
+    return PythonKeyProvider()
+
+
+def test_public_key_matches_the_rfc_7748_vector(provider):
+    assert provider.public_key(RFC7748_PRIVATE_KEY) == RFC7748_PUBLIC_KEY
+
+
+def test_private_keys_are_clamped(provider):
+    for _ in range(100):
+        raw = b64decode(provider.private_key())
+        assert raw[0] & 7 == 0
+        assert raw[31] & 128 == 0
+        assert raw[31] & 64 == 64
+
+
+@pytest.mark.parametrize("generate", ["private_key", "preshared_key"])
+def test_keys_are_32_bytes_in_base64(provider, generate: str):
+    keys = {getattr(provider, generate)() for _ in range(100)}
+    assert len(keys) == 100
+    for key in keys:
+        assert len(key) == 44
+        assert len(b64decode(key, validate = True)) == 32
+
+
+def test_keypair_public_key_is_derived_from_the_private_key(provider):
+    private_key, public_key = provider.keypair()
+    assert len(b64decode(public_key, validate = True)) == 32
+    assert provider.public_key(private_key) == public_key
+
+
+def test_public_key_refuses_a_key_of_the_wrong_length(provider):
+    with pytest.raises(ValueError):
+        provider.public_key("c2hvcnQ=")
@@ -0,0 +1,175 @@
+from types import SimpleNamespace
+
+import pytest
+from wg_backend.models.peer import Peer
+from wg_backend.models.wg_interface import WGInterface
+from wg_backend.wireguard.base import WGBackend, WGPeerDump, WGPeerSpec
+from wg_backend.wireguard.reconciler import ReconcilePlan, Reconciler, diff_peers
+
+from tests.conftest import INTERFACE_ID
+
+
+def spec(public_key: str, *allowed_ips: str, preshared_key: str | None = None, keepalive: int | None = None):
+    return WGPeerSpec(
+        public_key = public_key,
+        allowed_ips = list(allowed_ips),
+        preshared_key = preshared_key,
+        persistent_keepalive = keepalive,
+    )
+
+
+def dump(public_key: str, allowed_ips: str | None, preshared_key: str | None = None, keepalive: int | None = None):
+    return WGPeerDump(
+        public_key = public_key,
+        allowed_ips = allowed_ips,
+        preshared_key = preshared_key,
+        persistent_keepalive = keepalive,
+    )
+
+
+def test_in_sync_interface_has_no_drift():
+    desired = {"a": spec("a", "10.0.0.2/32", preshared_key = "psk", keepalive = 25)}
+    actual = {"a": dump("a", "10.0.0.2/32", preshared_key = "psk", keepalive = 25)}
+    plan = diff_peers(desired, actual)
+    assert plan == ReconcilePlan()
+    assert plan.drift == 0
+
+
+def test_missing_peer_is_added():
+    desired = {"a": spec("a", "10.0.0.2/32"), "b": spec("b", "10.0.0.3/32")}
+    plan = diff_peers(desired, {"a": dump("a", "10.0.0.2/32")})
+    assert plan.add == [desired["b"]]
+    assert (plan.change, plan.remove) == ([], [])
+
+
+def test_unknown_peer_is_removed():
+    plan = diff_peers({}, {"stranger": dump("stranger", "10.0.0.9/32")})
+    assert plan.remove == ["stranger"]
+    assert plan.drift == 1
+
+
+@pytest.mark.parametrize(
+    "current",
+    [
+        dump("a", "10.0.0.7/32"),
+        dump("a", "10.0.0.2/32, 10.0.0.7/32"),
+        dump("a", "10.0.0.2/32", preshared_key = "old"),
+        dump("a", "10.0.0.2/32", keepalive = 25),
+        dump("a", None),
+    ],
+    ids = ["allowed ips", "extra allowed ips", "preshared key", "keepalive", "no allowed ips"],
+)
+def test_drifted_peer_is_changed(current: WGPeerDump):
+    desired = {"a": spec("a", "10.0.0.2/32", preshared_key = "new" if current.preshared_key else None)}
+    plan = diff_peers(desired, {"a": current})
+    assert plan.change == [desired["a"]]
+    assert (plan.add, plan.remove) == ([], [])
+
+
+def test_dropped_preshared_key_is_changed_in_place():
+    """ backends clear the preshared key of a peer without one, the peer keeps its session """
+    desired = {"a": spec("a", "10.0.0.2/32")}
+    plan = diff_peers(desired, {"a": dump("a", "10.0.0.2/32", preshared_key = "psk")})
+    assert plan.change == [desired["a"]]
+    assert plan.remove == []
+
+
+def test_allowed_ips_order_and_notation_are_ignored():
+    desired = {"a": spec("a", "10.0.0.3/32", "10.0.0.2", "fd00::2/128")}
+    actual = {"a": dump("a", "fd00::2/128, 10.0.0.2/32,10.0.0.3/32")}
+    assert diff_peers(desired, actual).drift == 0
+
+
+class RecordingBackend(WGBackend):
+    name = "recording"
+
+    def __init__(self, interface: str):
+        super().__init__(interface)
+        self.calls = []
+
+    async def get_device(self):
+        raise NotImplementedError
+
+    async def set_peer(self, peer):
+        self.calls.append(("set_peer", peer.public_key))
+
+    async def remove_peer(self, public_key):
+        self.calls.append(("remove_peer", public_key))
+
+    async def set_peers(self, peers):
+        self.calls.append(("set_peers", [peer.public_key for peer in peers]))
+
+    async def replace_peers(self, peers):
+        self.calls.append(("replace_peers", [peer.public_key for peer in peers]))
+
+    async def remove_peers(self, public_keys):
+        self.calls.append(("remove_peers", list(public_keys)))
+
+
+@pytest.mark.anyio
+async def test_changed_peers_replace_the_interface_state():
+    """ `set_peers` may only add allowed ips, changed peers go through `replace_peers` """
+    backend = RecordingBackend("wg0")
+    reconciler = Reconciler(backend, collector = None, session_factory = None, interval = 0, delay = 0)
+    plan = diff_peers(
+        {"new": spec("new", "10.0.0.4/32"), "a": spec("a", "10.0.0.2/32"), "b": spec("b", "10.0.0.3/32")},
+        {"a": dump("a", "10.0.0.2/32", preshared_key = "psk"), "b": dump("b", "10.0.0.9/32"), "x": dump("x", "")},
+    )
+    await reconciler._apply(plan)
+    assert backend.calls == [
+        ("remove_peers", ["x"]),
+        ("set_peers", ["new"]),
+        ("replace_peers", ["a", "b"]),
+    ]
+
+
+def test_desired_state_only_holds_peers_of_the_managed_interface(session_factory):
+    with session_factory() as session:
+        session.add(
+            WGInterface(id = 2, private_key = "private", public_key = "public", address = "10.1.0.1/24",
+                        port = 51821, interface = "wg1")
+        )
+        for public_key, interface_id, enabled, address in [
+            ("a", INTERFACE_ID, True, "10.0.0.2"),
+            ("b", INTERFACE_ID, False, "10.0.0.3"),
+            ("c", 2, True, "10.1.0.2"),
+        ]:
+            session.add(
+                Peer(name = public_key, enabled = enabled, interface_id = interface_id, private_key = "private",
+                     public_key = public_key, address = address)
+            )
+        session.commit()
+    reconciler = Reconciler(
+        RecordingBackend("wg0"), collector = None, session_factory = session_factory, interval = 0, delay = 0
+    )
+    assert list(reconciler._load_desired()) == ["a"]
+
+
+@pytest.mark.anyio
+async def test_interface_is_dumped_before_the_database_is_read():
+    """ a peer committed and applied by another worker in between must not look like a stranger """
+    events = []
+
+    class Collector:
+        async def refresh(self):
+            events.append("dump")
+            return SimpleNamespace(peers = {})
+
+    reconciler = Reconciler(RecordingBackend("wg0"), collector = Collector(), session_factory = None, interval = 0,
+                            delay = 0)
+    reconciler._load_desired = lambda: events.append("database") or {}
+    await reconciler.plan()
+    assert events == ["dump", "database"]
+
+
+def test_one_worker_leads_the_periodic_runs(tmp_path):
+    workers = [
+        Reconciler(RecordingBackend("wg0"), collector = None, session_factory = None, interval = 60, delay = 0,
+                   lock_path = tmp_path / "reconcile.lock")
+        for _ in range(2)
+    ]
+    assert workers[0]._take_leadership()
+    assert not workers[1]._take_leadership()
+    assert workers[0]._take_leadership()
+    workers[0]._lock_file.close()
+    assert workers[1]._take_leadership()
@@ -0,0 +1,105 @@
+import math
+
+import pytest
+from wg_backend.api.throttle import LoginThrottle
+
+""" 6 attempts per minute, one token every 10 seconds """
+RATE = 6 / 60
+
+
+@pytest.fixture
+def throttle(tmp_path) -> LoginThrottle:
+    return LoginThrottle(
+        path = tmp_path / "throttle.db",
+        user_per_minute = 6,
+        user_burst = 2,
+        ip_per_minute = 6,
+        ip_burst = 3,
+        busy_timeout = 1,
+    )
+
+
+def user_bucket(username: str = "admin") -> tuple[str, str, float, int]:
+    return "throttled_username", f"user:{username}", RATE, 2
+
+
+def ip_bucket(client_ip: str = "192.0.2.1") -> tuple[str, str, float, int]:
+    return "throttled_ip", f"ip:{client_ip}", RATE, 3
+
+
+def tokens(throttle: LoginThrottle, key: str) -> float | None:
+    row = throttle._connect().execute("SELECT tokens FROM bucket WHERE key = ?", (key,)).fetchone()
+    return None if row is None else row[0]
+
+
+def test_burst_is_allowed_then_refused_until_a_token_refills(throttle):
+    assert throttle._take([user_bucket()], now = 1000.0) == 0
+    assert throttle._take([user_bucket()], now = 1000.0) == 0
+    assert throttle._take([user_bucket()], now = 1000.0) == pytest.approx(10)
+
+
+def test_refill_is_proportional_to_the_elapsed_time(throttle):
+    throttle._take([user_bucket()], now = 1000.0)
+    throttle._take([user_bucket()], now = 1000.0)
+    """ 4 seconds give 0.4 tokens, the next one is 6 seconds away """
+    assert throttle._take([user_bucket()], now = 1004.0) == pytest.approx(6)
+    assert throttle._take([user_bucket()], now = 1010.0) == 0
+    assert tokens(throttle, "user:admin") == pytest.approx(0)
+
+
+def test_refill_stops_at_the_burst(throttle):
+    throttle._take([user_bucket()], now = 1000.0)
+    assert throttle._take([user_bucket()], now = 5000.0) == 0
+    assert tokens(throttle, "user:admin") == pytest.approx(1)
+
+
+def test_retry_after_is_the_wait_rounded_up(throttle):
+    for _ in range(2):
+        throttle._take([user_bucket()], now = 1000.0)
+    wait = throttle._take([user_bucket()], now = 1000.5)
+    assert wait == pytest.approx(9.5)
+    assert math.ceil(wait) == 10
+
+
+def test_refused_attempt_takes_no_token(throttle):
+    for _ in range(2):
+        throttle._take([user_bucket(), ip_bucket()], now = 1000.0)
+    assert tokens(throttle, "ip:192.0.2.1") == pytest.approx(1)
+    """ the username bucket is empty, the ip bucket keeps its token and the refused attempt leaves no trace """
+    assert throttle._take([user_bucket(), ip_bucket()], now = 1000.0) == pytest.approx(10)
+    assert tokens(throttle, "ip:192.0.2.1") == pytest.approx(1)
+    assert tokens(throttle, "user:admin") == pytest.approx(0)
+    assert throttle._take([user_bucket("other"), ip_bucket()], now = 1000.0) == 0
+
+
+def test_wait_is_the_longest_of_the_empty_buckets(throttle):
+    for _ in range(3):
+        throttle._take([ip_bucket()], now = 1000.0)
+    throttle._take([user_bucket()], now = 1004.0)
+    throttle._take([user_bucket()], now = 1004.0)
+    """ the ip bucket has 0.4 tokens and the username bucket none, the username wait wins """
+    assert throttle._take([user_bucket(), ip_bucket()], now = 1004.0) == pytest.approx(10)
+
+
+def test_counters(throttle):
+    for _ in range(3):
+        throttle._take([user_bucket(), ip_bucket()], now = 1000.0)
+    stats = throttle._stats()
+    assert (stats["allowed"], stats["throttled_username"], stats["throttled_ip"]) == (2, 1, 0)
+    assert stats["buckets"] == 2
+
+
+@pytest.mark.anyio
+async def test_disabled_limits_let_every_attempt_through(tmp_path):
+    throttle = LoginThrottle(tmp_path / "throttle.db", 0, 5, 0, 30, busy_timeout = 1)
+    assert not throttle.enabled
+    for _ in range(10):
+        assert await throttle.take("admin", "192.0.2.1") == 0
+
+
+@pytest.mark.anyio
+async def test_unusable_store_lets_attempts_through(tmp_path):
+    (tmp_path / "throttle.db").mkdir()
+    throttle = LoginThrottle(tmp_path / "throttle.db", 6, 1, 6, 1, busy_timeout = 1)
+    for _ in range(3):
+        assert await throttle.take("admin", "192.0.2.1") == 0
@@ -0,0 +1,22 @@
+from wg_backend.wireguard.base import WGPeerSpec
+from wg_backend.wireguard.cli import peer_set_args
+from wg_backend.wireguard.netlink import NO_PRESHARED_KEY, NetlinkWGBackend
+
+
+def spec(preshared_key: str | None) -> WGPeerSpec:
+    return WGPeerSpec(
+        public_key = "a", allowed_ips = ["10.0.0.2/32"], preshared_key = preshared_key, persistent_keepalive = None
+    )
+
+
+def test_cli_clears_a_missing_preshared_key():
+    assert peer_set_args(spec("psk"))[-2:] == ["preshared-key", "/dev/stdin"]
+    assert peer_set_args(spec(None))[-2:] == ["preshared-key", "/dev/null"]
+
+
+def test_netlink_clears_a_missing_preshared_key():
+    def preshared_key(peer: WGPeerSpec) -> str:
+        return dict(NetlinkWGBackend._peer_attrs(peer)["attrs"])["WGPEER_A_PRESHARED_KEY"]
+
+    assert preshared_key(spec("psk")) == "psk"
+    assert preshared_key(spec(None)) == NO_PRESHARED_KEY == "A" * 43 + "="
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from wg_backend.api.api_v1.endpoints.login import login_router
+from wg_backend.api.api_v1.endpoints.metrics import metrics_router
 from wg_backend.api.api_v1.endpoints.peer import peer_router
 from wg_backend.api.api_v1.endpoints.users import user_router
 from wg_backend.api.api_v1.endpoints.wg_interface import wg_if_router
@@ -36,3 +37,10 @@ v1_api_router.include_router(
     include_in_schema = True,
     deprecated = False,
 )
+v1_api_router.include_router(
+    metrics_router,
+    prefix = "",
+    tags = ["metrics"],
+    include_in_schema = False,
+    deprecated = False,
+)
@@ -1,38 +1,48 @@
+import math
 from datetime import timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestFormStrict
-from wg_backend.api import exceptions
+from wg_backend.api import exceptions, utils
 from wg_backend.api.deps import CurrentUser, get_current_active_superuser
+from wg_backend.api.throttle import get_login_throttle
+from wg_backend.api.usercache import get_user_cache
 from wg_backend.api.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
     send_email,
     verify_password_reset_token
 )
-from wg_backend.core.security import create_access_token, get_password_hash
+from wg_backend.core.security import create_access_token
 from wg_backend.core.settings import get_settings
-from wg_backend.crud.crud_user_fn import authenticate, get_user_by_email
-from wg_backend.db.session import SessionDep
+from wg_backend.crud import crud_state, crud_user_fn_async
+from wg_backend.crud.crud_user_fn import get_user_by_email
+from wg_backend.db.session import AsyncReadSessionDep, AsyncSessionDep, AsyncSessionFactory, SessionDep
+from wg_backend.schemas.stats import LoginThrottleStats
 from wg_backend.schemas.token import Message, NewPassword, Token
 from wg_backend.schemas.user import UserOut
 
 settings = get_settings()
-login_router = APIRouter()
+login_router = APIRouter(route_class = utils.TimedRoute)
 
 
 @login_router.post("/login/access-token", response_model = Token)
 async def login_for_access_token(
         form_data: Annotated[OAuth2PasswordRequestFormStrict, Depends()],
-        session: SessionDep,
+        session: AsyncReadSessionDep,
+        request: Request,
         response: Response
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = authenticate(
+    retry_after = await get_login_throttle().take(form_data.username, request.client.host if request.client else None)
+    if retry_after:
+        raise exceptions.login_throttled(math.ceil(retry_after))
+    """ the user is read on the read only connections, the write lock is only taken to store an upgraded hash """
+    user, new_hash = await crud_user_fn_async.authenticate(
         session = session,
         username = form_data.username,
         password = form_data.password
@@ -41,6 +51,11 @@ async def login_for_access_token(
         raise exceptions.incorrect_username_or_password()
     elif not user.is_active:
         raise exceptions.inactive_user()
+    if new_hash is not None:
+        async with AsyncSessionFactory() as write_session:
+            await crud_user_fn_async.set_password_hash(
+                session = write_session, db_user = user, hashed_password = new_hash
+            )
     access_token_expires = timedelta(hours = settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data = {"sub": user.username, "scopes": form_data.scopes},
@@ -53,6 +68,16 @@ async def login_for_access_token(
     )
 
 
+@login_router.get(
+    "/login/throttle",
+    response_model = LoginThrottleStats,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def get_login_throttle_stats() -> LoginThrottleStats:
+    """ Login attempts let through and throttled, by all the workers of this node """
+    return LoginThrottleStats(**await get_login_throttle().stats())
+
+
 @login_router.post(
     "/login/test-token",
     response_model = UserOut,
@@ -98,22 +123,25 @@ async def recover_password(session: SessionDep, email: Annotated[
 
 
 @login_router.post("/reset-password/")
-def reset_password(session: SessionDep, body: NewPassword) -> Message:
+async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message:
     """
     Reset password
     """
     email = verify_password_reset_token(token = body.token)
     if not email:
         raise exceptions.invalid_token()
-    user = get_user_by_email(session = session, email = email)
+    """ hashed before the first query, the write transaction doesn't wait for it """
+    hashed_password = await crud_user_fn_async.hash_password(body.new_password)
+    user = await crud_user_fn_async.get_user_by_email(session = session, email = email)
     if not user:
         raise exceptions.user_not_exist_email()
     elif not user.is_active:
         raise exceptions.inactive_user()
-    hashed_password = get_password_hash(password = body.new_password)
     user.hashed_password = hashed_password
     session.add(user)
-    session.commit()
+    await crud_state.bump(session, name = crud_state.USERS)
+    await session.commit()
+    get_user_cache().invalidate(user.username)
     return Message(message = "Password updated successfully")
 
 
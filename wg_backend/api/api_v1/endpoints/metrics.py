@@ -0,0 +1,30 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Request, Response
+from wg_backend.api import exceptions, utils
+from wg_backend.core import metrics
+from wg_backend.core.settings import get_settings
+from wg_backend.crud.crud_peer import crud_peer
+from wg_backend.db.session import AsyncReadSessionDep
+
+settings = get_settings()
+
+metrics_router = APIRouter(route_class = utils.TimedRoute)
+
+
+def verify_metrics_token(request: Request) -> None:
+    """ scrapers send the static METRICS_TOKEN as a bearer token, the endpoint doesn't exist while it is unset """
+    if not settings.METRICS_TOKEN:
+        raise exceptions.not_found_error()
+    authorization = request.headers.get("Authorization", "")
+    if not secrets.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+        raise exceptions.credentials_not_valid("Bearer")
+
+
+@metrics_router.get("/metrics", dependencies = [Depends(verify_metrics_token)], include_in_schema = False)
+async def get_metrics(session: AsyncReadSessionDep) -> Response:
+    """ Prometheus text exposition of the request, database and wg command metrics of every worker """
+    counts = await crud_peer.count_by_interface(session)
+    await session.close()
+    content, media_type = metrics.render(metrics.PeerCountCollector(counts))
+    return Response(content = content, media_type = media_type)
@@ -1,27 +1,74 @@
-import re
+import datetime
+import time
 import uuid
 from io import StringIO
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, Query, Request
 from fastapi.responses import Response, StreamingResponse
 from sqlalchemy import select
-from wg_backend.api import exceptions, utils
+from sqlalchemy.ext.asyncio import AsyncSession
+from wg_backend.api import exceptions, export, utils
 from wg_backend.api.deps import get_current_active_superuser
+from wg_backend.api.qrcodes import get_qrcode_cache
+from wg_backend.core.settings import get_settings
+from wg_backend.crud import crud_state, crud_traffic
+from wg_backend.crud.crud_ip_pool import allocate_addresses
 from wg_backend.crud.crud_peer import crud_peer
-from wg_backend.crud.crud_wgserver import crud_wg_interface
-from wg_backend.db.session import SessionDep
+from wg_backend.db.session import AsyncReadSessionDep, AsyncReadSessionFactory, AsyncSessionDep
 from wg_backend.models.peer import Peer
+from wg_backend.models.wg_interface import WGInterface
 from wg_backend.schemas.Peer import (
     DBPlusStdoutPeer,
     DbDataPeer,
     PeerCreate,
+    PeerBulkMutationResult,
+    PeerBulkResult,
+    PeerBulkSelector,
     PeerCreateForInterface,
     PeerUpdate,
     StdoutRxTxPlusLhaPeer
 )
+from wg_backend.schemas.stats import (
+    KeyPoolStats,
+    PeerTrafficOut,
+    QRCodeCacheStats,
+    ReconcilePlanOut,
+    ReconcilerStats,
+    TrafficPoint
+)
+from wg_backend.wireguard.backends import get_wg_backend
+from wg_backend.wireguard.base import WGBackendError, WGPeerSpec
+from wg_backend.wireguard.collector import get_stats_collector
+from wg_backend.wireguard.configstore import get_peers_config_store
+from wg_backend.wireguard.keypool import get_key_pool
+from wg_backend.wireguard.rates import get_rate_tracker
+from wg_backend.wireguard.reconciler import ReconcilePlan, get_reconciler
+from wg_backend.wireguard.stream import get_stats_broadcaster
+from wg_backend.wireguard.traffic import get_traffic_recorder
 
+settings = get_settings()
 peer_router = APIRouter(route_class = utils.TimedRoute)
 
+""" pages of rows a `stale_after` listing reads at most per request, the cursor resumes after the last one read """
+STALE_SCAN_PAGES = 10
+
+
+def peers_changed() -> None:
+    """ call after a peers change is committed, the peers file and the interface follow the database """
+    get_peers_config_store().mark_dirty()
+    get_reconciler().schedule()
+
+
+def plan_out(plan: ReconcilePlan, dry_run: bool) -> ReconcilePlanOut:
+    return ReconcilePlanOut(
+        dry_run = dry_run,
+        drift = plan.drift,
+        add = [peer.public_key for peer in plan.add],
+        change = [peer.public_key for peer in plan.change],
+        remove = plan.remove,
+    )
+
 
 @peer_router.get(
     "/peers/rxtx",
@@ -30,12 +77,137 @@ peer_router = APIRouter(route_class = utils.TimedRoute)
     response_model_exclude_unset = True,
     dependencies = [Depends(get_current_active_superuser)]
 )
-async def get_peers_rxtx() -> list[StdoutRxTxPlusLhaPeer]:
-    lha_proc = utils.wg_show_lha_cmd()
-    transfer_proc = utils.wg_show_transfer_cmd()
-    if transfer_proc.stderr or lha_proc.stderr:
-        raise exceptions.wg_dump_error(transfer_proc.stderr)
-    return utils.get_rxtx_lha_config(transfer_proc.stdout, lha_proc.stdout)
+async def get_peers_rxtx(request: Request, response: Response) -> list[StdoutRxTxPlusLhaPeer]:
+    collector = get_stats_collector()
+    try:
+        snapshot = await collector.get_snapshot()
+    except WGBackendError as e:
+        raise exceptions.wg_dump_error(str(e))
+    etag = utils.make_etag(collector.instance, snapshot.generation)
+    if utils.etag_matches(request, etag):
+        return utils.not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["X-Stats-Age"] = f"{snapshot.age:.3f}"
+    rates = get_rate_tracker()
+    return [
+        StdoutRxTxPlusLhaPeer.from_wg_dump(dump_peer, rates.get(public_key))
+        for public_key, dump_peer in snapshot.peers.items()
+    ]
+
+
+@peer_router.get(
+    "/peers/rxtx/stream",
+    response_class = StreamingResponse,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def stream_peers_rxtx(
+        session: AsyncReadSessionDep,
+        peer_id: Annotated[list[uuid.UUID] | None, Query(description = "only these peers, all when left out")] = None,
+) -> StreamingResponse:
+    """
+    Server sent events, a `snapshot` event with every peer of /peers/rxtx, then on each interface dump a
+    `delta` event with the changed and the removed peers. A client falling behind gets a new `snapshot`.
+    """
+    public_keys = None
+    if peer_id:
+        found = await crud_peer.get_public_keys(session, ids = peer_id)
+        await session.close()
+        if len(found) < len(set(peer_id)):
+            raise exceptions.peer_not_found()
+        public_keys = frozenset(found.values())
+    return StreamingResponse(
+        get_stats_broadcaster().stream(public_keys),
+        media_type = "text/event-stream",
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@peer_router.get(
+    "/peers/export",
+    response_class = StreamingResponse,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def export_peers(
+        archive_format: Annotated[export.ArchiveFormat, Query(alias = "format")] = "zip",
+        qrcode: Annotated[Literal["svg", "png"] | None, Query(description = "add a qr code image per peer")] = None,
+        box_size: Annotated[int | None, Query(ge = 1, le = 50)] = None,
+        peer_id: Annotated[list[uuid.UUID] | None, Query()] = None,
+        enabled: bool | None = None,
+        name_prefix: str | None = None,
+) -> StreamingResponse:
+    """ Configs of the peers matching the filter (every peer without one) as an archive of `.conf` files """
+    media_type, suffix = export.ARCHIVE_TYPES[archive_format]
+    return StreamingResponse(
+        export.stream_archive(
+            AsyncReadSessionFactory,
+            archive_format,
+            qrcode = qrcode,
+            box_size = box_size or settings.WG_QR_BOX_SIZE,
+            ids = peer_id,
+            enabled = enabled,
+            name_prefix = name_prefix,
+        ),
+        media_type = media_type,
+        headers = {"Content-Disposition": f"attachment; filename={settings.PROJECT_NAME}-peers.{suffix}"},
+    )
+
+
+@peer_router.get(
+    "/peers/keypool",
+    response_model = KeyPoolStats,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def get_key_pool_stats() -> KeyPoolStats:
+    """ Pre generated peer keys pool depth and refill rate """
+    return KeyPoolStats(**get_key_pool().stats())
+
+
+@peer_router.get(
+    "/peers/qrcache",
+    response_model = QRCodeCacheStats,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def get_qrcode_cache_stats() -> QRCodeCacheStats:
+    """ Rendered qr codes cache of this worker """
+    return QRCodeCacheStats(**get_qrcode_cache().stats())
+
+
+@peer_router.get(
+    "/peers/reconcile/plan",
+    response_model = ReconcilePlanOut,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def get_reconcile_plan() -> ReconcilePlanOut:
+    """ Dry run, what a reconciliation would add, change and remove on the interface """
+    try:
+        plan = await get_reconciler().reconcile(dry_run = True)
+    except WGBackendError as e:
+        raise exceptions.wg_dump_error(str(e))
+    return plan_out(plan, dry_run = True)
+
+
+@peer_router.post(
+    "/peers/reconcile",
+    response_model = ReconcilePlanOut,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def reconcile_peers() -> ReconcilePlanOut:
+    """ Bring the interface peers in line with the enabled peers of the database now """
+    try:
+        plan = await get_reconciler().reconcile()
+    except WGBackendError as e:
+        raise exceptions.server_error(f"reconciling wg interface failed: {e}")
+    return plan_out(plan, dry_run = False)
+
+
+@peer_router.get(
+    "/peers/reconcile/stats",
+    response_model = ReconcilerStats,
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def get_reconciler_stats() -> ReconcilerStats:
+    """ Drift found and fixed since start """
+    return ReconcilerStats(**get_reconciler().stats())
 
 
 @peer_router.get(
@@ -46,14 +218,63 @@ async def get_peers_rxtx() -> list[StdoutRxTxPlusLhaPeer]:
     response_model_exclude_unset = True,
     # response_model_exclude = {},
 )
-async def peer_list(session: SessionDep) -> list[DBPlusStdoutPeer]:
-    """ Peers list """
-    stmt = select(Peer.id, Peer.public_key, Peer.name, Peer.enabled, Peer.created_at, Peer.updated_at)
-    peers_db_data = session.execute(stmt).fetchall()
-    dump_result = utils.wg_show_dump_cmd()
-    data = utils.get_full_config(peers_db_data = peers_db_data, dump_result = dump_result)
-    if not data:
+async def peer_list(
+        session: AsyncReadSessionDep,
+        request: Request,
+        response: Response,
+        limit: Annotated[int, Query(ge = 1, le = 1000)] = 100,
+        cursor: str | None = None,
+        enabled: bool | None = None,
+        name_prefix: str | None = None,
+        stale_after: Annotated[int | None, Query(ge = 0, description = "only peers without a handshake "
+                                                                        "in this many seconds")] = None,
+) -> list[DBPlusStdoutPeer]:
+    """
+    Peers list, one page ordered by creation, X-Next-Cursor header points to the next page.
+
+    With `stale_after` the page may come back short or empty while X-Next-Cursor is set, the rows read for
+    one request are bounded and the scan goes on from the cursor.
+    """
+    after = None
+    if cursor:
+        after = utils.decode_peers_cursor(cursor)
+        if after is None:
+            raise exceptions.invalid_cursor()
+    collector = get_stats_collector()
+    try:
+        snapshot = await collector.get_snapshot()
+    except WGBackendError:
         raise exceptions.server_error(f"can't run wg dump data command.")
+    """ the page only changes with the peers rows or the interface dump, a revalidation reads one row """
+    etag = utils.make_etag(
+        await crud_state.get_version(session, name = crud_state.PEERS), collector.instance, snapshot.generation
+    )
+    if utils.etag_matches(request, etag):
+        return utils.not_modified(etag)
+    response.headers["ETag"] = etag
+    page = []
+    has_more = True
+    scanned_pages = 0
+    while has_more and len(page) < limit and scanned_pages < STALE_SCAN_PAGES:
+        rows = await crud_peer.get_page(
+            session, limit = limit, after = after, enabled = enabled, name_prefix = name_prefix
+        )
+        scanned_pages += 1
+        has_more = len(rows) == limit
+        for row in rows:
+            after = (row.created_at, row.id)
+            dump_peer = snapshot.peers.get(row.public_key)
+            if stale_after is not None and not utils.is_handshake_stale(dump_peer, stale_after):
+                continue
+            page.append(row)
+            if len(page) == limit:
+                has_more = has_more or row is not rows[-1]
+                break
+    if has_more:
+        response.headers["X-Next-Cursor"] = utils.encode_peers_cursor(*after)
+    response.headers["X-Stats-Age"] = f"{snapshot.age:.3f}"
+    rate_index = get_rate_tracker().rates(row.public_key for row in page)
+    data = utils.get_full_config(peers_db_data = page, dump_index = snapshot.peers, rate_index = rate_index)
     return list(data.values())
 
 
@@ -67,12 +288,18 @@ async def peer_list(session: SessionDep) -> list[DBPlusStdoutPeer]:
 )
 async def create_peer(
         peer_in: PeerCreate,
-        session: SessionDep,
+        session: AsyncSessionDep,
+        background_tasks: BackgroundTasks,
         preshared_key: bool = True,
         interface_id: int | None = 1
 ) -> DbDataPeer:
     """ Create Wireguard interface peer """
-    interface = crud_wg_interface.get_db_if(session, interface_id = interface_id)
+    if not await session.get(WGInterface, interface_id):
+        raise exceptions.not_found_error()
+    """ allocation has to be the first write of the transaction, it may roll back and retry """
+    new_ip_address, = await session.run_sync(allocate_addresses, interface_id = interface_id)
+    """ a retried allocation expires what the session loaded before, get it again """
+    interface = await session.get(WGInterface, interface_id)
     new_schema_peer: PeerCreateForInterface = PeerCreateForInterface.create_from_if(
         db_if = interface,
         peer_in = peer_in
@@ -80,20 +307,115 @@ async def create_peer(
     create_dict = new_schema_peer.model_dump()
     if not preshared_key:
         del create_dict['preshared_key']
-    stmt = select(Peer.address)
-    peer_addresses = session.execute(stmt).scalars()
-    addresses_set = set(peer_addresses)
-    new_ip_address = utils.generate_new_address(addresses_set)
-    if not new_ip_address:
-        raise exceptions.wg_max_num_ips_reached()
     create_dict["address"] = new_ip_address
-    new_db_peer = crud_peer.create(session, obj_in = create_dict)
-    set_proc = utils.wg_set_cmd(peer = new_db_peer)
-    if set_proc.stderr:
+    new_db_peer = await crud_peer.create(session, obj_in = create_dict)
+    peers_changed()
+    if settings.WG_QR_PRERENDER:
+        peer_config = utils.get_peer_config(crud_peer.config_row(new_db_peer))
+        background_tasks.add_task(get_qrcode_cache().prerender, new_db_peer.id, peer_config)
+    try:
+        await get_wg_backend().set_peer(WGPeerSpec.from_peer(new_db_peer))
+    except WGBackendError:
         raise exceptions.server_error("error when trying to add a peer to if")
     return new_db_peer
 
 
+@peer_router.post(
+    "/peers/bulk",
+    response_model = list[PeerBulkResult],
+    dependencies = [Depends(get_current_active_superuser)],
+    response_model_exclude_none = True,
+)
+async def create_peers_bulk(
+        peers_in: Annotated[list[PeerCreate], Body(min_length = 1, max_length = settings.WG_BULK_MAX_PEERS)],
+        session: AsyncSessionDep,
+        preshared_key: bool = True,
+        interface_id: int | None = 1
+) -> list[PeerBulkResult]:
+    """ Create many peers in one insert and push them to the interface in one batch """
+    if not await session.get(WGInterface, interface_id):
+        raise exceptions.not_found_error()
+    new_ip_addresses = await session.run_sync(allocate_addresses, interface_id = interface_id, count = len(peers_in))
+    interface = await session.get(WGInterface, interface_id)
+    create_dicts = []
+    for peer_in, new_ip_address in zip(peers_in, new_ip_addresses):
+        create_dict = PeerCreateForInterface.create_from_if(db_if = interface, peer_in = peer_in).model_dump()
+        if not preshared_key:
+            """ multi row inserts need the same keys in every row """
+            create_dict["preshared_key"] = None
+        create_dict["address"] = new_ip_address
+        create_dicts.append(create_dict)
+    new_db_peers = await crud_peer.create_many(session, objs_in = create_dicts)
+    """ the interface is only touched once the rows are committed, the write lock isn't held across the batch """
+    await session.commit()
+    peers_changed()
+    errors = await get_wg_backend().try_set_peers([WGPeerSpec.from_peer(peer) for peer in new_db_peers])
+    if errors:
+        """ refused peers are dropped again in a second short transaction """
+        await crud_peer.discard_many(session, peers = [peer for peer in new_db_peers if peer.public_key in errors])
+        await session.commit()
+        peers_changed()
+    return [
+        PeerBulkResult(index = index, name = peer.name, ok = False, error = errors[peer.public_key])
+        if peer.public_key in errors else
+        PeerBulkResult(index = index, name = peer.name, ok = True, peer = DbDataPeer.model_validate(peer))
+        for index, peer in enumerate(new_db_peers)
+    ]
+
+
+@peer_router.post(
+    "/peers/bulk/{action}",
+    response_model = PeerBulkMutationResult,
+    dependencies = [Depends(get_current_active_superuser)],
+)
+async def mutate_peers_bulk(
+        action: Literal["enable", "disable", "delete"],
+        selector: PeerBulkSelector,
+        session: AsyncSessionDep,
+) -> PeerBulkMutationResult:
+    """
+    Enable, disable or delete every peer matching the selector.
+
+    The database change is one statement and is committed before the interface is touched,
+    a failing interface batch is reported in `kernel_error`.
+    """
+    started = time.perf_counter()
+    if action == "delete":
+        rows = await crud_peer.remove_many(
+            session, ids = selector.ids, enabled = selector.enabled, name_prefix = selector.name_prefix
+        )
+    else:
+        """ peers already in the requested state are skipped """
+        rows = await crud_peer.set_enabled_many(
+            session,
+            enabled = action == "enable",
+            ids = selector.ids,
+            selected_enabled = selector.enabled,
+            name_prefix = selector.name_prefix,
+        )
+    db_done = time.perf_counter()
+    if rows:
+        peers_changed()
+    if action == "delete":
+        get_qrcode_cache().invalidate(*[row.id for row in rows])
+    kernel_error = None
+    try:
+        if action == "enable":
+            await get_wg_backend().set_peers([WGPeerSpec.from_peer(peer) for peer in rows])
+        elif rows:
+            await get_wg_backend().remove_peers([row.public_key for row in rows])
+    except WGBackendError as e:
+        kernel_error = str(e)
+    return PeerBulkMutationResult(
+        action = action,
+        count = len(rows),
+        peer_ids = [row.id for row in rows],
+        db_seconds = db_done - started,
+        kernel_seconds = time.perf_counter() - db_done,
+        kernel_error = kernel_error,
+    )
+
+
 @peer_router.put(
     "/peer/{peer_id}",
     response_model = DBPlusStdoutPeer,
@@ -102,14 +424,24 @@ async def create_peer(
 async def update_peer(
         peer_id: uuid.UUID,
         peer: PeerUpdate,
-        session: SessionDep
+        session: AsyncSessionDep
 ) -> DBPlusStdoutPeer:
-    db_peer = session.get(Peer, peer_id)
+    db_peer = await session.get(Peer, peer_id)
     updated_peer_dict = peer.model_dump(exclude_none = True, exclude_unset = True, exclude = {"preshared_key"})
     # updated_peer_dict['allowedIPs'] = ",".join(peer.allowedIPs)
-    updated_peer = crud_peer.update(session, db_obj = db_peer, obj_in = updated_peer_dict)
-    if not updated_peer.enabled:
-        utils.wg_set_rm_cmd(updated_peer)
+    updated_peer = await crud_peer.update(session, db_obj = db_peer, obj_in = updated_peer_dict)
+    peers_changed()
+    get_qrcode_cache().invalidate(peer_id)
+    if updated_peer.enabled:
+        try:
+            await get_wg_backend().set_peer(WGPeerSpec.from_peer(updated_peer))
+        except WGBackendError:
+            raise exceptions.server_error("error when trying to add a peer to if")
+    else:
+        try:
+            await get_wg_backend().remove_peer(updated_peer.public_key)
+        except WGBackendError:
+            raise exceptions.wg_remove_peer_error()
     return updated_peer
 
 
@@ -120,67 +452,147 @@ async def update_peer(
 )
 async def delete_peer(
         peer_id: uuid.UUID,
-        session: SessionDep
+        session: AsyncSessionDep
 ) -> DbDataPeer:
-    deleted_peer = crud_peer.remove(session = session, item_id = peer_id)
-    utils.wg_set_rm_cmd(deleted_peer)
+    deleted_peer = await crud_peer.remove(session = session, item_id = peer_id)
+    peers_changed()
+    get_qrcode_cache().invalidate(peer_id)
+    try:
+        await get_wg_backend().remove_peer(deleted_peer.public_key)
+    except WGBackendError:
+        raise exceptions.wg_remove_peer_error()
     return deleted_peer
 
 
+def _unix_time(value: datetime.datetime) -> int:
+    """ query datetimes without a timezone are utc """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo = datetime.UTC)
+    return int(value.timestamp())
+
+
+@peer_router.get(
+    "/peer/{peer_id}/traffic",
+    response_model = PeerTrafficOut,
+    dependencies = [Depends(get_current_active_superuser)],
+)
+async def peer_traffic(
+        peer_id: uuid.UUID,
+        session: AsyncReadSessionDep,
+        from_: Annotated[datetime.datetime | None, Query(alias = "from", description = "a day before to")] = None,
+        to: Annotated[datetime.datetime | None, Query(description = "now by default")] = None,
+        step: Annotated[int | None, Query(gt = 0, description = "seconds per point, a multiple of a stored "
+                                                                  "resolution, picked from the range")] = None,
+) -> PeerTrafficOut:
+    """ Bytes received and sent by the peer per step, read from the coarsest rollup the step allows """
+    end = _unix_time(to) if to else int(time.time())
+    start = _unix_time(from_) if from_ else end - 86400
+    if start >= end:
+        raise exceptions.invalid_traffic_query("from has to be before to")
+    recorder = get_traffic_recorder()
+    resolved = recorder.resolve_step(start, end, step)
+    if resolved is None:
+        raise exceptions.invalid_traffic_query(f"step has to be a multiple of one of {recorder.levels}")
+    resolution, step = resolved
+    if not await session.scalar(select(Peer.id).where(Peer.id == peer_id)):
+        raise exceptions.peer_not_found()
+    start = start // step * step
+    rows = await crud_traffic.get_series(
+        session, peer_id = peer_id, resolution = resolution, step = step, start = start, end = end
+    )
+    return PeerTrafficOut(
+        peer_id = peer_id,
+        start = datetime.datetime.fromtimestamp(start, datetime.UTC),
+        end = datetime.datetime.fromtimestamp(end, datetime.UTC),
+        step = step,
+        resolution = resolution,
+        points = [
+            TrafficPoint(ts = datetime.datetime.fromtimestamp(row.bucket, datetime.UTC), rx = row.rx, tx = row.tx)
+            for row in rows
+        ],
+    )
+
+
 @peer_router.get("/peer/{peer_id}/configuration", dependencies = [Depends(get_current_active_superuser)])
 async def peer_configuration(
         peer_id: uuid.UUID,
-        session: SessionDep
+        request: Request,
+        session: AsyncReadSessionDep
 ):
-    stmt = select(
-        Peer.name,
-        Peer.private_key,
-        Peer.preshared_key,
-        Peer.if_public_key,
-        Peer.address,
-        Peer.allowed_ips,
-        Peer.persistent_keepalive
-    ).where(Peer.id == peer_id)
-    peer = session.execute(stmt).first()
+    """ the tag was handed out for this peer, the peers didn't change since, so it still exists """
+    etag = utils.make_etag(
+        await crud_state.get_version(session, name = crud_state.PEERS), peer_id, utils.peer_config_fingerprint()
+    )
+    if utils.etag_matches(request, etag, wildcard = False):
+        return utils.not_modified(etag)
+    peer = await crud_peer.get_config_row(session, item_id = peer_id)
     if not peer:
         raise exceptions.peer_not_found()
-    peer_config = crud_peer.get_peer_config(peer)
-    file_name = re.sub("[^a-zA-Z0-9_=+.-]", "-", peer.name)
-    file_name = re.sub("(-{2,}|-)", "-", file_name)
-    file_name = re.sub("(-)", "", file_name)[:32]
+    if utils.etag_matches(request, etag):
+        return utils.not_modified(etag)
+    peer_config = utils.get_peer_config(peer)
+    file_name = utils.config_file_name(peer.name)
     f = StringIO(peer_config)
     headers = {
         "Content-Disposition": f"attachment; filename={file_name}.conf",
         "Content-Type": "text/plain; charset=utf-8",
         "Content-Length": str(len(f.getvalue())),
+        "ETag": etag,
     }
     return StreamingResponse(f, headers = headers)
 
 
+async def peer_qrcode_response(
+        peer_id: uuid.UUID,
+        request: Request,
+        session: AsyncSession,
+        image_format: Literal["svg", "png"],
+        box_size: int,
+) -> Response:
+    etag = utils.make_etag(
+        await crud_state.get_version(session, name = crud_state.PEERS),
+        peer_id,
+        image_format,
+        box_size,
+        utils.peer_config_fingerprint(),
+    )
+    if utils.etag_matches(request, etag, wildcard = False):
+        return utils.not_modified(etag)
+    peer = await crud_peer.get_config_row(session, item_id = peer_id)
+    if not peer:
+        raise exceptions.peer_not_found()
+    await session.close()
+    if utils.etag_matches(request, etag):
+        return utils.not_modified(etag)
+    image = await get_qrcode_cache().get(peer_id, utils.get_peer_config(peer), image_format, box_size)
+    media_type = "image/svg+xml; charset=utf-8" if image_format == "svg" else "image/png"
+    return Response(image, headers = {"Content-Type": media_type, "ETag": etag})
+
+
 @peer_router.get(
     "/peer/{peer_id}/svgqrcode",
     dependencies = [Depends(get_current_active_superuser)]
 )
 async def create_svg_from_config(
         peer_id: uuid.UUID,
-        session: SessionDep
+        request: Request,
+        session: AsyncReadSessionDep
 ):
-    stmt = select(
-        Peer.name,
-        Peer.private_key,
-        Peer.preshared_key,
-        Peer.if_public_key,
-        Peer.address,
-        Peer.allowed_ips,
-        Peer.persistent_keepalive
-    ).where(Peer.id == peer_id)
-    peer = session.execute(stmt).first()
-    if not peer:
-        raise exceptions.peer_not_found()
-    svg = crud_peer.peer_qrcode_svg(peer)
-    return Response(
-        svg.to_string(),
-        headers = {
-            "Content-Type": "image/svg+xml; charset=utf-8"
-        }
+    return await peer_qrcode_response(peer_id, request, session, "svg", settings.WG_QR_BOX_SIZE)
+
+
+@peer_router.get(
+    "/peer/{peer_id}/qrcode",
+    dependencies = [Depends(get_current_active_superuser)]
+)
+async def peer_qrcode(
+        peer_id: uuid.UUID,
+        request: Request,
+        session: AsyncReadSessionDep,
+        image_format: Annotated[Literal["svg", "png"], Query(alias = "format")] = "svg",
+        box_size: Annotated[int | None, Query(ge = 1, le = 50, description = "pixels per qr code module")] = None,
+):
+    """ Peer config as a qr code image, rendered images are cached """
+    return await peer_qrcode_response(
+        peer_id, request, session, image_format, box_size or settings.WG_QR_BOX_SIZE
     )
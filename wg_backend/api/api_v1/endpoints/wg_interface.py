@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends
 
+from wg_backend.api import utils
 from wg_backend.api.deps import get_current_active_superuser
 from wg_backend.crud.crud_wgserver import crud_wg_interface
 from wg_backend.db.session import SessionDep
 from wg_backend.schemas.wg_interface import WGInterfaceCreate
 
-wg_if_router = APIRouter()
+wg_if_router = APIRouter(route_class = utils.TimedRoute)
 
 
 # for future development
@@ -5,9 +5,10 @@ from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 from jose import jwt
 from pydantic import ValidationError
 from wg_backend.api import exceptions
+from wg_backend.api.usercache import get_user_cache
 from wg_backend.core.settings import get_settings
-from wg_backend.crud import crud_user_fn
-from wg_backend.db.session import SessionDep
+from wg_backend.crud import crud_state, crud_user_fn_async
+from wg_backend.db.session import AsyncReadSessionDep
 from wg_backend.models.user import User
 from wg_backend.schemas.token import TokenData
 
@@ -24,7 +25,7 @@ oauth2_scheme = OAuth2PasswordBearer(
 async def get_current_user(
         security_scopes: SecurityScopes,
         token: Annotated[str, Depends(oauth2_scheme)],
-        session: SessionDep,
+        session: AsyncReadSessionDep,
 ) -> User:
     if security_scopes.scopes:
         authenticate_value = f'Bearer scope="{security_scopes.scope_str}"'
@@ -41,10 +42,18 @@ async def get_current_user(
         # token_data = schemas.TokenData(**payload)
     except (jwt.JWTError, ValidationError):
         raise credentials_exception
-    user = crud_user_fn.get_user_by_username(session = session, username = token_data.sub)
-    # user = session.get(User, token_data.sub)
-    if not user:
-        raise credentials_exception
+    """ the session only connects on a cache miss and for the version check, at most once a second """
+    user_cache = get_user_cache()
+    if user_cache.version_check_due():
+        user_cache.set_version(await crud_state.get_version(session, name = crud_state.USERS))
+    user = user_cache.get(token_data.sub)
+    if user is None:
+        user = await crud_user_fn_async.get_user_by_username(session = session, username = token_data.sub)
+        # user = session.get(User, token_data.sub)
+        if not user:
+            raise credentials_exception
+        session.expunge(user)
+        user_cache.put(token_data.sub, user)
     for scope in security_scopes.scopes:
         if scope not in token_data.scopes:
             raise HTTPException(
@@ -52,7 +61,7 @@ async def get_current_user(
                 detail = "Not enough permissions",
                 headers = {"WWW-Authenticate": authenticate_value},
             )
-    session.close()
+    await session.close()
     return user
 
 
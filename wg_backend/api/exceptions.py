@@ -76,6 +76,24 @@ def incorrect_username_or_password() -> HTTPException:
     )
 
 
+@lru_cache
+def login_throttled(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS,
+        detail = "Too many login attempts, try again later",
+        headers = {"Retry-After": str(retry_after)},
+    )
+
+
+@lru_cache
+def password_hasher_busy(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail = "Too many password checks in progress, try again later",
+        headers = {"Retry-After": str(retry_after)},
+    )
+
+
 @lru_cache()
 def wg_startup_error() -> HTTPException:
     return HTTPException(
@@ -153,6 +171,16 @@ def key_not_valid(e) -> HTTPException:
     )
 
 
+@lru_cache
+def invalid_cursor() -> HTTPException:
+    return HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "Invalid cursor")
+
+
+@lru_cache
+def invalid_traffic_query(msg: str) -> HTTPException:
+    return HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = msg)
+
+
 @lru_cache
 def not_superuser() -> HTTPException:
     return HTTPException(
@@ -0,0 +1,121 @@
+import asyncio
+import tarfile
+import time
+import uuid
+import zipfile
+from io import BytesIO
+from typing import AsyncIterator, Callable, Literal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from wg_backend.api import utils
+from wg_backend.crud.crud_peer import CONFIG_COLUMNS, crud_peer
+
+""" rows fetched per round trip, and archived per worker thread hop """
+EXPORT_BATCH = 500
+
+ArchiveFormat = Literal["zip", "tar", "tgz"]
+""" media type and file name suffix of each archive format """
+ARCHIVE_TYPES: dict[str, tuple[str, str]] = {
+    "zip": ("application/zip", "zip"),
+    "tar": ("application/x-tar", "tar"),
+    "tgz": ("application/gzip", "tar.gz"),
+}
+
+
+class ChunkBuffer:
+    """ write only, not seekable file object keeping what the archive writer produced since the last `take` """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ArchiveWriter:
+    """
+    Zip or tar archive written to a ChunkBuffer, the caller sends `take()` after every batch of files.
+
+    A tar archive is written in stream mode and holds nothing back, a zip archive keeps the central directory
+    record of every file (about 1 KiB) until `close`.
+    """
+
+    def __init__(self, archive_format: ArchiveFormat):
+        self.buffer = ChunkBuffer()
+        self._zip: zipfile.ZipFile | None = None
+        self._tar: tarfile.TarFile | None = None
+        if archive_format == "zip":
+            self._zip = zipfile.ZipFile(self.buffer, mode = "w", compression = zipfile.ZIP_DEFLATED)
+        else:
+            self._tar = tarfile.open(fileobj = self.buffer, mode = "w|gz" if archive_format == "tgz" else "w|")
+
+    def add(self, name: str, data: bytes) -> None:
+        """ configs hold private keys, the files are readable by their owner only """
+        if self._zip is not None:
+            info = zipfile.ZipInfo(name, date_time = time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o600 << 16
+            self._zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o600
+            self._tar.addfile(info, BytesIO(data))
+            """ the list of written members is never read back in stream mode, it would grow with the archive """
+            self._tar.members.clear()
+
+    def take(self) -> bytes:
+        return self.buffer.take()
+
+    def close(self) -> bytes:
+        (self._zip or self._tar).close()
+        return self.buffer.take()
+
+
+def archive_batch(writer: ArchiveWriter, rows: list, qrcode: Literal["svg", "png"] | None, box_size: int) -> bytes:
+    """ blocking, adds the `.conf` (and qr code) files of a batch of peers, returns the archive bytes produced """
+    for row in rows:
+        peer_config = utils.get_peer_config(row[:len(CONFIG_COLUMNS)])
+        file_name = f"{utils.config_file_name(row.name)}-{row.id.hex[:8]}"
+        writer.add(f"{file_name}.conf", peer_config.encode())
+        if qrcode is not None:
+            writer.add(f"{file_name}.{qrcode}", utils.render_qrcode(peer_config, qrcode, box_size))
+    return writer.take()
+
+
+async def stream_archive(
+        session_factory: Callable[[], AsyncSession],
+        archive_format: ArchiveFormat,
+        *,
+        qrcode: Literal["svg", "png"] | None = None,
+        box_size: int,
+        ids: list[uuid.UUID] | None = None,
+        enabled: bool | None = None,
+        name_prefix: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Archive of the configs of the matching peers, produced while the rows are read in batches of EXPORT_BATCH.
+
+    Runs after the endpoint returned, so it opens its own session. Archiving and qr codes are cpu bound and
+    run in a worker thread, one batch at a time.
+    """
+    writer = ArchiveWriter(archive_format)
+    async with session_factory() as session:
+        result = await crud_peer.stream_configs(
+            session, batch = EXPORT_BATCH, ids = ids, enabled = enabled, name_prefix = name_prefix
+        )
+        async for rows in result.partitions():
+            chunk = await asyncio.to_thread(archive_batch, writer, rows, qrcode, box_size)
+            if chunk:
+                yield chunk
+    yield await asyncio.to_thread(writer.close)
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import logging
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+
+from wg_backend.api import utils
+from wg_backend.core.settings import get_settings
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+
+class QRCodeCache:
+    """
+    Rendered peer config QR codes, least recently used first out once they take more than `max_bytes`.
+
+    Entries are keyed by a hash of the config text and the image options, a peer whose config changed
+    simply misses, `invalidate` frees the entries of an updated or removed peer right away. Concurrent
+    requests for an image being rendered wait for that render, renders run in a worker thread.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._images: OrderedDict[str, tuple[uuid.UUID, bytes]] = OrderedDict()
+        self._peer_keys: dict[uuid.UUID, set[str]] = {}
+        self._renders: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(peer_config: str, image_format: str, box_size: int) -> str:
+        return hashlib.sha256(f"{image_format}|{box_size}|{peer_config}".encode()).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        peer_id, image = self._images.pop(key)
+        self.size -= len(image)
+        keys = self._peer_keys[peer_id]
+        keys.discard(key)
+        if not keys:
+            del self._peer_keys[peer_id]
+
+    def _store(self, peer_id: uuid.UUID, key: str, image: bytes) -> None:
+        if len(image) > self.max_bytes or key in self._images:
+            return
+        self._images[key] = (peer_id, image)
+        self._peer_keys.setdefault(peer_id, set()).add(key)
+        self.size += len(image)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._images)))
+            self.evictions += 1
+
+    async def get(self, peer_id: uuid.UUID, peer_config: str, image_format: str, box_size: int) -> bytes:
+        key = self.key(peer_config, image_format, box_size)
+        cached = self._images.get(key)
+        if cached is not None:
+            self._images.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        render = self._renders.get(key)
+        if render is None:
+            self.misses += 1
+            """ a task of its own, a client leaving doesn't cancel the render others wait for """
+            render = asyncio.create_task(self._render(peer_id, key, peer_config, image_format, box_size))
+            self._renders[key] = render
+        else:
+            self.hits += 1
+        return await asyncio.shield(render)
+
+    async def _render(self, peer_id: uuid.UUID, key: str, peer_config: str, image_format: str, box_size: int) -> bytes:
+        try:
+            image = await asyncio.to_thread(utils.render_qrcode, peer_config, image_format, box_size)
+        finally:
+            del self._renders[key]
+        self._store(peer_id, key, image)
+        return image
+
+    async def prerender(self, peer_id: uuid.UUID, peer_config: str) -> None:
+        """ background task after a peer is created, its onboarding page shows the default svg right away """
+        try:
+            await self.get(peer_id, peer_config, "svg", settings.WG_QR_BOX_SIZE)
+        except Exception as e:
+            logger.warning(f"pre rendering the qr code of peer {peer_id} failed: {e}")
+
+    def invalidate(self, *peer_ids: uuid.UUID) -> None:
+        for peer_id in peer_ids:
+            for key in list(self._peer_keys.get(peer_id, ())):
+                self._drop(key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._images),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+@lru_cache
+def get_qrcode_cache() -> QRCodeCache:
+    return QRCodeCache(max_bytes = settings.WG_QR_CACHE_BYTES)
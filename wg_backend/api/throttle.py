@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from wg_backend.core.settings import get_settings
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" seconds between two passes dropping the buckets that refilled, they hold nothing a new bucket wouldn't """
+PRUNE_INTERVAL = 60.0
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) "
+    "WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID",
+)
+
+
+class LoginThrottle:
+    """
+    Token buckets of login attempts per username and per client ip, shared by the workers of this node
+    through a small sqlite file next to the other runtime files.
+
+    An attempt takes one token from both buckets, an attempt finding one of them empty is refused with the
+    seconds until it holds a token again, and takes nothing, the password is never checked. Buckets refill
+    at `per_minute` tokens per minute up to `burst`, a `per_minute` of 0 disables that bucket. The store is
+    throwaway state, when it can't be used logins are let through and the error is logged.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            user_per_minute: float,
+            user_burst: int,
+            ip_per_minute: float,
+            ip_burst: int,
+            busy_timeout: float,
+    ):
+        self.path = path
+        self.user_rate = user_per_minute / 60
+        self.user_burst = user_burst
+        self.ip_rate = ip_per_minute / 60
+        self.ip_burst = ip_burst
+        self.busy_timeout = busy_timeout
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.user_rate > 0 or self.ip_rate > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents = True, exist_ok = True)
+            db = sqlite3.connect(
+                self.path, timeout = self.busy_timeout, isolation_level = None, check_same_thread = False
+            )
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = OFF")
+            for statement in SCHEMA:
+                db.execute(statement)
+            self._db = db
+        return self._db
+
+    def _take(self, buckets: list[tuple[str, str, float, int]], now: float) -> float:
+        """ (counter, key, rate, burst) of every bucket, 0 when a token was taken from each, else seconds to wait """
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                tokens = {}
+                waits = {}
+                for name, key, rate, burst in buckets:
+                    row = db.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+                    tokens[key] = burst if row is None else min(burst, row[0] + max(now - row[1], 0) * rate)
+                    if tokens[key] < 1:
+                        waits[name] = (1 - tokens[key]) / rate
+                if waits:
+                    counters = list(waits)
+                else:
+                    counters = ["allowed"]
+                    db.executemany(
+                        "INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)",
+                        [(key, key_tokens - 1, now) for key, key_tokens in tokens.items()],
+                    )
+                db.executemany(
+                    "INSERT INTO counter (name, value) VALUES (?, 1) "
+                    "ON CONFLICT (name) DO UPDATE SET value = value + 1",
+                    [(name,) for name in counters],
+                )
+                if now >= self._next_prune:
+                    self._next_prune = now + PRUNE_INTERVAL
+                    self._prune(db, now)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return max(waits.values(), default = 0.0)
+
+    def _prune(self, db: sqlite3.Connection, now: float) -> None:
+        """ a user bucket and an ip bucket refill in burst / rate seconds at most, the longer of the two is kept """
+        refill = max(
+            self.user_burst / self.user_rate if self.user_rate > 0 else 0,
+            self.ip_burst / self.ip_rate if self.ip_rate > 0 else 0,
+        )
+        db.execute("DELETE FROM bucket WHERE updated < ?", (now - refill,))
+
+    async def take(self, username: str, client_ip: str | None) -> float:
+        """ before the password of a login is checked, seconds the client has to wait or 0 """
+        buckets = []
+        if self.user_rate > 0:
+            buckets.append(("throttled_username", f"user:{username.lower()}", self.user_rate, self.user_burst))
+        if self.ip_rate > 0 and client_ip is not None:
+            buckets.append(("throttled_ip", f"ip:{client_ip}", self.ip_rate, self.ip_burst))
+        if not buckets:
+            return 0.0
+        try:
+            return await asyncio.to_thread(self._take, buckets, time.time())
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"login throttle store {self.path} failed, the attempt is let through: {e}")
+            return 0.0
+
+    def _stats(self) -> dict:
+        with self._lock:
+            db = self._connect()
+            counters = dict(db.execute("SELECT name, value FROM counter").fetchall())
+            buckets = db.execute("SELECT count(*) FROM bucket").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "buckets": buckets,
+            "allowed": counters.get("allowed", 0),
+            "throttled_username": counters.get("throttled_username", 0),
+            "throttled_ip": counters.get("throttled_ip", 0),
+        }
+
+    async def stats(self) -> dict:
+        """ counted by all the workers sharing the store """
+        return await asyncio.to_thread(self._stats)
+
+
+@lru_cache
+def get_login_throttle() -> LoginThrottle:
+    return LoginThrottle(
+        path = settings.tmp_dir_path / f"{settings.PROJECT_NAME}.throttle.db",
+        user_per_minute = settings.LOGIN_USER_PER_MINUTE,
+        user_burst = settings.LOGIN_USER_BURST,
+        ip_per_minute = settings.LOGIN_IP_PER_MINUTE,
+        ip_burst = settings.LOGIN_IP_BURST,
+        busy_timeout = settings.SQLITE_BUSY_TIMEOUT,
+    )
@@ -0,0 +1,98 @@
+import time
+from functools import lru_cache
+
+from wg_backend.core.settings import get_settings
+from wg_backend.models.user import User
+
+settings = get_settings()
+
+
+class UserCache:
+    """
+    Users of authenticated requests by token subject (username) for `ttl` seconds, oldest out past `max_entries`.
+
+    Cached users are detached from any session with every column loaded, they are shared by concurrent
+    requests and only read. A user update, deactivation, password change or removal through this worker
+    drops the entry right away. Every user change also bumps the `users` state version, a worker compares
+    it at most every `version_check_interval` seconds and drops all its entries when another worker made one.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, version_check_interval: float):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.clears = 0
+        self.version: int | None = None
+        self._version_checked_at: float | None = None
+        self._users: dict[str, tuple[float, User]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def version_check_due(self) -> bool:
+        """ also on a miss, the version has to be read before the users it covers are """
+        if not self.enabled:
+            return False
+        checked_at = self._version_checked_at
+        return checked_at is None or time.monotonic() - checked_at >= self.version_check_interval
+
+    def set_version(self, version: int) -> None:
+        """ the `users` state version read before the users cached from now on """
+        if self.version is not None and version != self.version and self._users:
+            self._users.clear()
+            self.clears += 1
+        self.version = version
+        self._version_checked_at = time.monotonic()
+
+    def get(self, username: str) -> User | None:
+        cached = self._users.get(username)
+        if cached is not None:
+            expires_at, user = cached
+            if expires_at > time.monotonic():
+                self.hits += 1
+                return user
+            self._users.pop(username, None)
+        self.misses += 1
+        return None
+
+    def put(self, username: str, user: User) -> None:
+        if not self.enabled:
+            return
+        self._users.pop(username, None)
+        while len(self._users) >= self.max_entries:
+            self._users.pop(next(iter(self._users)), None)
+        self._users[username] = (time.monotonic() + self.ttl, user)
+
+    def invalidate(self, *usernames: str | None) -> None:
+        """ also called from sync endpoints in the thread pool, single dict operations only """
+        for username in usernames:
+            if username is not None and self._users.pop(username, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self._users.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._users),
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "clears": self.clears,
+            "version": self.version,
+        }
+
+
+@lru_cache
+def get_user_cache() -> UserCache:
+    return UserCache(
+        ttl = settings.USER_CACHE_TTL,
+        max_entries = settings.USER_CACHE_SIZE,
+        version_check_interval = settings.USER_CACHE_VERSION_CHECK,
+    )
@@ -1,25 +1,35 @@
-import json
+import base64
+import dataclasses
+import hashlib
 import logging
 import os
+import re
 import time
+import uuid
 from dataclasses import dataclass
 from datetime import UTC, datetime, timedelta
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
-from random import randint
-from subprocess import CompletedProcess
-from typing import Any, Callable, Type
+from typing import Any, Callable, Mapping, Type
 
 import emails
 import qrcode
 from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
 from jinja2 import Template
 from jose import jwt
+from qrcode.image.pure import PyPNGImage
 from qrcode.image.svg import SvgPathImage
-from wg_backend.core.settings import execute, get_settings
+from starlette.exceptions import HTTPException
+from wg_backend.core import metrics
+from wg_backend.core.settings import get_settings
 from wg_backend.models.peer import Peer
 from wg_backend.models.wg_interface import WGInterface
-from wg_backend.schemas.Peer import DBPlusStdoutPeer, DbDataPeer, StdoutDumpPeer, StdoutRxTxPlusLhaPeer
+from wg_backend.schemas.Peer import DBPlusStdoutPeer
+from wg_backend.wireguard.base import WGPeerDump
+from wg_backend.wireguard.rates import PeerRate
 
 settings = get_settings()
 logging.basicConfig(level = settings.LOG_LEVEL)
@@ -27,13 +37,35 @@ logger = logging.getLogger(__name__)
 
 
 class TimedRoute(APIRoute):
+    """
+    Sets `X-Response-Time` and records the request metrics, labelled by the path template of the route so
+    the number of series doesn't grow with ids. Streaming responses are measured until they start.
+    """
+
     def get_route_handler(self) -> Callable:
         original_route_handler = super().get_route_handler()
+        route = self.path_format
 
         async def custom_route_handler(request: Request) -> Response:
+            method = request.method
+            in_progress = metrics.REQUESTS_IN_PROGRESS.labels(method, route)
+            in_progress.inc()
+            status_code = 500
             before = time.time()
-            response: Response = await original_route_handler(request)
-            duration = time.time() - before
+            try:
+                response: Response = await original_route_handler(request)
+                status_code = response.status_code
+            except HTTPException as e:
+                status_code = e.status_code
+                raise
+            except RequestValidationError:
+                status_code = 422
+                raise
+            finally:
+                duration = time.time() - before
+                in_progress.dec()
+                metrics.REQUEST_DURATION.labels(method, route).observe(duration)
+                metrics.REQUESTS.labels(method, route, str(status_code)).inc()
             response.headers["X-Response-Time"] = str(duration)
             return response
 
@@ -142,86 +174,77 @@ def verify_password_reset_token(token: str) -> str | None:
         return None
 
 
-def wg_set_cmd(peer: Peer) -> CompletedProcess[str] | CompletedProcess | int:
-    cmd = [
-        "sudo",
-        'wg',
-        'set',
-        settings.WG_INTERFACE_NAME,
-        "peer",
-        peer.public_key,
-        "allowed-ips",
-        peer.address,
-    ]
-    if peer.persistent_keepalive:
-        cmd.extend(["persistent-keepalive", str(peer.persistent_keepalive)])
-    if peer.preshared_key:
-        key_file_path = settings.tmp_dir_path / peer.id.hex
-        with open(key_file_path, "w+") as key_file:
-            key_file.write(peer.preshared_key)
-        cmd.extend(["preshared-key", key_file_path])
-        proc = execute(cmd)
-        os.remove(key_file_path)
-    else:
-        proc = execute(cmd)
-    return proc
+def get_full_config(
+        peers_db_data: list[Any],
+        dump_index: Mapping[str, WGPeerDump],
+        rate_index: Mapping[str, PeerRate] | None = None,
+) -> dict[str, DBPlusStdoutPeer]:
+    """ db rows joined with the interface dump and rates (indexed by public key), linear in the number of peers """
+    full_config: dict[str, DBPlusStdoutPeer] = dict()
+    for db_data in peers_db_data:
+        peer_data = {key: value for key, value in db_data._asdict().items() if value is not None}
+        dump_peer = dump_index.get(peer_data.get("public_key"))
+        if dump_peer is not None:
+            """" adding dump data """
+            peer_data["last_handshake_at"] = dump_peer.last_handshake_at
+            peer_data["transfer_rx"] = dump_peer.transfer_rx
+            peer_data["transfer_tx"] = dump_peer.transfer_tx
+            peer_data["persistent_keepalive"] = dump_peer.persistent_keepalive
+        rate = rate_index.get(peer_data.get("public_key")) if rate_index else None
+        if rate is not None:
+            peer_data.update(dataclasses.asdict(rate))
+        full_config[peer_data.get("public_key")] = DBPlusStdoutPeer(**peer_data)
+    return full_config
 
 
-def wg_set_rm_cmd(peer: Peer) -> CompletedProcess[str] | CompletedProcess | int:
-    cmd = ["sudo", 'wg', 'set', settings.WG_INTERFACE_NAME, "peer", peer.public_key, "remove"]
-    # logger.debug(f"set {peer.name} directly to wg interface")
-    return execute(cmd)
+def encode_peers_cursor(created_at: datetime, peer_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{peer_id.hex}".encode()).decode()
 
 
-def wg_add_conf_cmd(peers_len: int) -> CompletedProcess[str] | CompletedProcess | int:
-    cmd = ["sudo", "wg", "addconf", settings.WG_INTERFACE_NAME, settings.wg_if_peers_config_file_path]
-    # logger.debug(f"adding {peers_len} peers directly to wg interface")
-    return execute(cmd)
+def decode_peers_cursor(cursor: str) -> tuple[datetime, uuid.UUID] | None:
+    try:
+        created_at, peer_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(hex = peer_id)
+    except ValueError:
+        return None
 
 
-def wg_show_dump_cmd() -> CompletedProcess[str] | CompletedProcess | int:
-    cmd = ["sudo", "wg", "show", settings.WG_INTERFACE_NAME, "dump"]
-    # logger.debug(f"loading dump data from {settings.WG_INTERFACE_NAME} wg interface")
-    return execute(cmd)
+def is_handshake_stale(dump_peer: WGPeerDump | None, stale_after: int) -> bool:
+    """ peers missing from the interface or without any handshake are stale too """
+    if dump_peer is None or not dump_peer.latest_handshake:
+        return True
+    return time.time() - dump_peer.latest_handshake > stale_after
 
 
-def wg_show_transfer_cmd() -> CompletedProcess[str] | CompletedProcess | int:
-    cmd = ["sudo", "wg", "show", settings.WG_INTERFACE_NAME, "transfer"]
-    # logger.debug("running ==> \t".join(cmd))
-    return execute(cmd)
+def make_etag(*parts: Any) -> str:
+    """ strong entity tag out of the versions a response is built from """
+    return '"' + "-".join(str(part) for part in parts) + '"'
 
 
-def wg_show_lha_cmd() -> CompletedProcess[str] | CompletedProcess | int:
-    cmd = ["sudo", "wg", "show", settings.WG_INTERFACE_NAME, "latest-handshakes"]
-    logger.debug("running ==> \t".join(cmd))
-    return execute(cmd)
+def etag_matches(request: Request, etag: str, wildcard: bool = True) -> bool:
+    """
+    If-None-Match of a GET is compared weakly (RFC 9110 13.1.2), `*` matches any current representation.
 
+    Pass `wildcard = False` while it isn't known yet whether the resource exists at all.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return (wildcard and "*" in tags) or etag in tags
 
-def get_full_config(
-        peers_db_data: list[Any],
-        dump_result: CompletedProcess | int
-) -> dict[str, DBPlusStdoutPeer] | None:
-    full_config: dict[str, DBPlusStdoutPeer] = dict()
-    if dump_result.stderr:
-        return None
-    dump_peers_str_list = dump_result.stdout.strip()
-    skipped_interface_str = dump_peers_str_list.split(os.linesep)[1::]
-    """ loading db data """
-    peers_list = [DbDataPeer.model_validate(db_data) for db_data in peers_db_data]
-    """ loading dump data """
-    peers_dump_data = [StdoutDumpPeer.from_dump_stdout(db_data) for db_data in skipped_interface_str]
-    for db_peer in peers_list:
-        """" adding db data """
-        full_config[db_peer.public_key] = DBPlusStdoutPeer(**db_peer.model_dump(exclude_none = True))
-        for dump_peer in peers_dump_data:
-            if db_peer.public_key == dump_peer.public_key:
-                """" adding dump data """
-                full_config[db_peer.public_key].last_handshake_at = dump_peer.last_handshake_at,
-                full_config[db_peer.public_key].transfer_rx = dump_peer.transfer_rx,
-                full_config[db_peer.public_key].transfer_tx = dump_peer.transfer_tx,
-                full_config[db_peer.public_key].persistent_keepalive = dump_peer.persistent_keepalive
-                break
-    return full_config
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code = 304, headers = {"ETag": etag})
+
+
+@lru_cache
+def peer_config_fingerprint() -> str:
+    """ settings the peer configurations are rendered with, a restart with other ones changes their tags """
+    rendered_with = (
+        settings.WG_SUBNET, settings.WG_DEFAULT_DNS, settings.WG_MTU, settings.WG_HOST_IP, settings.WG_LISTEN_PORT
+    )
+    return hashlib.sha1(repr(rendered_with).encode()).hexdigest()[:8]
 
 
 def create_wg_quick_config_file(db_wg_if = WGInterface) -> Type[WGInterface]:
@@ -246,50 +269,27 @@ def create_wg_quick_config_file(db_wg_if = WGInterface) -> Type[WGInterface]:
     return db_wg_if
 
 
-def update_peers_config_file(peers: list[Peer]) -> list[str]:
-    # logger.debug("Peers loading from database ...")
-    conf = []
-    for peer in peers:
-        if not peer.enabled:
-            continue
-        conf.append(f"{os.linesep}[Peer]")
-        if peer.friendly_name:
-            conf.append(f"# friendly_name = {peer.friendly_name}")
-        if peer.friendly_json is not None:
-            value = json.dumps(peer.friendly_json)
-            conf.append(f"# friendly_json = {value}")
-        conf.append(f"# Peer: {peer.name} ({peer.id})")
-        conf.append(f"PublicKey = {peer.public_key}")
-        if peer.preshared_key:
-            conf.append(f"PresharedKey = {peer.preshared_key}")
-        # if peer.endpoint_host:
-        #     conf.append(f"Endpoint = {settings.WG_HOST}:{settings.WG_PORT}")
-        if peer.persistent_keepalive:
-            conf.append(f"PersistentKeepalive = {peer.persistent_keepalive}")
-        conf.append(f"AllowedIPs = {peer.address}/32")
-    with open(file = settings.wg_if_peers_config_file_path, mode = "w", encoding = "utf-8") as f:
-        f.write(os.linesep.join(conf))
-        logger.debug(f"Interface peers config file saved to: {settings.wg_if_peers_config_file_path}")
-    return conf
-
-
-def get_rxtx_lha_config(transfer: str, lha: str) -> list[StdoutRxTxPlusLhaPeer]:
-    if transfer and lha:
-        rxtx_list: list[str] = transfer.strip().split(os.linesep)
-        lha_list: list[str] = lha.strip().split(os.linesep)
-        return [
-            StdoutRxTxPlusLhaPeer.from_rxtx_lha_stdout(
-                rx_rt_str = rxtx_str,
-                lha_str = lha_str
-            ) for (rxtx_str, lha_str) in zip(rxtx_list, lha_list)
-        ]
-
-
 def peer_qrcode_svg(peer: Peer):
     peer_config = get_peer_config(peer)
     return qrcode.make(peer_config, image_factory = SvgPathImage, box_size = 30)
 
 
+def config_file_name(peer_name: str) -> str:
+    """ peer name reduced to a safe file name """
+    file_name = re.sub("[^a-zA-Z0-9_=+.-]", "-", peer_name)
+    file_name = re.sub("(-{2,}|-)", "-", file_name)
+    return re.sub("(-)", "", file_name)[:32]
+
+
+def render_qrcode(data: str, image_format: str, box_size: int) -> bytes:
+    """ cpu bound, tens of milliseconds for a peer config """
+    if image_format == "svg":
+        return qrcode.make(data, image_factory = SvgPathImage, box_size = box_size).to_string()
+    buffer = BytesIO()
+    qrcode.make(data, image_factory = PyPNGImage, box_size = box_size).save(buffer)
+    return buffer.getvalue()
+
+
 def get_peer_config(peer: Peer):
     (
         _,
@@ -302,7 +302,7 @@ def get_peer_config(peer: Peer):
     ) = peer
     result: list[str] = []
     result.append(f"{os.linesep}[Interface]")
-    result.append(f"Address = {address}/24")
+    result.append(f"Address = {address}/{settings.WG_SUBNET.network.prefixlen}")
     result.append(f"PrivateKey = {private_key if private_key else 'REPLACE_ME'}")
     if settings.WG_DEFAULT_DNS:
         result.append(f"DNS = {settings.WG_DEFAULT_DNS}")
@@ -316,14 +316,3 @@ def get_peer_config(peer: Peer):
     result.append(f"Endpoint = {settings.WG_HOST_IP}:{settings.WG_LISTEN_PORT}")
     result.append(f"AllowedIPs = {allowed_ips if allowed_ips else 'AllowedIPs = 0.0.0.0/0, ::/0'}")
     return os.linesep.join(result)
-
-
-def generate_new_address(addresses_set: set[str]) -> str | None:
-    default_addr = settings.WG_DEFAULT_ADDRESS
-    new_address = None
-    for i in range(2, 255):
-        random_int = randint(2, 255)
-        new_address = default_addr.replace("x", str(random_int))
-        if new_address not in addresses_set:
-            break
-    return new_address
@@ -0,0 +1,109 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from sqlalchemy import Engine, event
+from wg_backend.core.settings import get_settings
+
+settings = get_settings()
+
+"""
+prometheus_client picks its multiprocess mode when it is first imported, every worker then writes its samples
+to files of its own in this directory and a scrape answered by any worker sums them all.
+"""
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", str(settings.prometheus_multiproc_dir_path))
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram  # noqa: E402
+from prometheus_client import generate_latest, multiprocess  # noqa: E402
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+MULTIPROC_DIR = Path(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+MULTIPROC_DIR.mkdir(parents = True, exist_ok = True)
+
+REQUESTS = Counter(
+    "http_requests_total", "Requests answered, by route template and status code", ["method", "route", "status"]
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Seconds until the response starts", ["method", "route"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled", ["method", "route"], multiprocess_mode = "livesum"
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Seconds per database statement", ["engine", "operation"]
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Database statements that raised", ["engine"])
+WG_COMMAND_DURATION = Histogram(
+    "wg_command_duration_seconds", "Seconds per wg command or netlink request", ["command"]
+)
+WG_COMMAND_FAILURES = Counter(
+    "wg_command_failures_total", "wg commands exiting non zero or timing out, netlink requests failing", ["command"]
+)
+
+""" statement kinds kept as the operation label, anything else (BEGIN, PRAGMA, ...) is `other` """
+OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+
+
+def reset_multiprocess_dir() -> None:
+    """ before the server starts, samples of the workers of an earlier run would be summed in otherwise """
+    shutil.rmtree(MULTIPROC_DIR, ignore_errors = True)
+    MULTIPROC_DIR.mkdir(parents = True, exist_ok = True)
+
+
+def mark_process_dead(pid: int) -> None:
+    """ gunicorn `child_exit`, drops the in progress gauges of a worker that exited """
+    multiprocess.mark_process_dead(pid, str(MULTIPROC_DIR))
+
+
+def statement_operation(statement: str) -> str:
+    operation = statement.split(None, 1)[0].upper() if statement else ""
+    return operation if operation in OPERATIONS else "other"
+
+
+def instrument_engine(engine: Engine, name: str) -> Engine:
+    """ statement durations and errors of `engine` (`AsyncEngine.sync_engine` for async ones) labelled `name` """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        started_at = conn.info["query_started_at"].pop()
+        DB_QUERY_DURATION.labels(name, statement_operation(statement)).observe(time.perf_counter() - started_at)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context) -> None:
+        DB_QUERY_ERRORS.labels(name).inc()
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
+
+    return engine
+
+
+class PeerCountCollector:
+    """ peers and enabled peers per interface, read from the database by the worker answering the scrape """
+
+    def __init__(self, counts: Iterable[tuple[str, int, int]]):
+        self.counts = list(counts)
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        peers = GaugeMetricFamily("wg_peers", "Peers of the interface", labels = ["interface"])
+        enabled = GaugeMetricFamily("wg_peers_enabled", "Enabled peers of the interface", labels = ["interface"])
+        for interface, peers_count, enabled_count in self.counts:
+            peers.add_metric([interface], peers_count)
+            enabled.add_metric([interface], enabled_count)
+        yield peers
+        yield enabled
+
+
+def render(*collectors) -> tuple[bytes, str]:
+    """ text exposition of the samples of every worker, plus `collectors` computed for this scrape """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, str(MULTIPROC_DIR))
+    for collector in collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
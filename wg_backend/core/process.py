@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from functools import lru_cache
+from subprocess import CompletedProcess, DEVNULL, PIPE, TimeoutExpired
+
+from wg_backend.core.metrics import WG_COMMAND_DURATION, WG_COMMAND_FAILURES
+from wg_backend.core.settings import get_settings
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+
+@lru_cache
+def get_command_semaphore() -> asyncio.Semaphore:
+    """ bounds the wg/wg-quick processes a single worker runs at the same time """
+    return asyncio.Semaphore(settings.WG_COMMAND_CONCURRENCY)
+
+
+async def _kill(proc: asyncio.subprocess.Process) -> None:
+    """ `sudo` does not relay SIGKILL, the whole process group started for the command is killed """
+    if proc.returncode is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+    await proc.wait()
+
+
+async def aexecute(cmd: list[str], input_value: str | None = None, timeout: float | None = None) -> CompletedProcess:
+    """
+    Event loop friendly `execute`, the result looks like the one of `subprocess.run`.
+
+    Raises `subprocess.TimeoutExpired` after `timeout` seconds (WG_COMMAND_TIMEOUT by default), the process
+    is killed on timeout and when the awaiting task is cancelled.
+    """
+    timeout = settings.WG_COMMAND_TIMEOUT if timeout is None else timeout
+    """ `wg show`, `wg-quick up`, ... the arguments after the sub command would make a label per peer """
+    command = " ".join([arg for arg in cmd if arg != "sudo"][:2])
+    async with get_command_semaphore():
+        started_at = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin = PIPE if input_value is not None else DEVNULL,
+            stdout = PIPE,
+            stderr = PIPE,
+            start_new_session = True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(input_value.encode("utf-8") if input_value is not None else None),
+                timeout = timeout,
+            )
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            WG_COMMAND_FAILURES.labels(command).inc()
+            logger.error(f"{cmd[:4]} timed out after {timeout}s")
+            raise TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            await _kill(proc)
+            raise
+        finally:
+            WG_COMMAND_DURATION.labels(command).observe(time.perf_counter() - started_at)
+    if proc.returncode:
+        WG_COMMAND_FAILURES.labels(command).inc()
+    return CompletedProcess(cmd, proc.returncode, stdout.decode("utf-8"), stderr.decode("utf-8"))
@@ -1,4 +1,10 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
+from functools import lru_cache
+from typing import Callable
 
 from jose import jwt
 from passlib.context import CryptContext
@@ -6,7 +12,14 @@ from wg_backend.core.settings import get_settings
 
 settings = get_settings()
 
-pwd_context = CryptContext(schemes = ["bcrypt"], deprecated = "auto")
+""" hashes of another cost factor still verify and are rehashed at PASSWORD_BCRYPT_ROUNDS on the next login """
+pwd_context = CryptContext(
+    schemes = ["bcrypt"],
+    deprecated = "auto",
+    bcrypt__default_rounds = settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_rounds = settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__max_rounds = settings.PASSWORD_BCRYPT_ROUNDS,
+)
 
 
 def create_access_token(
@@ -29,3 +42,91 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class PasswordHasherBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"password hasher saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing and verification of the async endpoints on `workers` threads (bcrypt releases the GIL),
+    the event loop only waits for the result.
+
+    At most `queue_size` jobs wait for a thread, one more raises PasswordHasherBusy right away instead of
+    queueing behind seconds of hashing. Only touched from the event loop, the counters need no lock.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, queue_size: int):
+        self.context = context
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.hash_time_total = 0.0
+        self._executor = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "password-hasher")
+
+    def retry_after(self) -> int:
+        """ seconds until the jobs in flight are done, at the average hashing time """
+        hash_time = self.hash_time_total / self.completed if self.completed else 0.5
+        return max(math.ceil(hash_time * self.in_flight / self.workers), 1)
+
+    async def _run(self, fn: Callable, *args):
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise PasswordHasherBusy(self.retry_after())
+
+        def timed():
+            started = time.perf_counter()
+            return started, fn(*args), time.perf_counter()
+
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            started, result, finished = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.in_flight -= 1
+        queue_time = started - submitted
+        self.completed += 1
+        self.queue_time_total += queue_time
+        self.queue_time_max = max(self.queue_time_max, queue_time)
+        self.hash_time_total += finished - started
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """ whether the password matches, and its new hash when the stored one has to be upgraded """
+        verified, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashed += 1
+        return verified, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "queue_time_avg": self.queue_time_total / self.completed if self.completed else 0.0,
+            "queue_time_max": self.queue_time_max,
+            "hash_time_avg": self.hash_time_total / self.completed if self.completed else 0.0,
+        }
+
+
+@lru_cache
+def get_password_hasher() -> PasswordHasher:
+    return PasswordHasher(
+        context = pwd_context,
+        workers = settings.PASSWORD_HASH_WORKERS,
+        queue_size = settings.PASSWORD_HASH_QUEUE_SIZE,
+    )
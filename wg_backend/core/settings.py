@@ -1,4 +1,5 @@
 import json
+import multiprocessing
 import secrets
 import subprocess
 from functools import lru_cache
@@ -8,6 +9,7 @@ from typing import Literal, Optional, Self
 
 from pydantic import Field, IPvAnyAddress, computed_field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy.engine import make_url
 
 
 # import secrets; print(secrets.token_urlsafe(32))
@@ -87,6 +89,25 @@ class BaseConfig(BaseSettings):
     # SQLITE_DIR_PATH: Path = Field(default = Path("var/lib/wireguard"))
     SQLITE_FILE_NAME: str | None = None
     SQLALCHEMY_ECHO_QUERIES_TO_STDOUT: bool = False
+    """ shared database of all workers and api nodes (postgresql+psycopg://...), the sqlite file when unset """
+    DATABASE_URL: str | None = None
+    """ connections this node may open, split between the workers (DB_POOL_SIZE fixes the pool of an engine) """
+    DB_MAX_CONNECTIONS: int = 90
+    DB_POOL_SIZE: int | None = None
+    DB_MAX_OVERFLOW: int = 2
+    """ seconds before a pooled connection is replaced, and seconds a request waits for a free one """
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_TIMEOUT: float = 30.0
+    """ sqlite storage profile, in WAL mode readers don't wait for the writer """
+    SQLITE_JOURNAL_MODE: Literal["WAL", "DELETE", "TRUNCATE"] = "WAL"
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"
+    """ seconds a connection waits for the database lock (and a writer for the writer connection of its worker) """
+    SQLITE_BUSY_TIMEOUT: float = 30.0
+    """ bytes of the file mapped into memory and KiB of page cache, per connection """
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = 64 * 1024
+    """ pooled read only connections per worker """
+    SQLITE_READ_POOL_SIZE: int = 8
 
     """ 
     gunicorn confs
@@ -100,6 +121,22 @@ class BaseConfig(BaseSettings):
     FIRST_SUPERUSER_PASSWORD: str
     USERS_OPEN_REGISTRATION: bool = False
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 180
+    """ seconds the user of a token is served from the worker memory (0 disables), and users kept per worker """
+    USER_CACHE_TTL: float = 10.0
+    USER_CACHE_SIZE: int = 1024
+    """ seconds between two reads of the users state version by a worker, changes of other workers show up then """
+    USER_CACHE_VERSION_CHECK: float = 1.0
+    """ bcrypt cost factor, threads hashing passwords per worker and hashes waiting for one before a 503 """
+    PASSWORD_BCRYPT_ROUNDS: int = Field(default = 12, ge = 4, le = 31)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+    """ login attempts per minute and burst per username and per client ip, shared by the workers (0 disables) """
+    LOGIN_USER_PER_MINUTE: float = 5.0
+    LOGIN_USER_BURST: int = 5
+    LOGIN_IP_PER_MINUTE: float = 30.0
+    LOGIN_IP_BURST: int = 30
+    """ bearer token Prometheus scrapes /metrics with, /metrics answers 404 when unset """
+    METRICS_TOKEN: str | None = None
     WORKERS_PER_CORE: int = 2
     MAX_WORKERS: int | None = None
     WEB_CONCURRENCY: int | None = None
@@ -111,6 +148,43 @@ class BaseConfig(BaseSettings):
     Wireguard interface configs
     """
     WG_INTERFACE_NAME: str = "wg0"
+    """ cli: sudo wg subprocesses, netlink: generic netlink from this process (needs root) """
+    WG_BACKEND: Literal["cli", "netlink"] = "cli"
+    """ python: keys are generated in process, cli: wg genkey/pubkey/genpsk subprocesses """
+    WG_KEY_PROVIDER: Literal["python", "cli"] = "python"
+    """ seconds before a wg command is killed, and how many wg commands a worker runs at once """
+    WG_COMMAND_TIMEOUT: float = 10.0
+    WG_COMMAND_CONCURRENCY: int = 8
+    """ pre generated peer keys, refilled up to WATERMARK when depth drops below LOW_WATERMARK, 0 disables """
+    WG_KEY_POOL_WATERMARK: int = 256
+    WG_KEY_POOL_LOW_WATERMARK: int = 64
+    """ seconds between interface dumps, older snapshots than MAX_AGE are refreshed on read """
+    WG_STATS_INTERVAL: float = 2.0
+    WG_STATS_MAX_AGE: float = 10.0
+    """ seconds of samples the moving average transfer rates of /peers and /peers/rxtx span """
+    WG_RATE_WINDOW: float = 60.0
+    """ ticks a live stats subscriber may fall behind before it gets a full snapshot, seconds between keepalives """
+    WG_STREAM_QUEUE_SIZE: int = 8
+    WG_STREAM_KEEPALIVE: float = 15.0
+    """ bytes of rendered peer config qr codes kept, default qr code box size, render it right after a peer is created """
+    WG_QR_CACHE_BYTES: int = 16 * 1024 * 1024
+    WG_QR_BOX_SIZE: int = 30
+    WG_QR_PRERENDER: bool = True
+    """ upper bound of peers accepted by one bulk request """
+    WG_BULK_MAX_PEERS: int = 5000
+    """ peers config file rewrites requested within this many seconds are coalesced into one write """
+    WG_PEERS_CONF_FLUSH_DELAY: float = 0.5
+    WG_PEERS_CONF_FSYNC: bool = True
+    """ seconds between scheduled interface reconciliations (0 disables), runs after mutations wait DELAY """
+    WG_RECONCILE_INTERVAL: float = 60.0
+    WG_RECONCILE_DELAY: float = 1.0
+    """ seconds per raw traffic history sample (a divisor of 60, 0 disables the history) """
+    WG_TRAFFIC_RAW_STEP: int = 10
+    """ seconds the raw samples and the 1 min, 1 h and 1 day rollups are kept """
+    WG_TRAFFIC_RETENTION_RAW: int = 2 * 86400
+    WG_TRAFFIC_RETENTION_MINUTE: int = 14 * 86400
+    WG_TRAFFIC_RETENTION_HOUR: int = 180 * 86400
+    WG_TRAFFIC_RETENTION_DAY: int = 5 * 365 * 86400
     WG_SUBNET: IPv4Interface | IPv6Interface = Field(default = '10.200.200.0/24')
     NET_DEVICE: str = Field(default_factory = find_local_network_device(find_interface = True))
     WG_HOST_IP: IPvAnyAddress = Field(default_factory = find_local_network_device(find_interface = False))
@@ -152,6 +226,8 @@ class BaseConfig(BaseSettings):
             if not self.DIST_DIR:
                 self.DIST_DIR = BASE_DIR / "dist" / "production"
         self.SQLITE_FILE_NAME = f"{self.PROJECT_NAME}.db" if not self.SQLITE_FILE_NAME else self.SQLITE_FILE_NAME
+        if self.WG_TRAFFIC_RAW_STEP and 60 % self.WG_TRAFFIC_RAW_STEP:
+            raise ValueError("WG_TRAFFIC_RAW_STEP has to divide a minute")
         if (not self.WG_POST_UP) and self.TUNNEL_MODE:
             self.WG_POST_UP = (
                 f"iptables -t nat -A POSTROUTING -s {self.WG_SUBNET} -o {self.NET_DEVICE} -j MASQUERADE; "
@@ -212,6 +288,11 @@ class BaseConfig(BaseSettings):
     def gunicorn_pid_file(self) -> Path:
         return self.pid_file_dir_path / f"gunicorn.{self.PROJECT_NAME}.pid"
 
+    @computed_field()
+    @property
+    def prometheus_multiproc_dir_path(self) -> Path:
+        return self.DIST_DIR / "var/run/prometheus"
+
     @computed_field()
     @property
     def sqlite_dir_path(self) -> Path:
@@ -242,10 +323,63 @@ class BaseConfig(BaseSettings):
     def api_server_address(self) -> str:
         return f"{self.WG_HOST_IP}:{self.WG_LISTEN_PORT}{self.API_ADDRESS}"
 
+    @computed_field  # type: ignore[misc]
+    @property
+    def web_concurrency(self) -> int:
+        """ gunicorn workers """
+        if self.WEB_CONCURRENCY:
+            return self.WEB_CONCURRENCY
+        web_concurrency = max(self.WORKERS_PER_CORE * multiprocessing.cpu_count() + 1, 2)
+        if self.MAX_WORKERS:
+            web_concurrency = min(web_concurrency, self.MAX_WORKERS)
+        return web_concurrency
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def database_is_sqlite(self) -> bool:
+        return self.DATABASE_URL is None or make_url(self.DATABASE_URL).get_backend_name() == "sqlite"
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def db_pool_size(self) -> int:
+        """ every worker has a sync and an async engine, together they stay within DB_MAX_CONNECTIONS """
+        if self.DB_POOL_SIZE:
+            return self.DB_POOL_SIZE
+        return max(self.DB_MAX_CONNECTIONS // (2 * self.web_concurrency) - self.DB_MAX_OVERFLOW, 1)
+
     @computed_field  # type: ignore[misc]
     @property
     def sqlalchemy_database_uri(self) -> str:
-        return f"sqlite:///{self.sqlite_dir_path}/{self.SQLITE_FILE_NAME}"
+        if self.DATABASE_URL is None:
+            return f"sqlite:///{self.sqlite_dir_path}/{self.SQLITE_FILE_NAME}"
+        url = make_url(self.DATABASE_URL)
+        if url.drivername == "postgresql":
+            """ psycopg 3 serves the sync and the async engine """
+            url = url.set(drivername = "postgresql+psycopg")
+        return url.render_as_string(hide_password = False)
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def sqlalchemy_async_database_uri(self) -> str:
+        if self.DATABASE_URL is None:
+            return f"sqlite+aiosqlite:///{self.sqlite_dir_path}/{self.SQLITE_FILE_NAME}"
+        url = make_url(self.sqlalchemy_database_uri)
+        if url.get_backend_name() == "sqlite":
+            url = url.set(drivername = "sqlite+aiosqlite")
+        elif url.drivername == "postgresql+psycopg2":
+            url = url.set(drivername = "postgresql+psycopg")
+        return url.render_as_string(hide_password = False)
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def sqlalchemy_read_database_uri(self) -> str:
+        """ read only connections to the sqlite file, other databases are read through the main engines """
+        return f"sqlite:///file:{make_url(self.sqlalchemy_database_uri).database}?mode=ro&uri=true"
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def sqlalchemy_async_read_database_uri(self) -> str:
+        return f"sqlite+aiosqlite:///file:{make_url(self.sqlalchemy_database_uri).database}?mode=ro&uri=true"
 
     @computed_field()
     @property
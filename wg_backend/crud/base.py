@@ -3,6 +3,8 @@ from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from wg_backend.api import exceptions
 
@@ -81,3 +83,70 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         session.commit()
         session.refresh(obj)
         return obj
+
+
+class AsyncCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init__(self, model: Type[ModelType]):
+        """
+        `CRUDBase` for an `AsyncSession`, same methods awaited.
+
+        **Parameters**
+
+        * `model`: A SQLAlchemy model class
+        """
+        self.model = model
+        logging.basicConfig(level = logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+    async def create(self, session: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType | None:
+        obj_in_data = jsonable_encoder(obj_in)
+        db_obj = self.model(**obj_in_data)  # type: ignore
+        return await self.save(session = session, obj = db_obj)
+
+    async def get_object_or_404(self, session: AsyncSession, instance_id: Any) -> ModelType:
+        orm_object = await session.get(self.model, instance_id)
+        if not orm_object:
+            raise exceptions.not_found_error()
+        return orm_object
+
+    async def get(self, session: AsyncSession, item_id: Any) -> Optional[ModelType]:
+        return await session.get(self.model, item_id)
+
+    async def get_multi(self, session: AsyncSession, *, skip: int = 0, limit: int = 100) -> List[ModelType]:
+        object_list = (await session.scalars(select(self.model).offset(skip).limit(limit))).all()
+        if not object_list:
+            raise exceptions.peer_not_found()
+        return list(object_list)
+
+    async def update(
+            self,
+            session: AsyncSession,
+            *,
+            obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+            db_obj: ModelType,
+    ) -> Optional[ModelType]:
+        if not db_obj:
+            raise exceptions.not_found_error()
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset = True)
+        obj_data = jsonable_encoder(db_obj)
+        for field in obj_data:
+            if field in update_data:
+                setattr(db_obj, field, update_data[field])
+        return await self.save(session = session, obj = db_obj)
+
+    async def remove(self, session: AsyncSession, *, item_id: Any) -> ModelType:
+        obj = await session.get(self.model, item_id)
+        if not obj:
+            raise exceptions.not_found_error()
+        await session.delete(obj)
+        await session.commit()
+        return obj
+
+    async def save(self, session: AsyncSession, obj: ModelType) -> ModelType:
+        session.add(obj)
+        await session.commit()
+        await session.refresh(obj)
+        return obj
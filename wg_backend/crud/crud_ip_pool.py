@@ -0,0 +1,156 @@
+import logging
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_address
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from wg_backend.api import exceptions
+from wg_backend.core.settings import get_settings
+from wg_backend.models.ip_pool import IPFree, IPPool
+from wg_backend.models.peer import Peer
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" concurrent allocations from other workers make an attempt fail, the whole attempt is retried """
+MAX_ATTEMPTS = 10
+""" offsets are stored as signed 64 bit integers, more than enough for sequential allocation in an ipv6 /64 """
+MAX_OFFSET = 2 ** 63 - 1
+
+
+class AllocationConflict(Exception):
+    """ another worker changed the pool between our read and our write """
+
+
+def _subnet() -> IPv4Network | IPv6Network:
+    return settings.WG_SUBNET.network
+
+
+def _locked_pool(session: Session, interface_id: int) -> IPPool | None:
+    """
+    Allocations of one interface queue on the pool row, a server database would otherwise let them all read the
+    same state and fail their attempts one after the other. sqlite ignores FOR UPDATE, its writer lock does this.
+    """
+    return session.execute(
+        select(IPPool).where(IPPool.interface_id == interface_id).with_for_update()
+    ).scalar_one_or_none()
+
+
+def _reserved_offsets(subnet: IPv4Network | IPv6Network) -> set[int]:
+    """ network address, the interface own address and the ipv4 broadcast address are never handed out """
+    reserved = {0}
+    server_ip = settings.WG_SUBNET.ip
+    if server_ip in subnet:
+        reserved.add(int(server_ip) - int(subnet.network_address))
+    if subnet.version == 4 and subnet.prefixlen < 31:
+        reserved.add(subnet.num_addresses - 1)
+    return reserved
+
+
+def _seed_pool(session: Session, interface_id: int, subnet: IPv4Network | IPv6Network) -> IPPool:
+    """ first allocation for this interface (or a changed subnet), one pass over the addresses already in use """
+    reserved = _reserved_offsets(subnet)
+    used = set()
+    for address in session.execute(select(Peer.address).where(Peer.interface_id == interface_id)).scalars():
+        try:
+            peer_ip = ip_address(address)
+        except ValueError:
+            continue
+        if peer_ip in subnet:
+            used.add(int(peer_ip) - int(subnet.network_address))
+    next_offset = max(used, default = 0) + 1
+    session.execute(delete(IPFree).where(IPFree.interface_id == interface_id))
+    session.add_all(
+        IPFree(interface_id = interface_id, offset = offset)
+        for offset in range(1, next_offset) if offset not in used and offset not in reserved
+    )
+    pool = _locked_pool(session, interface_id)
+    if pool is not None and pool.subnet == str(subnet):
+        """ seeded by another worker after our first read, `used` may be missing its allocations """
+        raise AllocationConflict()
+    if pool is None:
+        pool = IPPool(interface_id = interface_id)
+        session.add(pool)
+    pool.subnet = str(subnet)
+    pool.next_offset = next_offset
+    session.flush()
+    logger.info(f"ip pool of interface {interface_id} seeded for {subnet}, {len(used)} addresses in use")
+    return pool
+
+
+def _take_free(session: Session, interface_id: int, count: int) -> list[int]:
+    stmt = select(IPFree.offset).where(IPFree.interface_id == interface_id).order_by(IPFree.offset).limit(count)
+    offsets = list(session.execute(stmt).scalars())
+    if not offsets:
+        return offsets
+    result = session.execute(
+        delete(IPFree).where(IPFree.interface_id == interface_id, IPFree.offset.in_(offsets))
+    )
+    if result.rowcount != len(offsets):
+        raise AllocationConflict()
+    return offsets
+
+
+def _take_fresh(session: Session, pool: IPPool, count: int, subnet: IPv4Network | IPv6Network) -> list[int]:
+    reserved = _reserved_offsets(subnet)
+    capacity = min(subnet.num_addresses, MAX_OFFSET)
+    current = pool.next_offset
+    candidate = current
+    offsets = []
+    while len(offsets) < count:
+        if candidate >= capacity:
+            raise exceptions.wg_max_num_ips_reached()
+        if candidate not in reserved:
+            offsets.append(candidate)
+        candidate += 1
+    result = session.execute(
+        update(IPPool).where(IPPool.id == pool.id, IPPool.next_offset == current).values(next_offset = candidate)
+    )
+    if result.rowcount != 1:
+        raise AllocationConflict()
+    return offsets
+
+
+def allocate_addresses(session: Session, *, interface_id: int, count: int = 1) -> list[str]:
+    """
+    Reserve `count` unused addresses of WG_SUBNET, released addresses first.
+
+    Runs in the caller transaction, so the reservation is committed together with the peers using it.
+    Call it before any other pending change in the session, a conflicting worker makes it roll back and retry.
+    """
+    subnet = _subnet()
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            pool = _locked_pool(session, interface_id)
+            if pool is None or pool.subnet != str(subnet):
+                pool = _seed_pool(session, interface_id, subnet)
+            offsets = _take_free(session, interface_id, count)
+            if len(offsets) < count:
+                offsets.extend(_take_fresh(session, pool, count - len(offsets), subnet))
+            session.flush()
+            return [str(subnet.network_address + offset) for offset in offsets]
+        except (AllocationConflict, IntegrityError, OperationalError) as e:
+            logger.debug(f"address allocation attempt {attempt} conflicted: {e}")
+            session.rollback()
+    raise exceptions.server_error("Could not allocate an address, too many concurrent allocations")
+
+
+def release_addresses(session: Session, *, interface_id: int, addresses: list[str]) -> None:
+    """ hand addresses of removed peers back to the pool, committed by the caller """
+    subnet = _subnet()
+    pool = session.execute(select(IPPool).where(IPPool.interface_id == interface_id)).scalar_one_or_none()
+    if pool is None or pool.subnet != str(subnet):
+        """ the next allocation seeds the pool from the peers table anyway """
+        return
+    reserved = _reserved_offsets(subnet)
+    for address in addresses:
+        try:
+            peer_ip: IPv4Address | IPv6Address = ip_address(address)
+        except ValueError:
+            continue
+        if peer_ip not in subnet:
+            continue
+        offset = int(peer_ip) - int(subnet.network_address)
+        if offset not in reserved and offset < pool.next_offset:
+            session.add(IPFree(interface_id = interface_id, offset = offset))
@@ -1,12 +1,212 @@
-from sqlalchemy.orm import Session
-from wg_backend.crud.base import CRUDBase
+import datetime
+import uuid
+from typing import Any, Sequence
+
+from sqlalchemy import ColumnElement, String, and_, delete, func, insert, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncResult, AsyncSession
+from wg_backend.api import exceptions
+from wg_backend.crud import crud_state, crud_traffic
+from wg_backend.crud.base import AsyncCRUDBase
+from wg_backend.crud.crud_ip_pool import release_addresses
 from wg_backend.models.peer import Peer
+from wg_backend.models.wg_interface import WGInterface
 from wg_backend.schemas.Peer import PeerCreate, PeerUpdate
 
+""" what `utils.get_peer_config` renders a peer config from, in its order """
+CONFIG_COLUMNS = (
+    Peer.name,
+    Peer.private_key,
+    Peer.preshared_key,
+    Peer.if_public_key,
+    Peer.address,
+    Peer.allowed_ips,
+    Peer.persistent_keepalive,
+)
+
+
+class CRUDPeer(AsyncCRUDBase[Peer, PeerCreate, PeerUpdate]):
+    async def save(self, session: AsyncSession, obj: Peer) -> Peer:
+        """ creates and updates, every peers change bumps the peers state version in its transaction """
+        session.add(obj)
+        await crud_state.bump(session, name = crud_state.PEERS)
+        await session.commit()
+        await session.refresh(obj)
+        return obj
+
+    async def create(self, session: AsyncSession, *, obj_in: dict) -> Peer:
+        return await self.save(session, Peer(**obj_in))
+
+    async def create_many(self, session: AsyncSession, *, objs_in: list[dict]) -> list[Peer]:
+        """ one multi row insert, rows come back with server defaults in input order, committed by the caller """
+        peers = list(await session.scalars(insert(Peer).returning(Peer, sort_by_parameter_order = True), objs_in))
+        await crud_state.bump(session, name = crud_state.PEERS)
+        return peers
+
+    async def discard_many(self, session: AsyncSession, *, peers: list[Peer]) -> None:
+        """ drop just created rows the interface refused and hand their addresses back, committed by the caller """
+        if not peers:
+            return
+        await session.execute(delete(Peer).where(Peer.id.in_([peer.id for peer in peers])))
+        await session.run_sync(
+            release_addresses, interface_id = peers[0].interface_id, addresses = [peer.address for peer in peers]
+        )
+        await crud_state.bump(session, name = crud_state.PEERS)
+
+    async def remove(self, session: AsyncSession, *, item_id: uuid.UUID) -> Peer:
+        obj = await session.get(self.model, item_id)
+        if not obj:
+            raise exceptions.not_found_error()
+        await session.run_sync(release_addresses, interface_id = obj.interface_id, addresses = [obj.address])
+        await crud_traffic.remove_for_peers(session, peer_ids = [obj.id])
+        await session.delete(obj)
+        await crud_state.bump(session, name = crud_state.PEERS)
+        await session.commit()
+        return obj
+
+    @staticmethod
+    def _created_at_param(session: AsyncSession, created_at: datetime.datetime) -> Any:
+        """ sqlite keeps the CURRENT_TIMESTAMP server default as text without microseconds, compare as stored """
+        if session.get_bind().dialect.name != "sqlite":
+            return created_at
+        time_format = "%Y-%m-%d %H:%M:%S.%f" if created_at.microsecond else "%Y-%m-%d %H:%M:%S"
+        return literal(created_at.strftime(time_format), String)
+
+    @staticmethod
+    def _filters(
+            *,
+            ids: Sequence[uuid.UUID] | None = None,
+            enabled: bool | None = None,
+            name_prefix: str | None = None,
+    ) -> list[ColumnElement[bool]]:
+        clauses = []
+        if ids is not None:
+            clauses.append(Peer.id.in_(ids))
+        if enabled is not None:
+            clauses.append(Peer.enabled == enabled)
+        if name_prefix:
+            clauses.append(Peer.name.startswith(name_prefix, autoescape = True))
+        return clauses
+
+    async def get_page(
+            self,
+            session: AsyncSession,
+            *,
+            limit: int,
+            after: tuple[datetime.datetime, uuid.UUID] | None = None,
+            enabled: bool | None = None,
+            name_prefix: str | None = None,
+    ) -> Sequence[Any]:
+        """ keyset page ordered by (created_at, id), `after` is the last row of the previous page """
+        stmt = select(Peer.id, Peer.public_key, Peer.name, Peer.enabled, Peer.created_at, Peer.updated_at)
+        if after is not None:
+            created_at = self._created_at_param(session, after[0])
+            stmt = stmt.where(
+                or_(Peer.created_at > created_at, and_(Peer.created_at == created_at, Peer.id > after[1]))
+            )
+        stmt = stmt.where(*self._filters(enabled = enabled, name_prefix = name_prefix))
+        stmt = stmt.order_by(Peer.created_at, Peer.id).limit(limit)
+        return (await session.execute(stmt)).fetchall()
+
+    async def get_config_row(self, session: AsyncSession, *, item_id: uuid.UUID) -> Any | None:
+        return (await session.execute(select(*CONFIG_COLUMNS).where(Peer.id == item_id))).first()
+
+    @staticmethod
+    def config_row(peer: Peer) -> tuple:
+        """ the config row of a loaded peer """
+        return tuple(getattr(peer, column.key) for column in CONFIG_COLUMNS)
+
+    async def stream_configs(
+            self,
+            session: AsyncSession,
+            *,
+            batch: int,
+            ids: Sequence[uuid.UUID] | None = None,
+            enabled: bool | None = None,
+            name_prefix: str | None = None,
+    ) -> AsyncResult:
+        """ config rows plus the peer id, fetched `batch` rows at a time, ordered by creation """
+        stmt = (
+            select(*CONFIG_COLUMNS, Peer.id)
+            .where(*self._filters(ids = ids, enabled = enabled, name_prefix = name_prefix))
+            .order_by(Peer.created_at, Peer.id)
+            .execution_options(yield_per = batch)
+        )
+        return await session.stream(stmt)
+
+    async def get_public_keys(self, session: AsyncSession, *, ids: Sequence[uuid.UUID]) -> dict[uuid.UUID, str]:
+        rows = await session.execute(select(Peer.id, Peer.public_key).where(*self._filters(ids = ids)))
+        return dict(rows.all())
+
+    async def count_by_interface(self, session: AsyncSession) -> list[tuple[str, int, int]]:
+        """ (interface name, peers, enabled peers) of every interface, interfaces without peers included """
+        stmt = (
+            select(
+                WGInterface.interface,
+                func.count(Peer.id),
+                func.count(Peer.id).filter(Peer.enabled.is_(True)),
+            )
+            .outerjoin(Peer, Peer.interface_id == WGInterface.id)
+            .group_by(WGInterface.id, WGInterface.interface)
+        )
+        return [tuple(row) for row in await session.execute(stmt)]
+
+    async def set_enabled_many(
+            self,
+            session: AsyncSession,
+            *,
+            enabled: bool,
+            ids: Sequence[uuid.UUID] | None = None,
+            selected_enabled: bool | None = None,
+            name_prefix: str | None = None,
+    ) -> list[Peer]:
+        """
+        One UPDATE ... RETURNING, only rows whose state actually changes come back.
+
+        `enabled` is the state to set, `selected_enabled` filters on the current one like `ids` and `name_prefix`,
+        a selector in the target state already matches nothing.
+        """
+        stmt = (
+            update(Peer)
+            .where(
+                Peer.enabled != enabled,
+                *self._filters(ids = ids, enabled = selected_enabled, name_prefix = name_prefix),
+            )
+            .values(enabled = enabled)
+            .returning(Peer)
+            .execution_options(synchronize_session = False)
+        )
+        peers = list(await session.scalars(stmt))
+        if peers:
+            await crud_state.bump(session, name = crud_state.PEERS)
+        await session.commit()
+        return peers
 
-class CRUDPeer(CRUDBase[Peer, PeerCreate, PeerUpdate]):
-    def create(self, session: Session, *, obj_in: dict) -> Peer:
-        return self.save(session, Peer(**obj_in))
+    async def remove_many(
+            self,
+            session: AsyncSession,
+            *,
+            ids: Sequence[uuid.UUID] | None = None,
+            enabled: bool | None = None,
+            name_prefix: str | None = None,
+    ) -> Sequence[Any]:
+        """ one DELETE ... RETURNING, addresses of the removed rows go back to the pool """
+        stmt = (
+            delete(Peer)
+            .where(*self._filters(ids = ids, enabled = enabled, name_prefix = name_prefix))
+            .returning(Peer.id, Peer.public_key, Peer.address, Peer.interface_id)
+            .execution_options(synchronize_session = False)
+        )
+        rows = (await session.execute(stmt)).fetchall()
+        addresses: dict[int, list[str]] = {}
+        for row in rows:
+            addresses.setdefault(row.interface_id, []).append(row.address)
+        for interface_id, interface_addresses in addresses.items():
+            await session.run_sync(release_addresses, interface_id = interface_id, addresses = interface_addresses)
+        if rows:
+            await crud_traffic.remove_for_peers(session, peer_ids = [row.id for row in rows])
+            await crud_state.bump(session, name = crud_state.PEERS)
+        await session.commit()
+        return rows
 
 
 crud_peer = CRUDPeer(Peer)
@@ -0,0 +1,30 @@
+from sqlalchemy import Insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from wg_backend.models.state import StateVersion
+
+PEERS = "peers"
+USERS = "users"
+
+
+def _bump_stmt(session: Session | AsyncSession, name: str) -> Insert:
+    insert = sqlite.insert if session.get_bind().dialect.name == "sqlite" else postgresql.insert
+    stmt = insert(StateVersion).values(name = name, version = 1)
+    return stmt.on_conflict_do_update(
+        index_elements = [StateVersion.name], set_ = {"version": StateVersion.version + 1}
+    )
+
+
+async def bump(session: AsyncSession, *, name: str) -> None:
+    """ in the transaction of the change, committed by the caller, the row is created by the first bump """
+    await session.execute(_bump_stmt(session, name))
+
+
+def bump_sync(session: Session, *, name: str) -> None:
+    """ `bump` for the sync sessions """
+    session.execute(_bump_stmt(session, name))
+
+
+async def get_version(session: AsyncSession, *, name: str) -> int:
+    return await session.scalar(select(StateVersion.version).where(StateVersion.name == name)) or 0
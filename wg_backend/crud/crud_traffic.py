@@ -0,0 +1,89 @@
+import uuid
+from typing import Any, Sequence
+
+from sqlalchemy import BigInteger, delete, func, literal, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from wg_backend.models.traffic import PeerTraffic
+
+KEY = [PeerTraffic.peer_id, PeerTraffic.step, PeerTraffic.bucket]
+
+
+def _insert(session: Session):
+    """ both supported databases spell the upsert the same way, through their own insert construct """
+    if session.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(PeerTraffic)
+    return postgresql.insert(PeerTraffic)
+
+
+def _bucket(step: int):
+    """ inlined, a server database only matches the GROUP BY expression when it has no bound parameters """
+    width = literal_column(str(int(step)), BigInteger)
+    return PeerTraffic.bucket // width * width
+
+
+def add_samples(session: Session, *, samples: list[dict[str, Any]]) -> None:
+    """ raw buckets, a bucket written again (another worker took over recording) adds up """
+    stmt = _insert(session)
+    stmt = stmt.on_conflict_do_update(
+        index_elements = KEY,
+        set_ = {"rx": PeerTraffic.rx + stmt.excluded.rx, "tx": PeerTraffic.tx + stmt.excluded.tx},
+    )
+    session.execute(stmt, samples)
+
+
+def last_bucket(session: Session, *, step: int) -> int | None:
+    return session.scalar(select(func.max(PeerTraffic.bucket)).where(PeerTraffic.step == step))
+
+
+def first_bucket(session: Session, *, step: int) -> int | None:
+    return session.scalar(select(func.min(PeerTraffic.bucket)).where(PeerTraffic.step == step))
+
+
+def rollup(session: Session, *, source: int, step: int, start: int, end: int) -> None:
+    """ recomputes the `step` buckets of [start, end) from the `source` rows, running it twice gives the same rows """
+    bucket = _bucket(step)
+    rows = (
+        select(PeerTraffic.peer_id, literal(step), bucket, func.sum(PeerTraffic.rx), func.sum(PeerTraffic.tx))
+        .where(PeerTraffic.step == source, PeerTraffic.bucket >= start, PeerTraffic.bucket < end)
+        .group_by(PeerTraffic.peer_id, bucket)
+    )
+    stmt = _insert(session).from_select(["peer_id", "step", "bucket", "rx", "tx"], rows)
+    stmt = stmt.on_conflict_do_update(index_elements = KEY, set_ = {"rx": stmt.excluded.rx, "tx": stmt.excluded.tx})
+    session.execute(stmt)
+
+
+def prune(session: Session, *, step: int, before: int) -> int:
+    result = session.execute(delete(PeerTraffic).where(PeerTraffic.step == step, PeerTraffic.bucket < before))
+    return result.rowcount
+
+
+async def get_series(
+        session: AsyncSession,
+        *,
+        peer_id: uuid.UUID,
+        resolution: int,
+        step: int,
+        start: int,
+        end: int,
+) -> Sequence[Any]:
+    """ (bucket, rx, tx) rows of `step` seconds summed from the `resolution` rows, empty buckets are left out """
+    bucket = _bucket(step)
+    stmt = (
+        select(bucket.label("bucket"), func.sum(PeerTraffic.rx).label("rx"), func.sum(PeerTraffic.tx).label("tx"))
+        .where(
+            PeerTraffic.peer_id == peer_id,
+            PeerTraffic.step == resolution,
+            PeerTraffic.bucket >= start,
+            PeerTraffic.bucket < end,
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    return (await session.execute(stmt)).fetchall()
+
+
+async def remove_for_peers(session: AsyncSession, *, peer_ids: Sequence[uuid.UUID]) -> None:
+    """ sqlite doesn't enforce the cascade of the foreign key, history of removed peers is dropped here """
+    await session.execute(delete(PeerTraffic).where(PeerTraffic.peer_id.in_(peer_ids)))
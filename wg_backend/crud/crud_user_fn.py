@@ -3,6 +3,8 @@ from typing import Any
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from wg_backend.api import exceptions
+from wg_backend.api.usercache import get_user_cache
+from wg_backend.crud import crud_state
 from wg_backend.core.security import get_password_hash, verify_password
 from wg_backend.models.user import User
 from wg_backend.schemas.user import UserCreate, UserUpdate
@@ -32,13 +34,17 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
         hashed_password = get_password_hash(password)
         del update_data["password"]
         update_data["hashed_password"] = hashed_password
+    """ a renamed user is cached under its old username until dropped here """
+    username = db_user.username
     obj_data = jsonable_encoder(db_user)
     for field in obj_data:
         if field in update_data:
             setattr(db_user, field, update_data[field])
     session.add(db_user)
+    crud_state.bump_sync(session, name = crud_state.USERS)
     session.commit()
     session.refresh(db_user)
+    get_user_cache().invalidate(username, db_user.username)
     return db_user
 
 
@@ -70,5 +76,6 @@ def remove_user(session: Session, *, item_id: int) -> User:
     if not obj:
         raise exceptions.not_found_error()
     session.delete(obj)
+    crud_state.bump_sync(session, name = crud_state.USERS)
     # session.flush()
     return obj
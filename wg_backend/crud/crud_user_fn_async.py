@@ -0,0 +1,113 @@
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from wg_backend.api import exceptions
+from wg_backend.api.usercache import get_user_cache
+from wg_backend.crud import crud_state
+from wg_backend.core.security import PasswordHasherBusy, get_password_hasher
+from wg_backend.models.user import User
+from wg_backend.schemas.user import UserCreate, UserUpdate
+
+
+async def hash_password(password: str) -> str:
+    try:
+        return await get_password_hasher().hash(password)
+    except PasswordHasherBusy as e:
+        raise exceptions.password_hasher_busy(e.retry_after)
+
+
+async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User | None:
+    user_in = user_create.model_dump(exclude_none = True, exclude_unset = True)
+    del user_in['password']
+    user_in["hashed_password"] = await hash_password(user_create.password)
+    db_obj = User(**user_in)
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    return db_obj
+
+
+async def update_user(*, session: AsyncSession, db_user: User, user_in: UserUpdate) -> Any:
+    update_data = user_in.model_dump(exclude_unset = True, exclude_none = True)
+    if "password" in update_data:
+        password = update_data["password"]
+        hashed_password = await hash_password(password)
+        del update_data["password"]
+        update_data["hashed_password"] = hashed_password
+    """ a renamed user is cached under its old username until dropped here """
+    username = db_user.username
+    """ the current user comes from the session of the auth dependency, work on this session copy """
+    db_user = await session.merge(db_user)
+    obj_data = jsonable_encoder(db_user)
+    for field in obj_data:
+        if field in update_data:
+            setattr(db_user, field, update_data[field])
+    session.add(db_user)
+    await crud_state.bump(session, name = crud_state.USERS)
+    await session.commit()
+    await session.refresh(db_user)
+    get_user_cache().invalidate(username, db_user.username)
+    return db_user
+
+
+async def get_user(*, session: AsyncSession, user_id: int) -> User | None:
+    return await session.get(User, user_id)
+
+
+async def get_users(*, session: AsyncSession, skip: int = 0, limit: int = 100) -> list[User]:
+    return list(await session.scalars(select(User).offset(skip).limit(limit)))
+
+
+async def get_user_by_username(*, session: AsyncSession, username: str) -> User | None:
+    return (await session.execute(select(User).where(User.username == username))).scalar_one_or_none()
+
+
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    return (await session.execute(select(User).where(User.email == email))).scalar_one_or_none()
+
+
+async def get_user_by_client_id(*, session: AsyncSession, client_id: str) -> User | None:
+    return (await session.execute(select(User).where(User.client_id == client_id))).scalar_one_or_none()
+
+
+async def authenticate(*, session: AsyncSession, username: str, password: str) -> tuple[User | None, str | None]:
+    """
+    The user when the password matches, and the new hash of the password when the stored one has an outdated
+    cost factor (see `set_password_hash`). The session is closed before the password is checked, no connection
+    or transaction waits for the hashing.
+    """
+    db_user = await get_user_by_username(session = session, username = username)
+    await session.close()
+    if not db_user:
+        return None, None
+    try:
+        verified, new_hash = await get_password_hasher().verify(password, db_user.hashed_password)
+    except PasswordHasherBusy as e:
+        raise exceptions.password_hasher_busy(e.retry_after)
+    if not verified:
+        return None, None
+    return db_user, new_hash
+
+
+async def set_password_hash(*, session: AsyncSession, db_user: User, hashed_password: str) -> None:
+    """ replaces the hash `db_user` was read with, a password changed in the meantime is kept """
+    await session.execute(
+        update(User)
+        .where(User.id == db_user.id, User.hashed_password == db_user.hashed_password)
+        .values(hashed_password = hashed_password)
+    )
+    await session.commit()
+
+
+async def remove_user(session: AsyncSession, *, item_id: int) -> User:
+    """ committed here, the cache entry is only dropped once the removal is visible to the other sessions """
+    obj = await session.get(User, item_id)
+    if not obj:
+        raise exceptions.not_found_error()
+    await session.delete(obj)
+    await crud_state.bump(session, name = crud_state.USERS)
+    await session.commit()
+    get_user_cache().invalidate(obj.username)
+    return obj
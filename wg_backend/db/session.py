@@ -2,17 +2,38 @@ from typing import Annotated
 
 from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from wg_backend.core.metrics import instrument_engine
 from wg_backend.core.settings import get_settings
+from wg_backend.db.sqlite import configure_sqlite_engine
 
 settings = get_settings()
 
+
+def pool_options() -> dict:
+    """ sqlite keeps the driver defaults, pools of a server database are sized from the worker count """
+    if settings.database_is_sqlite:
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+
 engine = create_engine(
     url = settings.sqlalchemy_database_uri,
     pool_pre_ping = True,
     echo = settings.SQLALCHEMY_ECHO_QUERIES_TO_STDOUT,
     future = True,
+    **pool_options(),
 )
+if settings.database_is_sqlite:
+    """ sync sessions are left for the startup and a few rare admin writes, they keep deferred transactions """
+    configure_sqlite_engine(engine)
+instrument_engine(engine, "sync")
 
 SessionFactory = sessionmaker(
     bind = engine,
@@ -38,6 +59,103 @@ def get_session():
 
 SessionDep = Annotated[Session, Depends(get_session)]
 
+if settings.database_is_sqlite:
+    """ single writer of the worker, requests queue for its connection instead of fighting over the file lock """
+    async_engine = create_async_engine(
+        url = settings.sqlalchemy_async_database_uri,
+        pool_pre_ping = True,
+        echo = settings.SQLALCHEMY_ECHO_QUERIES_TO_STDOUT,
+        pool_size = 1,
+        max_overflow = 0,
+        pool_timeout = settings.SQLITE_BUSY_TIMEOUT,
+    )
+    configure_sqlite_engine(async_engine.sync_engine, begin_immediate = True)
+else:
+    async_engine = create_async_engine(
+        url = settings.sqlalchemy_async_database_uri,
+        pool_pre_ping = True,
+        echo = settings.SQLALCHEMY_ECHO_QUERIES_TO_STDOUT,
+        **pool_options(),
+    )
+instrument_engine(async_engine.sync_engine, "async")
+
+if settings.database_is_sqlite:
+    """
+    background jobs writing what they read in the same transaction (the traffic history), transactions take the
+    write lock up front and wait for other writers within the busy timeout instead of failing their lock upgrade
+    """
+    write_engine = create_engine(
+        url = settings.sqlalchemy_database_uri,
+        echo = settings.SQLALCHEMY_ECHO_QUERIES_TO_STDOUT,
+        pool_size = 1,
+        max_overflow = 0,
+        pool_timeout = settings.SQLITE_BUSY_TIMEOUT,
+    )
+    configure_sqlite_engine(write_engine, begin_immediate = True)
+    instrument_engine(write_engine, "sync_write")
+else:
+    write_engine = engine
+
+WriteSessionFactory = sessionmaker(bind = write_engine, autoflush = True, expire_on_commit = False)
+
+AsyncSessionFactory = async_sessionmaker(
+    bind = async_engine,
+    autoflush = True,
+    expire_on_commit = False,
+)
+
+
+async def get_async_session():
+    """ same contract as `get_session`, database I/O runs without blocking the event loop """
+    async with AsyncSessionFactory() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        else:
+            await session.commit()
+
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+if settings.database_is_sqlite:
+    """ pooled read only connections, for the endpoints and background jobs that never write """
+    read_engine = create_engine(
+        url = settings.sqlalchemy_read_database_uri,
+        echo = settings.SQLALCHEMY_ECHO_QUERIES_TO_STDOUT,
+        pool_size = settings.SQLITE_READ_POOL_SIZE,
+        max_overflow = 0,
+        pool_timeout = settings.SQLITE_BUSY_TIMEOUT,
+    )
+    configure_sqlite_engine(read_engine, read_only = True)
+    async_read_engine = create_async_engine(
+        url = settings.sqlalchemy_async_read_database_uri,
+        echo = settings.SQLALCHEMY_ECHO_QUERIES_TO_STDOUT,
+        pool_size = settings.SQLITE_READ_POOL_SIZE,
+        max_overflow = 0,
+        pool_timeout = settings.SQLITE_BUSY_TIMEOUT,
+    )
+    configure_sqlite_engine(async_read_engine.sync_engine, read_only = True)
+    instrument_engine(read_engine, "sync_read")
+    instrument_engine(async_read_engine.sync_engine, "async_read")
+else:
+    """ readers don't block writers there, reads share the pools of the main engines """
+    read_engine = engine
+    async_read_engine = async_engine
+
+ReadSessionFactory = sessionmaker(bind = read_engine, autoflush = False, expire_on_commit = False)
+
+AsyncReadSessionFactory = async_sessionmaker(bind = async_read_engine, autoflush = False, expire_on_commit = False)
+
+
+async def get_async_read_session():
+    async with AsyncReadSessionFactory() as session:
+        yield session
+
+
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_session)]
+
 
 class SessionContextManager:
     def __init__(self):
@@ -0,0 +1,50 @@
+from sqlalchemy import Engine, event
+from wg_backend.core.settings import get_settings
+
+settings = get_settings()
+
+
+def sqlite_pragmas(read_only: bool = False) -> list[str]:
+    """ per connection settings, busy_timeout comes first so switching the journal mode waits for the lock """
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT * 1000)}",
+        f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size = -{settings.SQLITE_CACHE_SIZE}",
+    ]
+    if not read_only:
+        """ journal_mode is stored in the file, read only connections can't change it """
+        pragmas += [
+            f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+            f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        ]
+    return pragmas
+
+
+def configure_sqlite_engine(engine: Engine, read_only: bool = False, begin_immediate: bool = False) -> Engine:
+    """
+    Applies the storage profile to every new connection of `engine` (`AsyncEngine.sync_engine` for async ones).
+
+    With `begin_immediate` transactions take the write lock when they start. A deferred transaction that
+    reads first and writes later can't wait for a concurrent writer, sqlite fails its lock upgrade right away
+    with "database is locked" whatever the busy timeout is.
+    """
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record) -> None:
+        if begin_immediate:
+            """ stops the driver from opening transactions on its own, `on_begin` does it instead """
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    if begin_immediate:
+        @event.listens_for(engine, "begin")
+        def on_begin(connection) -> None:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
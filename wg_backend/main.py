@@ -36,9 +36,9 @@ app.add_middleware(
     allow_origins = settings.BACKEND_CORS_ORIGINS,
     allow_credentials = True,
     # allow_origin_regex = ,
-    # expose_headers=(,),
     allow_methods = ["*"],
     allow_headers = ["X-Response-Time", "*"],
+    expose_headers = ["X-Response-Time", "X-Stats-Age", "X-Next-Cursor"],
 )
 
 app.add_middleware(
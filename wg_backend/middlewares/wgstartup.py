@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import logging
 from typing import AsyncIterator
@@ -5,32 +6,37 @@ from typing import AsyncIterator
 from fastapi import FastAPI
 from fastapi.datastructures import State
 from wg_backend.api import utils
-from wg_backend.api.utils import wg_add_conf_cmd
-from wg_backend.core.settings import execute, get_settings
+from wg_backend.core.process import aexecute
+from wg_backend.core.settings import get_settings
 from wg_backend.crud.crud_wgserver import crud_wg_interface
 from wg_backend.db.session import SessionFactory
+from wg_backend.wireguard.backends import get_wg_backend
+from wg_backend.wireguard.base import WGBackendError
+from wg_backend.wireguard.collector import get_stats_collector
+from wg_backend.wireguard.configstore import get_peers_config_store
+from wg_backend.wireguard.keypool import get_key_pool
+from wg_backend.wireguard.rates import get_rate_tracker
+from wg_backend.wireguard.reconciler import get_reconciler
+from wg_backend.wireguard.stream import get_stats_broadcaster
+from wg_backend.wireguard.traffic import get_traffic_recorder
 
 settings = get_settings()
 
 logging.basicConfig(level = settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+""" wg-quick also runs the Pre/Post Up/Down hooks """
+WG_QUICK_TIMEOUT = 60.0
+
 
 @contextlib.asynccontextmanager
 async def wg_quick_lifespan(application: FastAPI) -> AsyncIterator[State]:
     logger.debug("creating wireguard interface with loaded config from db ...")
     with SessionFactory() as session:
         cmd = ["sudo", "wg", "show", settings.WG_INTERFACE_NAME]
-        proc = execute(cmd)
+        proc = await aexecute(cmd)
         stderr = proc.stderr
         return_code = proc.returncode
-        if not return_code:
-            logger.warning(
-                f"there is a wireguard interface up "
-                f"with name of {settings.WG_INTERFACE_NAME}, trying to down it ..."
-            )
-            rc = execute(["sudo", "wg-quick", "down", settings.wg_if_config_file_path])
-            logger.warning(f"downed it with return code = {rc.returncode}")
         if return_code and 'Operation not permitted' in stderr:
             raise PermissionError('You should run this wg_backend with root privileges')
         elif return_code and 'No such device' not in stderr:
@@ -41,13 +47,49 @@ async def wg_quick_lifespan(application: FastAPI) -> AsyncIterator[State]:
             )
         db_wg_if = crud_wg_interface.get(session = session, item_id = 1)
         utils.create_wg_quick_config_file(db_wg_if = db_wg_if)
-        up_proc = execute(["sudo", "wg-quick", "up", settings.wg_if_config_file_path])
-        utils.update_peers_config_file(peers = db_wg_if.peers)
-        wg_add_conf_cmd(len(db_wg_if.peers))
-        if up_proc.returncode:
-            logger.critical(f"Loading peers file config to wg interface failed. error: \n\t {up_proc.stderr}")
-        else:
-            logger.debug(f"Syncing wg interface with database interface and peers completed.")
+        """ PostUp loads the peers file, it has to be current before the interface comes up """
+        await get_peers_config_store().flush()
+        interface_is_up = not return_code
+        if interface_is_up:
+            device = await get_wg_backend().get_device()
+            if device.public_key == db_wg_if.public_key and device.listen_port == settings.WG_LISTEN_PORT:
+                """ same interface, the reconciler below fixes its peers without dropping every session """
+                logger.info(f"reusing the running wireguard interface {settings.WG_INTERFACE_NAME}")
+            else:
+                logger.warning(
+                    f"there is a wireguard interface up "
+                    f"with name of {settings.WG_INTERFACE_NAME}, trying to down it ..."
+                )
+                rc = await aexecute(
+                    ["sudo", "wg-quick", "down", str(settings.wg_if_config_file_path)], timeout = WG_QUICK_TIMEOUT
+                )
+                logger.warning(f"downed it with return code = {rc.returncode}")
+                interface_is_up = False
+        if not interface_is_up:
+            up_proc = await aexecute(
+                ["sudo", "wg-quick", "up", str(settings.wg_if_config_file_path)], timeout = WG_QUICK_TIMEOUT
+            )
+            if up_proc.returncode:
+                logger.critical(f"Loading peers file config to wg interface failed. error: \n\t {up_proc.stderr}")
+            interface_is_up = not up_proc.returncode
+        if interface_is_up:
+            try:
+                plan = await get_reconciler().reconcile()
+                logger.debug(f"Syncing wg interface with database peers completed, {plan.drift} peers fixed.")
+            except WGBackendError as e:
+                logger.critical(f"Loading peers to wg interface failed. error: \n\t {e}")
         session.close_all()
+    """ follow the collector from its first snapshot, rates are ready after its second one """
+    get_rate_tracker()
+    get_stats_broadcaster()
+    background_tasks = [
+        asyncio.create_task(get_key_pool().run()),
+        asyncio.create_task(get_stats_collector().run()),
+        asyncio.create_task(get_reconciler().run()),
+        asyncio.create_task(get_traffic_recorder().run()),
+    ]
     yield
-    execute(["sudo", "wg-quick", "down", settings.wg_if_config_file_path])
+    for task in background_tasks:
+        task.cancel()
+    await get_peers_config_store().drain()
+    await aexecute(["sudo", "wg-quick", "down", str(settings.wg_if_config_file_path)], timeout = WG_QUICK_TIMEOUT)
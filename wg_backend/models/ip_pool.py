@@ -0,0 +1,23 @@
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String, UniqueConstraint
+
+from wg_backend.db.registry import DateMixin, NameMixin, mapper_registry
+from wg_backend.models.wg_interface import WGInterface
+
+
+@mapper_registry.mapped
+class IPPool(DateMixin, NameMixin):
+    """ allocation state of one interface subnet, offsets are counted from the network address """
+    interface_id = Column(
+        Integer, ForeignKey(WGInterface.id, ondelete = "CASCADE"), nullable = False, unique = True, index = True
+    )
+    subnet = Column(String(64), nullable = False)
+    """ every offset below this one has been handed out at least once """
+    next_offset = Column(BigInteger, nullable = False, default = 1)
+
+
+@mapper_registry.mapped
+class IPFree(NameMixin):
+    """ offsets released by deleted peers, handed out again before next_offset grows """
+    __table_args__ = (UniqueConstraint("interface_id", "offset"),)
+    interface_id = Column(Integer, ForeignKey(WGInterface.id, ondelete = "CASCADE"), nullable = False)
+    offset = Column(BigInteger, nullable = False)
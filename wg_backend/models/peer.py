@@ -1,6 +1,6 @@
 import uuid
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, TIMESTAMP, Uuid
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Integer, String, TIMESTAMP, Uuid
 from sqlalchemy.orm import relationship
 from wg_backend.db.registry import DateMixin, NameMixin, mapper_registry
 from wg_backend.models.wg_interface import WGInterface
@@ -19,8 +19,8 @@ class Peer(DateMixin, NameMixin):
     public_key = Column(String(256), nullable = False)
     if_public_key = Column(String(256), nullable = False, server_default = '')
     address = Column(String(256), nullable = False)
-    transfer_rx = Column(Integer, nullable = False, default = 0)
-    transfer_tx = Column(Integer, nullable = False, default = 0)
+    transfer_rx = Column(BigInteger, nullable = False, default = 0)
+    transfer_tx = Column(BigInteger, nullable = False, default = 0)
     last_handshake_at = Column(TIMESTAMP(timezone = True), index = True, nullable = True, doc = "Last hand shake at")
     endpoint_addr = Column(String(256), nullable = True)
     """ this is for peer side tunnel, all traffic option """
@@ -0,0 +1,15 @@
+from sqlalchemy import BigInteger, Column, String
+
+from wg_backend.db.registry import mapper_registry
+
+
+@mapper_registry.mapped
+class StateVersion:
+    """
+    Counter bumped in every transaction changing the rows it is named after, shared by all workers.
+
+    A response built from those rows can be tagged with the counter and revalidated without being built again.
+    """
+    __tablename__ = "stateversion"
+    name = Column(String(64), primary_key = True)
+    version = Column(BigInteger, nullable = False, default = 0)
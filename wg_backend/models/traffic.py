@@ -0,0 +1,25 @@
+from sqlalchemy import BigInteger, Column, ForeignKey, Index, Integer, Uuid
+
+from wg_backend.db.registry import mapper_registry
+from wg_backend.models.peer import Peer
+
+
+@mapper_registry.mapped
+class PeerTraffic:
+    """
+    Bytes a peer received and sent during one bucket of `step` seconds, raw samples and their rollups share the table.
+
+    Rows are keyed by (peer, step, bucket start) and stored without a rowid on sqlite, the points of one peer at one
+    resolution are a single range of the primary key.
+    """
+    __tablename__ = "peertraffic"
+    __table_args__ = (
+        Index("ix_peertraffic_step_bucket", "step", "bucket"),
+        {"sqlite_with_rowid": False},
+    )
+    peer_id = Column(Uuid(as_uuid = True), ForeignKey(Peer.id, ondelete = "CASCADE"), primary_key = True)
+    step = Column(Integer, primary_key = True)
+    """ unix time of the bucket start """
+    bucket = Column(BigInteger, primary_key = True)
+    rx = Column(BigInteger, nullable = False, default = 0)
+    tx = Column(BigInteger, nullable = False, default = 0)
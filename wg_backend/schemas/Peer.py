@@ -1,11 +1,15 @@
+import dataclasses
 import datetime
 import uuid
-from subprocess import PIPE, Popen
-from typing import Self
+from typing import Literal, Self
 
 from pydantic import BaseModel, Field, model_validator
-from wg_backend.core.settings import execute, get_settings
+from wg_backend.core.settings import get_settings
 from wg_backend.models.wg_interface import WGInterface
+from wg_backend.wireguard.base import WGPeerDump
+from wg_backend.wireguard.keypool import get_key_pool
+from wg_backend.wireguard.keys import get_key_provider
+from wg_backend.wireguard.rates import PeerRate
 
 settings = get_settings()
 
@@ -28,28 +32,18 @@ class PeerCreateForInterface(PeerCreate):
     if_public_key: str
     private_key: str
     public_key: str
-    preshared_key: str | None = Field(default_factory = lambda: execute(["wg", "genpsk"]).stdout.strip())
+    preshared_key: str | None = Field(default_factory = lambda: get_key_provider().preshared_key())
 
     @classmethod
     def create_from_if(cls, db_if: WGInterface, peer_in: PeerCreate) -> Self:
-        """ genkey: Generates a new private key and writes it to stdout """
-        fresh_private_key = execute(["wg", "genkey"]).stdout.strip()
-        """ pubkey: Reads a private key from stdin and writes a public key to stdout """
-        pubkey_proc = Popen(
-            ["wg", "pubkey"],
-            stdin = PIPE,
-            stdout = PIPE,
-            stderr = PIPE,
-            # executable='/bin/bash'
-        )
-        (public_key_stdoutData, public_key_stderrData) = pubkey_proc.communicate(bytes(fresh_private_key, "utf-8"))
-        fresh_public_key = public_key_stdoutData.decode().strip()
+        fresh_keys = get_key_pool().take()
         return cls(
             **peer_in.model_dump(exclude_none = True, exclude = {"interface_id"}),
             interface_id = db_if.id,
             if_public_key = db_if.public_key,
-            private_key = fresh_private_key,
-            public_key = fresh_public_key
+            private_key = fresh_keys.private_key,
+            public_key = fresh_keys.public_key,
+            preshared_key = fresh_keys.preshared_key
         )
 
 
@@ -77,17 +71,58 @@ class DbDataPeer(BaseModel):
         from_attributes = True
 
 
+class PeerBulkResult(BaseModel):
+    """ outcome of one item of a bulk request, `index` is its position in the request body """
+    index: int
+    name: str
+    ok: bool
+    peer: DbDataPeer | None = None
+    error: str | None = None
+
+
+class PeerBulkSelector(BaseModel):
+    """ peers picked by id, by filter or by both, an empty selector would match every peer and is refused """
+    ids: list[uuid.UUID] | None = Field(default = None, max_length = settings.WG_BULK_MAX_PEERS)
+    enabled: bool | None = None
+    name_prefix: str | None = None
+
+    @model_validator(mode = "after")
+    def check_not_empty(self):
+        if self.ids is None and self.enabled is None and not self.name_prefix:
+            raise ValueError("select peers by ids, enabled or name_prefix")
+        return self
+
+
+class PeerBulkMutationResult(BaseModel):
+    action: Literal["enable", "disable", "delete"]
+    count: int
+    peer_ids: list[uuid.UUID]
+    """ wall time of the single database statement and of the single interface batch """
+    db_seconds: float
+    kernel_seconds: float
+    kernel_error: str | None = None
+
+
 class StdoutRxTxPlusLhaPeer(BaseModel):
     public_key: str
     last_handshake_at: datetime.datetime | None = None
     transfer_rx: int | None = 0
     transfer_tx: int | None = 0
+    """ bytes per second between the last two interface dumps and over the last WG_RATE_WINDOW seconds """
+    rx_rate: float | None = None
+    tx_rate: float | None = None
+    rx_rate_avg: float | None = None
+    tx_rate_avg: float | None = None
 
     @classmethod
-    def from_rxtx_lha_stdout(cls, rx_rt_str: str, lha_str: str) -> Self:
-        public_key, transfer_rx, transfer_tx = rx_rt_str.split('\t')
-        public_key, lht = lha_str.split('\t')
-        return cls(public_key = public_key, transfer_rx = transfer_rx, transfer_tx = transfer_tx, last_handshake_at = lht)
+    def from_wg_dump(cls, dump_peer: WGPeerDump, rate: PeerRate | None = None) -> Self:
+        return cls(
+            public_key = dump_peer.public_key,
+            transfer_rx = dump_peer.transfer_rx,
+            transfer_tx = dump_peer.transfer_tx,
+            last_handshake_at = dump_peer.last_handshake_at,
+            **(dataclasses.asdict(rate) if rate is not None else {})
+        )
 
 
 class StdoutDumpPeer(StdoutRxTxPlusLhaPeer):
@@ -97,26 +132,17 @@ class StdoutDumpPeer(StdoutRxTxPlusLhaPeer):
     persistent_keepalive: int | str | None = None
 
     @classmethod
-    def from_dump_stdout(cls, dump_str: str):
-        (
-            public_key,
-            preshared_key,
-            endpoint_addr,
-            allowed_ips,
-            last_handshake_at,
-            transfer_rx,
-            transfer_tx,
-            persistent_keepalive
-        ) = dump_str.split('\t')
+    def from_wg_dump(cls, dump_peer: WGPeerDump, rate: PeerRate | None = None) -> Self:
         return cls(
-            public_key = public_key,
-            preshared_key = preshared_key,
-            endpoint_addr = endpoint_addr,
-            allowed_ips = allowed_ips,
-            last_handshake_at = last_handshake_at,
-            transfer_rx = transfer_rx,
-            transfer_tx = transfer_tx,
-            persistent_keepalive = persistent_keepalive
+            public_key = dump_peer.public_key,
+            preshared_key = dump_peer.preshared_key,
+            endpoint_addr = dump_peer.endpoint,
+            allowed_ips = dump_peer.allowed_ips,
+            last_handshake_at = dump_peer.last_handshake_at,
+            transfer_rx = dump_peer.transfer_rx,
+            transfer_tx = dump_peer.transfer_tx,
+            persistent_keepalive = dump_peer.persistent_keepalive,
+            **(dataclasses.asdict(rate) if rate is not None else {})
         )
 
 
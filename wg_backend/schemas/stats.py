@@ -0,0 +1,106 @@
+import datetime
+import uuid
+
+from pydantic import BaseModel
+
+
+class KeyPoolStats(BaseModel):
+    depth: int
+    watermark: int
+    low_watermark: int
+    hits: int
+    misses: int
+    generated: int
+    """ keys per second during the last refill """
+    refill_rate: float
+    last_refill_at: float | None = None
+
+
+class QRCodeCacheStats(BaseModel):
+    entries: int
+    """ bytes of the cached images """
+    size: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class UserCacheStats(BaseModel):
+    entries: int
+    """ seconds a user is served from the cache """
+    ttl: float
+    max_entries: int
+    hits: int
+    misses: int
+    invalidations: int
+    """ times every entry was dropped, after another worker changed a user """
+    clears: int
+    """ `users` state version the entries were loaded under """
+    version: int | None
+
+
+class PasswordHasherStats(BaseModel):
+    workers: int
+    queue_size: int
+    """ hashes running or waiting for a thread """
+    in_flight: int
+    completed: int
+    """ refused with a 503 because the queue was full """
+    rejected: int
+    """ stored hashes upgraded to the configured cost factor on login """
+    rehashed: int
+    """ seconds waited for a thread, and spent hashing """
+    queue_time_avg: float
+    queue_time_max: float
+    hash_time_avg: float
+
+
+class LoginThrottleStats(BaseModel):
+    enabled: bool
+    """ usernames and client ips with a partly drained bucket """
+    buckets: int
+    """ attempts let through and refused, by the bucket that was empty, counted by every worker """
+    allowed: int
+    throttled_username: int
+    throttled_ip: int
+
+
+class ReconcilerStats(BaseModel):
+    runs: int
+    """ peers found missing, changed or unknown on the interface, and the ones fixed afterwards """
+    drift_found: int
+    drift_fixed: int
+    added: int
+    changed: int
+    removed: int
+    errors: int
+    last_run_at: float | None = None
+    last_duration: float | None = None
+    last_error: str | None = None
+
+
+class ReconcilePlanOut(BaseModel):
+    dry_run: bool
+    drift: int
+    add: list[str]
+    change: list[str]
+    remove: list[str]
+
+
+class TrafficPoint(BaseModel):
+    """ bytes received and sent by the peer during [ts, ts + step) """
+    ts: datetime.datetime
+    rx: int
+    tx: int
+
+
+class PeerTrafficOut(BaseModel):
+    peer_id: uuid.UUID
+    start: datetime.datetime
+    end: datetime.datetime
+    step: int
+    """ stored resolution the points are summed from """
+    resolution: int
+    """ buckets without traffic are left out """
+    points: list[TrafficPoint]
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, model_validator
 
-from wg_backend.core.settings import execute, get_settings
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.keys import get_key_provider
 
 
 settings = get_settings()
@@ -20,15 +21,11 @@ class WGInterfaceCreate(WGInterface):
 
     @model_validator(mode = "after")
     def create_server(self):
-        private_key = execute(["wg", "genkey"])
-        public_key = execute(
-            ["wg", "pubkey"],
-            input_value = private_key.stdout,
-        )
+        private_key, public_key = get_key_provider().keypair()
         if not self.address:
             self.address = settings.WG_DEFAULT_ADDRESS.replace("x", "1")
-        self.private_key = private_key.stdout.strip()
-        self.public_key = public_key.stdout.strip()
+        self.private_key = private_key
+        self.public_key = public_key
         # address = str(settings.WG_HOST_IP),
         self.port = settings.WG_LISTEN_PORT
         if not self.interface:
@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.base import WGBackend
+from wg_backend.wireguard.cli import CLIWGBackend
+from wg_backend.wireguard.netlink import NetlinkWGBackend
+
+settings = get_settings()
+
+backends: dict[str, type[WGBackend]] = {
+    CLIWGBackend.name: CLIWGBackend,
+    NetlinkWGBackend.name: NetlinkWGBackend,
+}
+
+
+@lru_cache
+def get_wg_backend() -> WGBackend:
+    return backends[settings.WG_BACKEND](interface = settings.WG_INTERFACE_NAME)
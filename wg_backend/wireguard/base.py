@@ -0,0 +1,126 @@
+import abc
+import datetime
+import logging
+from dataclasses import dataclass, field
+from ipaddress import ip_network
+from typing import Iterable, Self
+
+from wg_backend.models.peer import Peer
+
+logger = logging.getLogger(__name__)
+
+""" stop retrying peers one by one after this many failures in a row, the interface itself is likely gone """
+MAX_CONSECUTIVE_PEER_ERRORS = 16
+
+
+class WGBackendError(Exception):
+    """ kernel or wg tool refused an operation against the wireguard interface """
+
+
+@dataclass(slots = True)
+class WGPeerSpec:
+    """ desired state of a single peer, what we push to the interface """
+    public_key: str
+    allowed_ips: list[str]
+    preshared_key: str | None = None
+    persistent_keepalive: int | None = None
+
+    @classmethod
+    def from_peer(cls, peer: Peer) -> Self:
+        return cls(
+            public_key = peer.public_key,
+            allowed_ips = [str(ip_network(peer.address))],
+            preshared_key = peer.preshared_key or None,
+            persistent_keepalive = int(peer.persistent_keepalive) if peer.persistent_keepalive else None,
+        )
+
+
+@dataclass(slots = True, frozen = True)
+class WGPeerDump:
+    """ current state of a single peer as reported by the interface """
+    public_key: str
+    preshared_key: str | None = None
+    endpoint: str | None = None
+    allowed_ips: str | None = None
+    latest_handshake: int = 0
+    transfer_rx: int = 0
+    transfer_tx: int = 0
+    persistent_keepalive: int | None = None
+
+    @property
+    def last_handshake_at(self) -> datetime.datetime | None:
+        """ zero means the peer never completed a handshake """
+        if not self.latest_handshake:
+            return None
+        return datetime.datetime.fromtimestamp(self.latest_handshake, tz = datetime.UTC)
+
+
+@dataclass(slots = True, frozen = True)
+class WGDeviceDump:
+    interface: str
+    public_key: str | None = None
+    listen_port: int | None = None
+    fwmark: int | None = None
+    peers: list[WGPeerDump] = field(default_factory = list)
+
+
+class WGBackend(abc.ABC):
+    """
+    Talks to one wireguard interface.
+
+    Implementations only manage peers, bringing the interface up and down stays with wg-quick.
+    """
+    name: str
+
+    def __init__(self, interface: str):
+        self.interface = interface
+
+    @abc.abstractmethod
+    async def get_device(self) -> WGDeviceDump:
+        """ interface and peers state, same information as `wg show <interface> dump` """
+
+    @abc.abstractmethod
+    async def set_peer(self, peer: WGPeerSpec) -> None:
+        """ add a peer or update an existing one """
+
+    @abc.abstractmethod
+    async def remove_peer(self, public_key: str) -> None:
+        """ remove a peer, removing an unknown public key is not an error """
+
+    @abc.abstractmethod
+    async def set_peers(self, peers: Iterable[WGPeerSpec]) -> None:
+        """ add many peers with as few kernel round trips as possible, `replace_peers` updates existing ones """
+
+    async def replace_peers(self, peers: Iterable[WGPeerSpec]) -> None:
+        """ update peers the interface has, allowed ips, keepalive and preshared key replace the current ones """
+        for peer in peers:
+            await self.set_peer(peer)
+
+    @abc.abstractmethod
+    async def remove_peers(self, public_keys: Iterable[str]) -> None:
+        """ remove many peers with as few kernel round trips as possible, unknown public keys are ignored """
+
+    async def try_set_peers(self, peers: list[WGPeerSpec]) -> dict[str, str]:
+        """
+        One batch apply, when the batch is refused every peer is retried alone.
+
+        Returns the error of every peer the interface did not accept, keyed by public key.
+        """
+        try:
+            await self.set_peers(peers)
+            return {}
+        except WGBackendError as e:
+            logger.warning(f"batch apply of {len(peers)} peers failed, retrying one by one: {e}")
+        errors: dict[str, str] = {}
+        consecutive_errors = 0
+        for peer in peers:
+            if consecutive_errors >= MAX_CONSECUTIVE_PEER_ERRORS:
+                errors[peer.public_key] = "not applied, too many consecutive interface errors"
+                continue
+            try:
+                await self.set_peer(peer)
+                consecutive_errors = 0
+            except WGBackendError as e:
+                errors[peer.public_key] = str(e)
+                consecutive_errors += 1
+        return errors
@@ -0,0 +1,144 @@
+import logging
+import os
+from itertools import islice
+from subprocess import CompletedProcess, TimeoutExpired
+from typing import Iterable
+
+from wg_backend.core.process import aexecute
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.base import WGBackend, WGBackendError, WGDeviceDump, WGPeerDump, WGPeerSpec
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" keeps `wg set` argument lists far below ARG_MAX """
+PEERS_PER_COMMAND = 256
+
+
+def _none_or_value(value: str) -> str | None:
+    return None if value in ("(none)", "off", "") else value
+
+
+def parse_dump(stdout: str, interface: str) -> WGDeviceDump:
+    """ parse `wg show <interface> dump`, first line is the interface and every other line is a peer """
+    lines = stdout.strip().split(os.linesep)
+    if not lines or not lines[0]:
+        return WGDeviceDump(interface = interface)
+    _, public_key, listen_port, fwmark = lines[0].split("\t")
+    peers = []
+    for line in lines[1:]:
+        (
+            peer_public_key,
+            preshared_key,
+            endpoint,
+            allowed_ips,
+            latest_handshake,
+            transfer_rx,
+            transfer_tx,
+            persistent_keepalive
+        ) = line.split("\t")
+        keepalive = _none_or_value(persistent_keepalive)
+        peers.append(
+            WGPeerDump(
+                public_key = peer_public_key,
+                preshared_key = _none_or_value(preshared_key),
+                endpoint = _none_or_value(endpoint),
+                allowed_ips = _none_or_value(allowed_ips),
+                latest_handshake = int(latest_handshake),
+                transfer_rx = int(transfer_rx),
+                transfer_tx = int(transfer_tx),
+                persistent_keepalive = int(keepalive) if keepalive else None,
+            )
+        )
+    return WGDeviceDump(
+        interface = interface,
+        public_key = _none_or_value(public_key),
+        listen_port = int(listen_port),
+        fwmark = int(fwmark) if _none_or_value(fwmark) else None,
+        peers = peers,
+    )
+
+
+def peers_config_fragment(peers: Iterable[WGPeerSpec]) -> str:
+    """ [Peer] sections understood by `wg addconf` """
+    conf = []
+    for peer in peers:
+        conf.append("[Peer]")
+        conf.append(f"PublicKey = {peer.public_key}")
+        if peer.preshared_key:
+            conf.append(f"PresharedKey = {peer.preshared_key}")
+        if peer.persistent_keepalive:
+            conf.append(f"PersistentKeepalive = {peer.persistent_keepalive}")
+        conf.append(f"AllowedIPs = {', '.join(peer.allowed_ips)}")
+    return os.linesep.join(conf)
+
+
+def peer_set_args(peer: WGPeerSpec) -> list[str]:
+    """
+    `wg set` arguments of a peer, its allowed ips, keepalive and preshared key replace the ones the interface has.
+
+    wg only reads preshared keys from files: a set one comes through stdin, an empty /dev/null clears it.
+    """
+    return [
+        "peer", peer.public_key,
+        "allowed-ips", ",".join(peer.allowed_ips),
+        "persistent-keepalive", str(peer.persistent_keepalive or "off"),
+        "preshared-key", "/dev/stdin" if peer.preshared_key else "/dev/null",
+    ]
+
+
+class CLIWGBackend(WGBackend):
+    """ every operation runs `sudo wg ...` in a subprocess, without blocking the event loop """
+    name = "cli"
+
+    @staticmethod
+    async def _run(cmd: list[str], input_value: str | None = None) -> CompletedProcess:
+        try:
+            proc = await aexecute(cmd, input_value = input_value)
+        except TimeoutExpired as e:
+            raise WGBackendError(f"{' '.join(cmd[1:4])} timed out after {e.timeout}s") from e
+        except OSError as e:
+            raise WGBackendError(str(e)) from e
+        if proc.returncode:
+            raise WGBackendError(proc.stderr.strip())
+        return proc
+
+    async def get_device(self) -> WGDeviceDump:
+        proc = await self._run(["sudo", "wg", "show", self.interface, "dump"])
+        return parse_dump(proc.stdout, self.interface)
+
+    async def set_peer(self, peer: WGPeerSpec) -> None:
+        cmd = ["sudo", "wg", "set", self.interface, *peer_set_args(peer)]
+        await self._run(cmd, input_value = peer.preshared_key)
+
+    async def remove_peer(self, public_key: str) -> None:
+        await self._run(["sudo", "wg", "set", self.interface, "peer", public_key, "remove"])
+
+    async def set_peers(self, peers: Iterable[WGPeerSpec]) -> None:
+        fragment = peers_config_fragment(peers)
+        if not fragment:
+            return
+        await self._run(["sudo", "wg", "addconf", self.interface, "/dev/stdin"], input_value = fragment)
+
+    async def replace_peers(self, peers: Iterable[WGPeerSpec]) -> None:
+        """ `wg addconf` only adds allowed ips to the ones a peer has, existing peers go through `wg set` """
+        peers = list(peers)
+        for peer in peers:
+            if peer.preshared_key:
+                """ stdin carries a single preshared key, one command each """
+                await self.set_peer(peer)
+        without_psk = (peer for peer in peers if not peer.preshared_key)
+        while chunk := list(islice(without_psk, PEERS_PER_COMMAND)):
+            cmd = ["sudo", "wg", "set", self.interface]
+            for peer in chunk:
+                cmd.extend(peer_set_args(peer))
+            await self._run(cmd)
+
+    async def remove_peers(self, public_keys: Iterable[str]) -> None:
+        public_keys = iter(public_keys)
+        while chunk := list(islice(public_keys, PEERS_PER_COMMAND)):
+            cmd = ["sudo", "wg", "set", self.interface]
+            for public_key in chunk:
+                cmd.extend(["peer", public_key, "remove"])
+            await self._run(cmd)
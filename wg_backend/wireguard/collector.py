@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.backends import get_wg_backend
+from wg_backend.wireguard.base import WGBackend, WGDeviceDump, WGPeerDump
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots = True, frozen = True)
+class StatsSnapshot:
+    """ one full interface dump, never mutated after it is published """
+    generation: int
+    taken_at: float
+    device: WGDeviceDump
+    peers: Mapping[str, WGPeerDump]
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.taken_at)
+
+
+class StatsCollector:
+    """
+    Takes one interface dump every `interval` seconds and publishes it as an immutable snapshot.
+
+    Readers share the latest snapshot, a snapshot older than `max_age` (collector stalled or not
+    started) is refreshed on demand, concurrent readers still trigger a single dump.
+    Listeners get every published snapshot, in the event loop, they must not block.
+    """
+
+    def __init__(self, backend: WGBackend, interval: float, max_age: float):
+        self.backend = backend
+        self.interval = interval
+        self.max_age = max_age
+        self.generation = 0
+        """ generations count per worker, the instance tells the snapshots of two workers apart """
+        self.instance = uuid.uuid4().hex[:8]
+        self._snapshot: StatsSnapshot | None = None
+        self._lock = asyncio.Lock()
+        self._listeners: list[Callable[[StatsSnapshot], None]] = []
+
+    @property
+    def snapshot(self) -> StatsSnapshot | None:
+        return self._snapshot
+
+    async def _refresh(self) -> StatsSnapshot:
+        device = await self.backend.get_device()
+        self.generation += 1
+        self._snapshot = StatsSnapshot(
+            generation = self.generation,
+            taken_at = time.time(),
+            device = device,
+            peers = MappingProxyType({peer.public_key: peer for peer in device.peers}),
+        )
+        for listener in self._listeners:
+            try:
+                listener(self._snapshot)
+            except Exception as e:
+                logger.error(f"stats snapshot listener {listener} failed: {e}")
+        return self._snapshot
+
+    def add_listener(self, listener: Callable[[StatsSnapshot], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[StatsSnapshot], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    async def refresh(self) -> StatsSnapshot:
+        async with self._lock:
+            return await self._refresh()
+
+    async def get_snapshot(self) -> StatsSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.age <= self.max_age:
+            return snapshot
+        generation = self.generation
+        async with self._lock:
+            """ only the first stale reader dumps, the others get its snapshot """
+            if self._snapshot is None or self.generation == generation:
+                return await self._refresh()
+            return self._snapshot
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"collecting wg interface stats failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+@lru_cache
+def get_stats_collector() -> StatsCollector:
+    return StatsCollector(
+        backend = get_wg_backend(),
+        interval = settings.WG_STATS_INTERVAL,
+        max_age = settings.WG_STATS_MAX_AGE,
+    )
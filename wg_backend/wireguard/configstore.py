@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from functools import lru_cache
+from ipaddress import ip_network
+from pathlib import Path
+from typing import Any, Callable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from wg_backend.core.settings import get_settings
+from wg_backend.db.session import ReadSessionFactory
+from wg_backend.models.peer import Peer
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" rows fetched per round trip while streaming peers into the file """
+STREAM_BATCH = 500
+
+
+def render_peer_section(peer: Any) -> str:
+    """ one [Peer] section of `<iface>-peers.conf`, loaded by `wg addconf` in PostUp """
+    conf = [f"{os.linesep}[Peer]"]
+    if peer.friendly_name:
+        conf.append(f"# friendly_name = {peer.friendly_name}")
+    if peer.friendly_json is not None:
+        conf.append(f"# friendly_json = {json.dumps(peer.friendly_json)}")
+    conf.append(f"# Peer: {peer.name} ({peer.id})")
+    conf.append(f"PublicKey = {peer.public_key}")
+    if peer.preshared_key:
+        conf.append(f"PresharedKey = {peer.preshared_key}")
+    if peer.persistent_keepalive:
+        conf.append(f"PersistentKeepalive = {peer.persistent_keepalive}")
+    conf.append(f"AllowedIPs = {ip_network(peer.address)}")
+    return os.linesep.join(conf) + os.linesep
+
+
+class PeersConfigStore:
+    """
+    Keeps `<iface>-peers.conf` in line with the enabled peers of the database.
+
+    The file is always replaced atomically: peers are streamed from the database into a temp file of the
+    same directory, which is fsynced and renamed over the old one, so `wg-quick up` never sees a half
+    written file. Mutations only mark the store dirty, the ones arriving within `flush_delay` seconds
+    share a single rewrite and fsync. A lock file serializes the writers of every worker process.
+
+    Rewriting the whole file stands in for incremental per peer edits on purpose. An in place edit of the
+    file `wg-quick` reads can be seen half done, and keeping it atomic means renaming a complete copy over
+    it anyway. Per peer fragments would still have to be assembled into that one file on every change.
+    A rewrite is a single streamed pass over the enabled peers, and the debounce limits it to one per burst
+    of mutations.
+    """
+
+    def __init__(self, path: Path, session_factory: Callable[[], Session], flush_delay: float, fsync: bool):
+        self.path = Path(path)
+        self.session_factory = session_factory
+        self.flush_delay = flush_delay
+        self.fsync = fsync
+        self.writes = 0
+        self.last_write_at: float | None = None
+        self.last_write_duration: float | None = None
+        self._dirty = False
+        self._pending: asyncio.Task | None = None
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_name(f".{self.path.name}.lock")
+
+    def _stream_peers(self, session: Session):
+        stmt = select(
+            Peer.id,
+            Peer.name,
+            Peer.public_key,
+            Peer.preshared_key,
+            Peer.persistent_keepalive,
+            Peer.address,
+            Peer.friendly_name,
+            Peer.friendly_json,
+        ).where(Peer.enabled == True).order_by(Peer.created_at, Peer.id)  # noqa: E712
+        return session.execute(stmt.execution_options(yield_per = STREAM_BATCH))
+
+    def _fsync_dir(self) -> None:
+        """ makes the rename itself durable """
+        dir_fd = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def write(self) -> int:
+        """ blocking full rewrite from the database, returns the number of peers written """
+        started = time.perf_counter()
+        count = 0
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            fd, tmp_path = tempfile.mkstemp(dir = self.path.parent, prefix = f".{self.path.name}.", suffix = ".tmp")
+            try:
+                with os.fdopen(fd, mode = "w", encoding = "utf-8") as f:
+                    with self.session_factory() as session:
+                        for peer in self._stream_peers(session):
+                            f.write(render_peer_section(peer))
+                            count += 1
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp_path)
+                raise
+            if self.fsync:
+                self._fsync_dir()
+        self.writes += 1
+        self.last_write_at = time.time()
+        self.last_write_duration = time.perf_counter() - started
+        logger.debug(f"{count} peers written to {self.path} in {self.last_write_duration:.3f}s")
+        return count
+
+    async def flush(self) -> int:
+        return await asyncio.to_thread(self.write)
+
+    async def _flush_later(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_delay)
+            """ mutations committed from here on need another pass, earlier ones are read by this one """
+            self._dirty = False
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"writing peers config file {self.path} failed: {e}")
+
+    def mark_dirty(self) -> None:
+        """ call after the peers change is committed """
+        self._dirty = True
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def drain(self) -> None:
+        """ wait for a scheduled rewrite, used on shutdown """
+        if self._pending is not None and not self._pending.done():
+            await self._pending
+
+
+@lru_cache
+def get_peers_config_store() -> PeersConfigStore:
+    return PeersConfigStore(
+        path = settings.wg_if_peers_config_file_path,
+        session_factory = ReadSessionFactory,
+        flush_delay = settings.WG_PEERS_CONF_FLUSH_DELAY,
+        fsync = settings.WG_PEERS_CONF_FSYNC,
+    )
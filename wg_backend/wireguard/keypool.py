@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.keys import KeyProvider, get_key_provider
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" keys generated per worker thread hop while refilling """
+REFILL_BATCH = 32
+
+
+@dataclass(slots = True, frozen = True)
+class PeerKeys:
+    private_key: str
+    public_key: str
+    preshared_key: str
+
+
+class KeyPool:
+    """
+    Bounded pool of pre generated peer keys.
+
+    `take` never waits, it pops a ready key set or generates one synchronously when the pool is empty.
+    A background task started from the lifespan refills the pool to `watermark` whenever it drops
+    below `low_watermark`.
+    """
+
+    def __init__(self, provider: KeyProvider, watermark: int, low_watermark: int):
+        self.provider = provider
+        self.watermark = watermark
+        self.low_watermark = min(low_watermark, watermark)
+        self._keys: deque[PeerKeys] = deque(maxlen = watermark or None)
+        self._refill = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.refill_rate = 0.0
+        self.last_refill_at: float | None = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._keys)
+
+    def generate(self) -> PeerKeys:
+        private_key, public_key = self.provider.keypair()
+        return PeerKeys(private_key, public_key, self.provider.preshared_key())
+
+    def take(self) -> PeerKeys:
+        try:
+            keys = self._keys.popleft()
+            self.hits += 1
+        except IndexError:
+            keys = self.generate()
+            self.misses += 1
+        if self._loop is not None and len(self._keys) < self.low_watermark:
+            self._loop.call_soon_threadsafe(self._refill.set)
+        return keys
+
+    def _generate_batch(self, count: int) -> list[PeerKeys]:
+        return [self.generate() for _ in range(count)]
+
+    async def fill(self) -> int:
+        """ top the pool up to the watermark, key generation runs off the event loop """
+        started = time.perf_counter()
+        added = 0
+        while (missing := self.watermark - len(self._keys)) > 0:
+            batch = await asyncio.to_thread(self._generate_batch, min(missing, REFILL_BATCH))
+            self._keys.extend(batch)
+            added += len(batch)
+        if added:
+            elapsed = time.perf_counter() - started
+            self.generated += added
+            self.refill_rate = added / elapsed if elapsed else float(added)
+            self.last_refill_at = time.time()
+            logger.debug(f"key pool refilled with {added} keys at {self.refill_rate:.0f} keys/s")
+        return added
+
+    async def run(self) -> None:
+        if not self.watermark:
+            return
+        self._loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._refill.clear()
+                await self.fill()
+                await self._refill.wait()
+        finally:
+            self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "watermark": self.watermark,
+            "low_watermark": self.low_watermark,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "refill_rate": self.refill_rate,
+            "last_refill_at": self.last_refill_at,
+        }
+
+
+@lru_cache
+def get_key_pool() -> KeyPool:
+    return KeyPool(
+        provider = get_key_provider(),
+        watermark = settings.WG_KEY_POOL_WATERMARK,
+        low_watermark = settings.WG_KEY_POOL_LOW_WATERMARK,
+    )
@@ -0,0 +1,87 @@
+import abc
+import os
+from base64 import b64decode, b64encode
+from functools import lru_cache
+from subprocess import PIPE, Popen
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from wg_backend.core.settings import execute, get_settings
+
+settings = get_settings()
+
+
+def _clamp(scalar: bytes) -> bytes:
+    """ same clamping `wg genkey` applies to its random bytes """
+    clamped = bytearray(scalar)
+    clamped[0] &= 248
+    clamped[31] &= 127
+    clamped[31] |= 64
+    return bytes(clamped)
+
+
+class KeyProvider(abc.ABC):
+    """ base64 wireguard keys, same format `wg genkey`, `wg pubkey` and `wg genpsk` print """
+    name: str
+
+    @abc.abstractmethod
+    def private_key(self) -> str:
+        ...
+
+    @abc.abstractmethod
+    def public_key(self, private_key: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def preshared_key(self) -> str:
+        ...
+
+    def keypair(self) -> tuple[str, str]:
+        private_key = self.private_key()
+        return private_key, self.public_key(private_key)
+
+
+class PythonKeyProvider(KeyProvider):
+    """ generates keys inside this process with `cryptography` """
+    name = "python"
+
+    def private_key(self) -> str:
+        return b64encode(_clamp(os.urandom(32))).decode()
+
+    def public_key(self, private_key: str) -> str:
+        raw_private_key = b64decode(private_key)
+        if len(raw_private_key) != 32:
+            raise ValueError("Invalid WireGuard key length")
+        raw_public_key = X25519PrivateKey.from_private_bytes(raw_private_key).public_key().public_bytes_raw()
+        return b64encode(raw_public_key).decode()
+
+    def preshared_key(self) -> str:
+        return b64encode(os.urandom(32)).decode()
+
+
+class CLIKeyProvider(KeyProvider):
+    """ runs the wg tool for every key """
+    name = "cli"
+
+    def private_key(self) -> str:
+        """ genkey: Generates a new private key and writes it to stdout """
+        return execute(["wg", "genkey"]).stdout.strip()
+
+    def public_key(self, private_key: str) -> str:
+        """ pubkey: Reads a private key from stdin and writes a public key to stdout """
+        pubkey_proc = Popen(["wg", "pubkey"], stdin = PIPE, stdout = PIPE, stderr = PIPE)
+        (public_key_stdout_data, _) = pubkey_proc.communicate(bytes(private_key, "utf-8"))
+        return public_key_stdout_data.decode().strip()
+
+    def preshared_key(self) -> str:
+        return execute(["wg", "genpsk"]).stdout.strip()
+
+
+key_providers: dict[str, type[KeyProvider]] = {
+    PythonKeyProvider.name: PythonKeyProvider,
+    CLIKeyProvider.name: CLIKeyProvider,
+}
+
+
+@lru_cache
+def get_key_provider() -> KeyProvider:
+    return key_providers[settings.WG_KEY_PROVIDER]()
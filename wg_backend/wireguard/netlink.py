@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import threading
+import time
+from base64 import b64encode
+from ipaddress import ip_network
+from itertools import islice
+from socket import AF_INET, AF_INET6
+from typing import Any, Iterable
+
+from pyroute2 import WireGuard
+from pyroute2.netlink import NLM_F_ACK, NLM_F_REQUEST
+from pyroute2.netlink.exceptions import NetlinkError
+from pyroute2.netlink.generic.wireguard import WG_CMD_SET_DEVICE, WG_GENL_VERSION, wgmsg
+from wg_backend.core.metrics import WG_COMMAND_DURATION, WG_COMMAND_FAILURES
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.base import WGBackend, WGBackendError, WGDeviceDump, WGPeerDump, WGPeerSpec
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" peer flags from linux/wireguard.h, pyroute2 ships them as bit positions instead of masks """
+WGPEER_F_REMOVE_ME = 1 << 0
+WGPEER_F_REPLACE_ALLOWEDIPS = 1 << 1
+
+""" an all zero preshared key is how the kernel stores none, sending it clears the one a peer has """
+NO_PRESHARED_KEY = b64encode(bytes(32)).decode()
+
+""" keeps every set-device message well under the default netlink socket buffer """
+PEERS_PER_MESSAGE = 64
+
+
+def _decode(value: Any) -> Any:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _allowed_ips_attrs(allowed_ips: Iterable[str]) -> list[dict]:
+    attrs = []
+    for allowed_ip in allowed_ips:
+        network = ip_network(allowed_ip, strict = False)
+        attrs.append({
+            "attrs": [
+                ["WGALLOWEDIP_A_FAMILY", AF_INET if network.version == 4 else AF_INET6],
+                ["WGALLOWEDIP_A_IPADDR", network.network_address.packed],
+                ["WGALLOWEDIP_A_CIDR_MASK", network.prefixlen],
+            ]
+        })
+    return attrs
+
+
+class NetlinkWGBackend(WGBackend):
+    """
+    Talks wireguard generic netlink directly, no process is spawned.
+
+    Needs CAP_NET_ADMIN, so the app itself has to run as root instead of relying on sudo.
+    """
+    name = "netlink"
+
+    def __init__(self, interface: str):
+        super().__init__(interface)
+        self._lock = threading.Lock()
+        self._socket: WireGuard | None = None
+
+    def _wg(self) -> WireGuard:
+        if self._socket is None:
+            self._socket = WireGuard()
+        return self._socket
+
+    def _request(self, fn, *args) -> Any:
+        """ netlink sockets are not thread safe, serialize and reopen the socket after a failure """
+        command = f"netlink {fn.__name__.strip('_')}"
+        with self._lock:
+            started_at = time.perf_counter()
+            try:
+                return fn(*args)
+            except NetlinkError as e:
+                WG_COMMAND_FAILURES.labels(command).inc()
+                raise WGBackendError(f"netlink error {e.code}: {e}") from e
+            except OSError as e:
+                WG_COMMAND_FAILURES.labels(command).inc()
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+                raise WGBackendError(str(e)) from e
+            finally:
+                WG_COMMAND_DURATION.labels(command).observe(time.perf_counter() - started_at)
+
+    def _get_device(self) -> WGDeviceDump:
+        messages = self._wg().info(self.interface)
+        public_key = listen_port = fwmark = None
+        peers: dict[str, WGPeerDump] = {}
+        allowed_ips: dict[str, list[str]] = {}
+        for msg in messages:
+            """ big devices are split over several messages, device attributes are only in the first one """
+            public_key = public_key or _decode(msg.get_attr("WGDEVICE_A_PUBLIC_KEY"))
+            listen_port = listen_port or msg.get_attr("WGDEVICE_A_LISTEN_PORT")
+            fwmark = fwmark or msg.get_attr("WGDEVICE_A_FWMARK")
+            for nl_peer in msg.get_attr("WGDEVICE_A_PEERS") or []:
+                peer_public_key = _decode(nl_peer.get_attr("WGPEER_A_PUBLIC_KEY"))
+                ips = [ip["addr"] for ip in nl_peer.get_attr("WGPEER_A_ALLOWEDIPS") or [] if "addr" in ip]
+                if peer_public_key in peers:
+                    """ a peer with many allowed ips continues in the next message """
+                    allowed_ips[peer_public_key].extend(ips)
+                    continue
+                allowed_ips[peer_public_key] = ips
+                endpoint = nl_peer.get_attr("WGPEER_A_ENDPOINT")
+                handshake = nl_peer.get_attr("WGPEER_A_LAST_HANDSHAKE_TIME")
+                preshared_key = _decode(nl_peer.get_attr("WGPEER_A_PRESHARED_KEY"))
+                peers[peer_public_key] = WGPeerDump(
+                    public_key = peer_public_key,
+                    preshared_key = preshared_key if preshared_key and preshared_key.strip("A=") else None,
+                    endpoint = f"{endpoint['addr']}:{endpoint['port']}" if endpoint and endpoint.get("port") else None,
+                    latest_handshake = handshake["tv_sec"] if handshake else 0,
+                    transfer_rx = nl_peer.get_attr("WGPEER_A_RX_BYTES") or 0,
+                    transfer_tx = nl_peer.get_attr("WGPEER_A_TX_BYTES") or 0,
+                    persistent_keepalive = nl_peer.get_attr("WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL") or None,
+                )
+        return WGDeviceDump(
+            interface = self.interface,
+            public_key = public_key,
+            listen_port = listen_port,
+            fwmark = fwmark or None,
+            peers = [
+                WGPeerDump(
+                    public_key = peer.public_key,
+                    preshared_key = peer.preshared_key,
+                    endpoint = peer.endpoint,
+                    allowed_ips = ",".join(allowed_ips[public_key]) or None,
+                    latest_handshake = peer.latest_handshake,
+                    transfer_rx = peer.transfer_rx,
+                    transfer_tx = peer.transfer_tx,
+                    persistent_keepalive = peer.persistent_keepalive,
+                ) for public_key, peer in peers.items()
+            ],
+        )
+
+    @staticmethod
+    def _peer_attrs(peer: WGPeerSpec) -> dict:
+        attrs = [
+            ["WGPEER_A_PUBLIC_KEY", peer.public_key],
+            ["WGPEER_A_FLAGS", WGPEER_F_REPLACE_ALLOWEDIPS],
+            ["WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL", peer.persistent_keepalive or 0],
+            ["WGPEER_A_ALLOWEDIPS", _allowed_ips_attrs(peer.allowed_ips)],
+            ["WGPEER_A_PRESHARED_KEY", peer.preshared_key or NO_PRESHARED_KEY],
+        ]
+        return {"attrs": attrs}
+
+    def _set_device_peers(self, nl_peers: Iterable[dict]) -> None:
+        nl_peers = iter(nl_peers)
+        wg = self._wg()
+        while chunk := list(islice(nl_peers, PEERS_PER_MESSAGE)):
+            msg = wgmsg()
+            msg["cmd"] = WG_CMD_SET_DEVICE
+            msg["version"] = WG_GENL_VERSION
+            msg["attrs"].append(["WGDEVICE_A_IFNAME", self.interface])
+            msg["attrs"].append(["WGDEVICE_A_PEERS", chunk])
+            wg.nlm_request(msg, msg_type = wg.prid, msg_flags = NLM_F_REQUEST | NLM_F_ACK)
+
+    async def get_device(self) -> WGDeviceDump:
+        return await asyncio.to_thread(self._request, self._get_device)
+
+    async def set_peer(self, peer: WGPeerSpec) -> None:
+        await self.set_peers([peer])
+
+    async def remove_peer(self, public_key: str) -> None:
+        await self.remove_peers([public_key])
+
+    async def remove_peers(self, public_keys: Iterable[str]) -> None:
+        nl_peers = [
+            {"attrs": [["WGPEER_A_PUBLIC_KEY", public_key], ["WGPEER_A_FLAGS", WGPEER_F_REMOVE_ME]]}
+            for public_key in public_keys
+        ]
+        await asyncio.to_thread(self._request, self._set_device_peers, nl_peers)
+
+    async def set_peers(self, peers: Iterable[WGPeerSpec]) -> None:
+        nl_peers = [self._peer_attrs(peer) for peer in peers]
+        await asyncio.to_thread(self._request, self._set_device_peers, nl_peers)
+
+    async def replace_peers(self, peers: Iterable[WGPeerSpec]) -> None:
+        """ every peer is sent with WGPEER_F_REPLACE_ALLOWEDIPS, a batch updates existing peers as well """
+        await self.set_peers(peers)
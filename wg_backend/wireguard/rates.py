@@ -0,0 +1,121 @@
+import math
+from array import array
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable
+
+from wg_backend.core.settings import get_settings
+from wg_backend.wireguard.collector import StatsCollector, StatsSnapshot, get_stats_collector
+from wg_backend.wireguard.traffic import counter_delta
+
+settings = get_settings()
+
+
+@dataclass(slots = True, frozen = True)
+class PeerRate:
+    """ bytes per second, between the last two samples and over the moving average window """
+    rx_rate: float
+    tx_rate: float
+    rx_rate_avg: float
+    tx_rate_avg: float
+
+
+class RateRing:
+    """
+    The last `capacity` samples of one peer in three fixed size arrays, oldest overwritten first.
+
+    rx and tx are running totals (sum of the counter deltas), they never go backwards when the
+    interface restarts and its counters start over from zero.
+    """
+
+    __slots__ = ("ts", "rx", "tx", "head", "size", "last_rx", "last_tx")
+
+    def __init__(self, capacity: int):
+        self.ts = array("d", bytes(8 * capacity))
+        self.rx = array("q", bytes(8 * capacity))
+        self.tx = array("q", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        self.last_rx: int | None = None
+        self.last_tx: int | None = None
+
+    def append(self, ts: float, transfer_rx: int, transfer_tx: int) -> None:
+        capacity = len(self.ts)
+        previous = (self.head - 1) % capacity
+        if self.last_rx is None:
+            rx = tx = 0
+        else:
+            rx = self.rx[previous] + counter_delta(self.last_rx, transfer_rx)
+            tx = self.tx[previous] + counter_delta(self.last_tx, transfer_tx)
+        self.last_rx, self.last_tx = transfer_rx, transfer_tx
+        self.ts[self.head], self.rx[self.head], self.tx[self.head] = ts, rx, tx
+        self.head = (self.head + 1) % capacity
+        self.size = min(self.size + 1, capacity)
+
+    def rate(self, window: float) -> PeerRate | None:
+        if self.size < 2:
+            return None
+        capacity = len(self.ts)
+        newest = (self.head - 1) % capacity
+        previous = (self.head - 2) % capacity
+        """ oldest sample still inside the window, at least the previous one, the ring is sized to the window """
+        oldest = (self.head - self.size) % capacity
+        while oldest != previous and self.ts[newest] - self.ts[oldest] > window:
+            oldest = (oldest + 1) % capacity
+        elapsed = self.ts[newest] - self.ts[previous]
+        elapsed_avg = self.ts[newest] - self.ts[oldest]
+        if elapsed <= 0 or elapsed_avg <= 0:
+            return None
+        return PeerRate(
+            rx_rate = (self.rx[newest] - self.rx[previous]) / elapsed,
+            tx_rate = (self.tx[newest] - self.tx[previous]) / elapsed,
+            rx_rate_avg = (self.rx[newest] - self.rx[oldest]) / elapsed_avg,
+            tx_rate_avg = (self.tx[newest] - self.tx[oldest]) / elapsed_avg,
+        )
+
+
+class RateTracker:
+    """
+    Follows the collector snapshots and keeps a RateRing per peer on the interface, peers leaving the
+    interface are forgotten. Rates are computed on read, only for the peers a response holds.
+    """
+
+    def __init__(self, collector: StatsCollector, window: float):
+        self.collector = collector
+        self.window = window
+        """ enough samples to cover the window at the collector interval, plus the one opening it """
+        self.capacity = max(math.ceil(window / collector.interval) + 1, 2)
+        self._rings: dict[str, RateRing] = {}
+        self._generation = 0
+
+    def observe(self, snapshot: StatsSnapshot) -> None:
+        """ collector listener """
+        if snapshot.generation <= self._generation:
+            return
+        self._generation = snapshot.generation
+        rings = {}
+        for public_key, peer in snapshot.peers.items():
+            ring = self._rings.get(public_key) or RateRing(self.capacity)
+            ring.append(snapshot.taken_at, peer.transfer_rx, peer.transfer_tx)
+            rings[public_key] = ring
+        self._rings = rings
+
+    def get(self, public_key: str) -> PeerRate | None:
+        ring = self._rings.get(public_key)
+        return ring.rate(self.window) if ring is not None else None
+
+    def rates(self, public_keys: Iterable[str]) -> dict[str, PeerRate]:
+        rates = {}
+        for public_key in public_keys:
+            rate = self.get(public_key)
+            if rate is not None:
+                rates[public_key] = rate
+        return rates
+
+
+@lru_cache
+def get_rate_tracker() -> RateTracker:
+    collector = get_stats_collector()
+    tracker = RateTracker(collector = collector, window = settings.WG_RATE_WINDOW)
+    collector.add_listener(tracker.observe)
+    return tracker
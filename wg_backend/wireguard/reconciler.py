@@ -0,0 +1,231 @@
+import asyncio
+import fcntl
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from ipaddress import ip_network
+from pathlib import Path
+from typing import Callable, Mapping, TextIO
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from wg_backend.core.settings import get_settings
+from wg_backend.db.session import ReadSessionFactory
+from wg_backend.models.peer import Peer
+from wg_backend.models.wg_interface import WGInterface
+from wg_backend.wireguard.backends import get_wg_backend
+from wg_backend.wireguard.base import WGBackend, WGPeerDump, WGPeerSpec
+from wg_backend.wireguard.collector import StatsCollector, get_stats_collector
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+""" rows fetched per round trip while loading the desired state """
+STREAM_BATCH = 500
+
+
+def _allowed_ips_set(allowed_ips: str | list[str] | None) -> frozenset[str]:
+    if not allowed_ips:
+        return frozenset()
+    if isinstance(allowed_ips, str):
+        allowed_ips = allowed_ips.split(",")
+    return frozenset(str(ip_network(ip.strip(), strict = False)) for ip in allowed_ips if ip.strip())
+
+
+@dataclass(slots = True)
+class ReconcilePlan:
+    """ minimal set of operations that turns the interface peers into the enabled peers of the database """
+    add: list[WGPeerSpec] = field(default_factory = list)
+    change: list[WGPeerSpec] = field(default_factory = list)
+    remove: list[str] = field(default_factory = list)
+
+    @property
+    def drift(self) -> int:
+        return len(self.add) + len(self.change) + len(self.remove)
+
+
+def diff_peers(desired: Mapping[str, WGPeerSpec], actual: Mapping[str, WGPeerDump]) -> ReconcilePlan:
+    plan = ReconcilePlan()
+    for public_key, spec in desired.items():
+        current = actual.get(public_key)
+        if current is None:
+            plan.add.append(spec)
+            continue
+        if (
+                _allowed_ips_set(spec.allowed_ips) != _allowed_ips_set(current.allowed_ips)
+                or (spec.preshared_key or None) != current.preshared_key
+                or (spec.persistent_keepalive or None) != current.persistent_keepalive
+        ):
+            plan.change.append(spec)
+    plan.remove = [public_key for public_key in actual if public_key not in desired]
+    return plan
+
+
+class Reconciler:
+    """
+    Converges the interface peers to the enabled peers of the database, keyed by public key.
+
+    Runs on demand, shortly after mutations (`schedule`, requests within `delay` seconds share one run)
+    and every `interval` seconds from the lifespan. The kernel side comes from a fresh collector dump,
+    so a run also refreshes the stats snapshot.
+    """
+
+    def __init__(
+            self,
+            backend: WGBackend,
+            collector: StatsCollector,
+            session_factory: Callable[[], Session],
+            interval: float,
+            delay: float,
+            lock_path: Path | None = None,
+    ):
+        self.backend = backend
+        self.collector = collector
+        self.session_factory = session_factory
+        self.interval = interval
+        self.delay = delay
+        self.lock_path = lock_path
+        self.runs = 0
+        self.drift_found = 0
+        self.drift_fixed = 0
+        self.added = 0
+        self.changed = 0
+        self.removed = 0
+        self.errors = 0
+        self.last_run_at: float | None = None
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+        self._lock = asyncio.Lock()
+        self._requested = False
+        self._pending: asyncio.Task | None = None
+        self._lock_file: TextIO | None = None
+
+    def _load_desired(self) -> dict[str, WGPeerSpec]:
+        """ only peers of the interface this backend manages, other interfaces are reconciled on their own """
+        stmt = select(
+            Peer.public_key, Peer.address, Peer.preshared_key, Peer.persistent_keepalive
+        ).join(WGInterface, Peer.interface_id == WGInterface.id).where(
+            Peer.enabled == True,  # noqa: E712
+            WGInterface.interface == self.backend.interface,
+        )
+        with self.session_factory() as session:
+            return {
+                row.public_key: WGPeerSpec.from_peer(row)
+                for row in session.execute(stmt.execution_options(yield_per = STREAM_BATCH))
+            }
+
+    async def plan(self) -> ReconcilePlan:
+        """
+        The interface is dumped before the database is read. A peer another worker commits and applies in
+        between is then missing from the dump and added again, read the other way round it would be removed.
+        """
+        snapshot = await self.collector.refresh()
+        desired = await asyncio.to_thread(self._load_desired)
+        return diff_peers(desired, snapshot.peers)
+
+    async def _apply(self, plan: ReconcilePlan) -> None:
+        if plan.remove:
+            await self.backend.remove_peers(plan.remove)
+        if plan.add:
+            await self.backend.set_peers(plan.add)
+        if plan.change:
+            await self.backend.replace_peers(plan.change)
+
+    async def reconcile(self, dry_run: bool = False) -> ReconcilePlan:
+        async with self._lock:
+            started = time.perf_counter()
+            plan = await self.plan()
+            if dry_run:
+                return plan
+            self.runs += 1
+            self.last_run_at = time.time()
+            if plan.drift:
+                self.drift_found += plan.drift
+                logger.warning(
+                    f"interface drifted from database: {len(plan.add)} missing, "
+                    f"{len(plan.change)} changed, {len(plan.remove)} unknown peers"
+                )
+                try:
+                    await self._apply(plan)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    self.last_duration = time.perf_counter() - started
+                    raise
+                self.drift_fixed += plan.drift
+                self.added += len(plan.add)
+                self.changed += len(plan.change)
+                self.removed += len(plan.remove)
+            self.last_duration = time.perf_counter() - started
+            return plan
+
+    async def _reconcile_later(self) -> None:
+        while self._requested:
+            await asyncio.sleep(self.delay)
+            self._requested = False
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"reconciling wg interface after a mutation failed: {e}")
+
+    def schedule(self) -> None:
+        """ call after a peers change is committed """
+        self._requested = True
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.get_running_loop().create_task(self._reconcile_later())
+
+    def _take_leadership(self) -> bool:
+        """ the periodic runs of every worker would only repeat each other, the one holding the lock file runs """
+        if self.lock_path is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            logger.info(f"this worker runs the periodic wg interface reconciliation, {self.lock_path} is locked")
+        return True
+
+    async def run(self) -> None:
+        """ the other workers keep trying, one of them takes over when the leader exits """
+        if not self.interval:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._take_leadership():
+                continue
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"scheduled wg interface reconciliation failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "drift_found": self.drift_found,
+            "drift_fixed": self.drift_fixed,
+            "added": self.added,
+            "changed": self.changed,
+            "removed": self.removed,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+@lru_cache
+def get_reconciler() -> Reconciler:
+    return Reconciler(
+        backend = get_wg_backend(),
+        collector = get_stats_collector(),
+        session_factory = ReadSessionFactory,
+        interval = settings.WG_RECONCILE_INTERVAL,
+        delay = settings.WG_RECONCILE_DELAY,
+        lock_path = settings.tmp_dir_path / f"{settings.PROJECT_NAME}.reconcile.lock",
+    )
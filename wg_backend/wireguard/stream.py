@@ -0,0 +1,168 @@
+import asyncio
+import json
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Mapping
+
+from wg_backend.core.settings import get_settings
+from wg_backend.schemas.Peer import StdoutRxTxPlusLhaPeer
+from wg_backend.wireguard.collector import StatsCollector, StatsSnapshot, get_stats_collector
+from wg_backend.wireguard.rates import RateTracker, get_rate_tracker
+
+settings = get_settings()
+
+
+def sse_event(event: str, event_id: int, data: str) -> str:
+    return f"event: {event}\nid: {event_id}\ndata: {data}\n\n"
+
+
+@dataclass(slots = True)
+class Tick:
+    """ what changed between two collector snapshots, each changed peer is encoded once for every subscriber """
+    generation: int
+    taken_at: float
+    changed: Mapping[str, str]
+    removed: tuple[str, ...]
+    _event: str | None = None
+
+    def event(self, public_keys: frozenset[str] | None) -> str | None:
+        """ the delta event a subscriber following `public_keys` (None for all peers) gets, None when empty """
+        if public_keys is None:
+            if self._event is None:
+                self._event = self._encode(list(self.changed.values()), list(self.removed))
+            return self._event
+        changed = [data for public_key, data in self.changed.items() if public_key in public_keys]
+        removed = [public_key for public_key in self.removed if public_key in public_keys]
+        if not changed and not removed:
+            return None
+        return self._encode(changed, removed)
+
+    def _encode(self, changed: list[str], removed: list[str]) -> str:
+        data = (
+            f'{{"generation":{self.generation},"taken_at":{self.taken_at},'
+            f'"changed":[{",".join(changed)}],"removed":{json.dumps(removed)}}}'
+        )
+        return sse_event("delta", self.generation, data)
+
+
+@dataclass(slots = True, eq = False)
+class Subscriber:
+    public_keys: frozenset[str] | None
+    queue: asyncio.Queue
+    """ times the queue overflowed and the subscriber got a full snapshot instead of the deltas it missed """
+    resyncs: int = field(default = 0)
+    """ a full snapshot is queued, the ticks until the subscriber reads it are already part of it """
+    resync_pending: bool = field(default = False)
+
+
+class StatsBroadcaster:
+    """
+    Live interface stats for any number of subscribers out of the collector ticks, no extra interface dump.
+
+    A subscriber gets a full snapshot first, then one delta per tick with the peers whose dump changed and
+    the peers that left the interface. Every subscriber has a bounded queue, a subscriber falling behind
+    (the client reads slower than the ticks come) has its queued deltas dropped and gets one full snapshot
+    of the latest state instead, the collector never waits for a subscriber.
+    """
+
+    def __init__(self, collector: StatsCollector, rates: RateTracker, queue_size: int, keepalive: float):
+        self.collector = collector
+        self.rates = rates
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.ticks = 0
+        self.resyncs = 0
+        self._subscribers: set[Subscriber] = set()
+        """ deltas are taken against the snapshot published right before, from the moment the listener is added """
+        self._previous: StatsSnapshot | None = collector.snapshot
+
+    def _encode_peer(self, snapshot: StatsSnapshot, public_key: str) -> str:
+        dump_peer = snapshot.peers[public_key]
+        peer = StdoutRxTxPlusLhaPeer.from_wg_dump(dump_peer, self.rates.get(public_key))
+        return peer.model_dump_json(exclude_none = True)
+
+    def observe(self, snapshot: StatsSnapshot) -> None:
+        """ collector listener, registered after the rate tracker so the rates of the tick are current """
+        previous, self._previous = self._previous, snapshot
+        if not self._subscribers or previous is None:
+            return
+        tick = Tick(
+            generation = snapshot.generation,
+            taken_at = snapshot.taken_at,
+            changed = {
+                public_key: self._encode_peer(snapshot, public_key)
+                for public_key, dump_peer in snapshot.peers.items()
+                if previous.peers.get(public_key) != dump_peer
+            },
+            removed = tuple(public_key for public_key in previous.peers if public_key not in snapshot.peers),
+        )
+        self.ticks += 1
+        for subscriber in self._subscribers:
+            if subscriber.resync_pending:
+                continue
+            try:
+                subscriber.queue.put_nowait(tick)
+            except asyncio.QueueFull:
+                """ None asks for a full snapshot of whatever is latest when the subscriber catches up """
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+                subscriber.resync_pending = True
+                subscriber.resyncs += 1
+                self.resyncs += 1
+
+    def snapshot_event(self, snapshot: StatsSnapshot, public_keys: frozenset[str] | None) -> str:
+        peers = [
+            self._encode_peer(snapshot, public_key)
+            for public_key in snapshot.peers
+            if public_keys is None or public_key in public_keys
+        ]
+        data = f'{{"generation":{snapshot.generation},"taken_at":{snapshot.taken_at},"peers":[{",".join(peers)}]}}'
+        return sse_event("snapshot", snapshot.generation, data)
+
+    async def stream(self, public_keys: frozenset[str] | None = None) -> AsyncIterator[str]:
+        """ server sent events of the peers in `public_keys` (all of them for None), until the client leaves """
+        subscriber = Subscriber(public_keys = public_keys, queue = asyncio.Queue(self.queue_size))
+        """ subscribed before the first snapshot is read, no tick falls between the two """
+        self._subscribers.add(subscriber)
+        try:
+            snapshot = await self.collector.get_snapshot()
+            generation = snapshot.generation
+            yield self.snapshot_event(snapshot, public_keys)
+            while True:
+                try:
+                    tick = await asyncio.wait_for(subscriber.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if tick is None:
+                    subscriber.resync_pending = False
+                    snapshot = self.collector.snapshot
+                    generation = snapshot.generation
+                    yield self.snapshot_event(snapshot, public_keys)
+                    continue
+                if tick.generation <= generation:
+                    continue
+                generation = tick.generation
+                event = tick.event(public_keys)
+                if event is not None:
+                    yield event
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "ticks": self.ticks, "resyncs": self.resyncs}
+
+
+@lru_cache
+def get_stats_broadcaster() -> StatsBroadcaster:
+    rates = get_rate_tracker()
+    collector = get_stats_collector()
+    broadcaster = StatsBroadcaster(
+        collector = collector,
+        rates = rates,
+        queue_size = settings.WG_STREAM_QUEUE_SIZE,
+        keepalive = settings.WG_STREAM_KEEPALIVE,
+    )
+    collector.add_listener(broadcaster.observe)
+    return broadcaster
@@ -0,0 +1,214 @@
+import asyncio
+import fcntl
+import logging
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Mapping, TextIO
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from wg_backend.core.settings import get_settings
+from wg_backend.crud import crud_traffic
+from wg_backend.db.session import WriteSessionFactory
+from wg_backend.models.peer import Peer
+from wg_backend.wireguard.collector import StatsCollector, StatsSnapshot, get_stats_collector
+
+settings = get_settings()
+logging.basicConfig(level = settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+""" seconds between two rollup and retention passes """
+ROLLUP_INTERVAL = 60.0
+""" points a traffic query returns at most when it doesn't ask for a step """
+MAX_POINTS = 1000
+
+
+def counter_delta(previous: int, current: int) -> int:
+    """ kernel counters restart from zero with the interface, the bytes counted since the restart are all we know """
+    return current - previous if current >= previous else current
+
+
+class TrafficRecorder:
+    """
+    Turns the cumulative counters of the collector snapshots into the traffic history of every peer.
+
+    Each snapshot adds the bytes since the previous one to an in memory raw bucket of `raw_step` seconds.
+    Closed buckets are written to `peertraffic`, rolled up into 1 min, 1 h and 1 day rows and every resolution
+    is pruned after its retention. Only the worker holding the lock file writes, the others follow the
+    counters too and take over when it exits.
+    """
+
+    def __init__(
+            self,
+            collector: StatsCollector,
+            session_factory: Callable[[], Session],
+            lock_path: Path,
+            raw_step: int,
+            retention: Mapping[int, int],
+    ):
+        self.collector = collector
+        self.session_factory = session_factory
+        self.lock_path = Path(lock_path)
+        self.raw_step = raw_step
+        self.retention = retention
+        self.samples_written = 0
+        self.rollups = 0
+        self.pruned = 0
+        self.last_rollup_at: float | None = None
+        self._counters: dict[str, tuple[int, int]] = {}
+        self._buckets: dict[tuple[str, int], list[int]] = {}
+        self._lock_file: TextIO | None = None
+
+    @property
+    def levels(self) -> tuple[int, ...]:
+        """ stored resolutions in seconds, each one is rolled up from the previous """
+        return tuple(sorted({MINUTE, HOUR, DAY} | ({self.raw_step} if self.raw_step else set())))
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None
+
+    def observe(self, snapshot: StatsSnapshot) -> None:
+        """ collector listener """
+        bucket = int(snapshot.taken_at) // self.raw_step * self.raw_step
+        counters = {}
+        for public_key, peer in snapshot.peers.items():
+            counters[public_key] = current = (peer.transfer_rx, peer.transfer_tx)
+            previous = self._counters.get(public_key)
+            if previous is None:
+                continue
+            rx = counter_delta(previous[0], current[0])
+            tx = counter_delta(previous[1], current[1])
+            if rx or tx:
+                sums = self._buckets.setdefault((public_key, bucket), [0, 0])
+                sums[0] += rx
+                sums[1] += tx
+        self._counters = counters
+
+    def _take_leadership(self) -> bool:
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            logger.info(f"this worker records the traffic history, {self.lock_path} is locked")
+        return True
+
+    def write(self, buckets: Mapping[tuple[str, int], list[int]]) -> int:
+        """ blocking, stores closed raw buckets, returns the number of rows written """
+        with self.session_factory() as session:
+            public_keys = {public_key for public_key, _ in buckets}
+            peer_ids = dict(
+                session.execute(select(Peer.public_key, Peer.id).where(Peer.public_key.in_(public_keys))).all()
+            )
+            samples = [
+                {"peer_id": peer_ids[public_key], "step": self.raw_step, "bucket": bucket, "rx": rx, "tx": tx}
+                for (public_key, bucket), (rx, tx) in buckets.items()
+                if public_key in peer_ids
+            ]
+            if samples:
+                crud_traffic.add_samples(session, samples = samples)
+                session.commit()
+        self.samples_written += len(samples)
+        return len(samples)
+
+    def rollup(self, now: float) -> None:
+        """ blocking, recomputes the buckets touched since the last pass and applies the retention """
+        with self.session_factory() as session:
+            for source, step in zip(self.levels, self.levels[1:]):
+                start = crud_traffic.last_bucket(session, step = step)
+                if start is None:
+                    start = crud_traffic.first_bucket(session, step = source)
+                    if start is None:
+                        continue
+                    start = start // step * step
+                """ the current bucket is still filling, it is recomputed by the next passes """
+                end = (int(now) // step + 1) * step
+                crud_traffic.rollup(session, source = source, step = step, start = start, end = end)
+            for level in self.levels:
+                self.pruned += crud_traffic.prune(session, step = level, before = int(now) - self.retention[level])
+            session.commit()
+        self.rollups += 1
+        self.last_rollup_at = time.time()
+
+    async def flush(self) -> int:
+        now = time.time()
+        closed = {key: self._buckets.pop(key) for key in list(self._buckets) if key[1] + self.raw_step <= now}
+        if not closed or not self._take_leadership():
+            return 0
+        try:
+            return await asyncio.to_thread(self.write, closed)
+        except Exception:
+            """ the buckets go back, the next pass writes them together with the ones closed by then """
+            for key, (rx, tx) in closed.items():
+                sums = self._buckets.setdefault(key, [0, 0])
+                sums[0] += rx
+                sums[1] += tx
+            raise
+
+    async def run(self) -> None:
+        if not self.raw_step:
+            return
+        self.collector.add_listener(self.observe)
+        next_rollup = time.time()
+        try:
+            while True:
+                await asyncio.sleep(self.raw_step)
+                try:
+                    await self.flush()
+                    if self.is_leader and time.time() >= next_rollup:
+                        next_rollup = time.time() + ROLLUP_INTERVAL
+                        await asyncio.to_thread(self.rollup, time.time())
+                except Exception as e:
+                    logger.error(f"recording traffic history failed: {e}")
+        finally:
+            self.collector.remove_listener(self.observe)
+
+    def resolve_step(self, start: int, end: int, step: int | None) -> tuple[int, int] | None:
+        """
+        (stored resolution, step) answering a query, the coarsest resolution `step` is a multiple of, it has the
+        fewest rows to read. Without a step, the finest one giving at most MAX_POINTS points and covering `start`.
+        """
+        now = int(time.time())
+        if step is None:
+            for level in self.levels:
+                if (end - start) / level <= MAX_POINTS and now - self.retention[level] <= start:
+                    return level, level
+            return self.levels[-1], self.levels[-1]
+        levels = [level for level in self.levels if level <= step and step % level == 0]
+        if not levels:
+            return None
+        return levels[-1], step
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.is_leader,
+            "open_buckets": len(self._buckets),
+            "samples_written": self.samples_written,
+            "rollups": self.rollups,
+            "pruned": self.pruned,
+            "last_rollup_at": self.last_rollup_at,
+        }
+
+
+@lru_cache
+def get_traffic_recorder() -> TrafficRecorder:
+    return TrafficRecorder(
+        collector = get_stats_collector(),
+        session_factory = WriteSessionFactory,
+        lock_path = settings.tmp_dir_path / f"{settings.PROJECT_NAME}.traffic.lock",
+        raw_step = settings.WG_TRAFFIC_RAW_STEP,
+        retention = {
+            settings.WG_TRAFFIC_RAW_STEP: settings.WG_TRAFFIC_RETENTION_RAW,
+            MINUTE: settings.WG_TRAFFIC_RETENTION_MINUTE,
+            HOUR: settings.WG_TRAFFIC_RETENTION_HOUR,
+            DAY: settings.WG_TRAFFIC_RETENTION_DAY,
+        },
+    )